@@ -1,13 +1,371 @@
 """
 Flask Application
 """
-from flask import Flask, jsonify, request
+from dataclasses import fields
+from functools import wraps
+from flask import Blueprint, Flask, g, jsonify, make_response, request, stream_with_context
 from models import Experience, Education, Skill, Project
-from utils import check_phone_number, correct_spelling, get_suggestion, load_data
+from operations import (BATCH_OPERATIONS, SECTION_MODELS, USER_FIELDS, apply_operation,
+                        build_item, check_operations, check_technologies, parse_import_record,
+                        parse_operation, parse_user_operation)
+import settings
+from store import SECTIONS, MemoryStore, to_record
+from sqlite_store import SQLiteStore
+from ndjson import IMPORT_CHUNK_SIZE, MIMETYPE as NDJSON_MIMETYPE, export_records, read_records
+from response_cache import FastJSONProvider, get_compressor, get_response_cache
+from resumes import get_resumes
+from metrics import (CONTENT_TYPE as METRICS_CONTENT_TYPE, ROUTE_KEY, MetricsMiddleware,
+                     get_metrics, render_metrics)
+from request_profiler import SORT_KEYS as PROFILE_SORT_KEYS, TOKEN_HEADER as PROFILE_TOKEN_HEADER
+from request_profiler import get_profiler, install as install_profiling
+from utils import check_phone_number, get_suggestion, get_suggestions, load_data, warm_up
+from spelling import (SPELLCHECK_FIELDS, check_spelling, check_spelling_batch, get_spell_engine,
+                      spellcheck_resume)
+from suggestions import (PROMPT_TEMPLATES, JobQueueFull, get_suggestion_cache,
+                         get_suggestion_jobs)
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
+# Profiling is only installed when it is enabled; the metrics include its cost
+app.wsgi_app = MetricsMiddleware(install_profiling(app.wsgi_app))
+# Routes of one resume, served for the default resume and each hosted one
+resume_routes = Blueprint('resume', __name__)
+
+MAX_PAGE_LIMIT = 1000
+# Headers kept with a cached response body
+CACHED_HEADERS = ('X-Next-Cursor',)
+
+def open_store():
+    """
+    Opens the resume store. RESUME_BACKEND=sqlite keeps the resume in the
+    database at RESUME_DB_PATH. The default memory backend journals edits
+    to RESUME_DATA_DIR when it is set; otherwise they only live in memory.
+    """
+    seed = load_data('data/resume.json')
+    if settings.getenv("RESUME_BACKEND", "memory") == "sqlite":
+        return SQLiteStore.open(settings.getenv("RESUME_DB_PATH", "data/resume.db"), seed)
+    data_dir = settings.getenv("RESUME_DATA_DIR")
+    if not data_dir:
+        return MemoryStore(seed)
+    compact_records = int(settings.getenv("RESUME_COMPACT_RECORDS", "10000"))
+    return MemoryStore.open(data_dir, seed, compact_records=compact_records)
+
+
+store = open_store()
+
+if settings.getenv("WARM_UP"):
+    warm_up()
+
+
+def current_store():
+    '''
+    Returns the store of the resume the request addresses: a hosted resume
+    under /resumes/<resume_id>/, otherwise the default one
+    '''
+    resume_store = g.get('resume_store')
+    return store if resume_store is None else resume_store
+
+
+def cache_section(section):
+    '''
+    Names a section of the addressed resume in the response cache
+    '''
+    return g.get('resume_id'), section
+
+
+@app.before_request
+def track_request():
+    '''
+    Labels the request with the route it matched for the metrics, and
+    counts it in flight
+    '''
+    if request.url_rule is not None:
+        request.environ[ROUTE_KEY] = request.url_rule.rule
+        get_metrics().started(request.method, request.url_rule.rule)
+
+
+@resume_routes.url_value_preprocessor
+def pull_resume_id(_endpoint, values):
+    '''
+    Takes the resume id out of the URL, so the views don't see it
+    '''
+    g.resume_id = values.pop('resume_id', None) if values else None
+
+
+@resume_routes.before_request
+def acquire_resume():
+    '''
+    Loads the hosted resume the request addresses into the working set
+    '''
+    if g.resume_id is None:
+        return None
+    g.resume_store = get_resumes().acquire(g.resume_id)
+    if g.resume_store is None:
+        return jsonify({"error": "Resume not found"}), 404
+    return None
+
+
+@app.teardown_request
+def release_resume(_error):
+    '''
+    Hands the hosted resume back, unless a streamed response still uses it
+    '''
+    if g.get('resume_store') is not None and not g.get('resume_streamed'):
+        get_resumes().release(g.resume_id)
+
+
+def stream_ndjson(lines, compress=False):
+    '''
+    Streams NDJSON lines from a generator that runs in the request context,
+    gzipped as they go with `compress` when the client accepts gzip.
+    The stream outlives the request, so it is what hands a hosted resume
+    back, once the response is closed.
+    '''
+    body = stream_with_context(lines)
+    gzipped = compress and get_compressor().level > 0 and request.accept_encodings['gzip'] > 0
+    if gzipped:
+        body = get_compressor().compress_stream(body)
+    response = app.response_class(body, mimetype=NDJSON_MIMETYPE)
+    if compress:
+        response.vary.add('Accept-Encoding')
+    if gzipped:
+        response.headers['Content-Encoding'] = 'gzip'
+    if g.get('resume_store') is not None:
+        g.resume_streamed = True
+        response.call_on_close(lambda resume_id=g.resume_id: get_resumes().release(resume_id))
+    return response
+
+
+def parse_id(item_id):
+    '''
+    Validates an id taken from the query string
+    '''
+    if item_id is None:
+        raise ValueError("Missing id")
+
+    if not item_id.isdigit():
+        raise ValueError("Invalid id")
+
+    return int(item_id)
+
+
+def handle_item(section, model):
+    '''
+    Handles GET, HEAD, PUT and DELETE requests for the single item of a
+    section addressed by ?id=
+    '''
+    if request.method not in ('GET', 'HEAD', 'PUT', 'DELETE'):
+        return (jsonify({"error": f"{request.method} is not allowed with ?id="}), 405,
+                {"Allow": "GET, HEAD, PUT, DELETE"})
+    try:
+        item_id = parse_id(request.args.get('id'))
+    except ValueError as error:
+        return jsonify({"error": str(error)}), 400
+    if request.method in ('GET', 'HEAD'):
+        item = current_store().get(section, item_id)
+        response = (jsonify(item), 200) if item is not None else None
+    elif request.method == 'PUT':
+        try:
+            item = build_item(model, request.get_json())
+        except ValueError as error:
+            return jsonify({"error": str(error)}), 400
+        found = current_store().set_item(section, item_id, item)
+        response = (jsonify(to_record(item)), 200) if found else None
+    else:  # DELETE, the only method left
+        response = (jsonify({}), 204) if current_store().delete(section, item_id) else None
+
+    if response is None:
+        return jsonify({"error": f"{model.__name__} not found"}), 404
+    return response
+
+def parse_page(names):
+    '''
+    Reads the ?cursor=, ?limit= and ?fields= arguments of a collection GET.
+    `names` are the fields an item of the collection may be projected to.
+    '''
+    cursor = request.args.get('cursor')
+    if cursor is not None:
+        if not cursor.isdigit():
+            raise ValueError("Invalid cursor")
+        cursor = int(cursor)
+
+    limit = request.args.get('limit')
+    if limit is not None:
+        if not limit.isdigit() or not 1 <= int(limit) <= MAX_PAGE_LIMIT:
+            raise ValueError(f"limit must be between 1 and {MAX_PAGE_LIMIT}")
+        limit = int(limit)
+
+    selected = request.args.get('fields')
+    if selected is not None:
+        selected = selected.split(',')
+        invalid_fields = [name for name in selected if name not in names]
+        if invalid_fields:
+            raise ValueError(f"Invalid fields: {', '.join(invalid_fields)}")
+    return cursor, limit, selected
+
+
+def get_collection(fetch, names, build_body):
+    '''
+    Serves one page of a collection. `fetch(after, limit)` returns the
+    (id, item) entries of the page and `build_body` turns them into the
+    response body. When more items follow, the cursor of the next page is
+    sent in the X-Next-Cursor header.
+    '''
+    try:
+        cursor, limit, selected = parse_page(names)
+    except ValueError as error:
+        return jsonify({"error": str(error)}), 400
+
+    # Ask for one extra item to learn whether there is a next page
+    try:
+        entries = fetch(cursor, None if limit is None else limit + 1)
+    except KeyError:
+        return jsonify({"error": "Invalid cursor"}), 400
+    next_cursor = None
+    if limit is not None and len(entries) > limit:
+        entries = entries[:limit]
+        next_cursor = str(entries[-1][0])
+
+    if selected is not None:
+        entries = [(item_id, {name: item[name] for name in selected if name in item})
+                   for item_id, item in entries]
+
+    response = jsonify(build_body(entries))
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response, 200
+
+
+def get_section(section, model, key):
+    '''
+    Serves a page of a section as {key: [items], "ids": [ids]}
+    '''
+    return get_collection(
+        lambda after, limit: current_store().entries(section, after, limit),
+        {field.name for field in fields(model)},
+        lambda entries: {key: [item for _, item in entries],
+                         "ids": [item_id for item_id, _ in entries]})
+
+
+def cached_view(section, etag, view, args, kwargs):
+    '''
+    Serves a GET from the response cache while the section is still at
+    etag, otherwise runs the view and caches what it encoded
+    '''
+    cache = get_response_cache()
+    section = cache_section(section)
+    view_key = tuple(sorted(request.args.items(multi=True)))
+    entry = cache.get(section, view_key, etag)
+    # Lets compress_response() find and keep the gzipped body in the cache
+    g.cached_view = (section, view_key, etag)
+    if entry is not None:
+        body, headers = entry
+        return app.response_class(body, mimetype=app.json.mimetype, headers=headers)
+
+    response = make_response(view(*args, **kwargs))
+    if response.status_code == 200 and response.is_json:
+        cache.set(section, view_key, etag, response.get_data(),
+                  {name: value for name, value in response.headers if name in CACHED_HEADERS})
+    return response
+
+
+@app.after_request
+def compress_response(response):
+    '''
+    Gzips bodies above the size threshold when the client accepts gzip.
+    The compressed body of a cached section view is kept with it and reused
+    until the section changes.
+    '''
+    compressor = get_compressor()
+    if (response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers):
+        return response
+    body = response.get_data()
+    if not compressor.wants(body):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    if request.accept_encodings['gzip'] <= 0:
+        return response
+
+    view = g.get('cached_view')
+    compressed = get_response_cache().variant(*view, 'gzip') if view else None
+    if compressed is None:
+        compressed = compressor.compress(body)
+        if view:
+            get_response_cache().set_variant(*view, 'gzip', compressed)
+    else:
+        compressor.record_reuse(body, compressed)
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+def conditional(section):
+    '''
+    Makes a route's requests conditional on the version of a section.
+    GET responses carry the section's ETag and a matching If-None-Match gets
+    a 304 without the data being read; other GETs are served through the
+    response cache. A write with If-Match only goes ahead while the section
+    is still at that version, otherwise it gets a 412; its response carries
+    the ETag of the version it produced.
+    '''
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method in ('GET', 'HEAD'):
+                # Read the version first: a write racing the view then makes
+                # the tag older than the data, never newer
+                etag = current_store().etag(section)
+                if request.if_none_match.contains(etag):
+                    response = make_response('', 304)
+                else:
+                    response = cached_view(section, etag, view, args, kwargs)
+                    if response.status_code != 200:
+                        return response
+                response.set_etag(etag)
+                return response
+
+            if not request.if_match:
+                response = make_response(view(*args, **kwargs))
+            else:
+                with current_store().transaction():
+                    if not request.if_match.contains(current_store().etag(section)):
+                        return jsonify({"error": "Precondition failed"}), 412
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code < 300:
+                        response.set_etag(current_store().etag(section))
+            if response.status_code < 300:
+                get_response_cache().invalidate(cache_section(section))
+            return response
+        return wrapper
+    return decorator
+
+
+def patch_section(section):
+    '''
+    Applies a list of move, insert, update and remove operations to the
+    entries of a section, so a change costs as much as its operations
+    rather than the whole list. Every operation is checked before any is
+    applied, inside a store transaction that keeps other writers out.
+    '''
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({"error": "Body must be a JSON object"}), 400
+    operations = body.get('operations')
+    resume_store = current_store()
+    with resume_store.transaction():
+        removed = set()
+        try:
+            checked = check_operations(operations, lambda operation: parse_operation(
+                resume_store, section, operation, removed))
+        except ValueError as error:
+            return jsonify({"error": str(error)}), 400
+        except LookupError as error:
+            return jsonify({"error": str(error)}), 404
+        results = [apply_operation(resume_store, section, operation) for operation in checked]
+    return jsonify({"results": results}), 200
 
-data = load_data('data/resume.json')
 
 @app.route("/test")
 def hello_world():
@@ -17,19 +375,34 @@ def hello_world():
     return jsonify({"message": "Hello, World!"})
 
 
-@app.route("/resume/user", methods=["GET", "POST", "PUT"])
-def user_route():
+@resume_routes.route("/user", methods=["GET", "POST", "PUT"])
+@conditional("user")
+def user_route():  # pylint: disable=too-many-return-statements
     """
     Handle GET, POST, and PUT requests for user data.
-    GET: Retrieve all users
+    GET: Retrieve a page of users, or the user with the ?email= address
     POST: Create a new user
     PUT: Update an existing user
     """
+    def get_users(email):
+        '''
+        Get all users, or the one with this email address
+        '''
+        if email is None:
+            resume_store = current_store()
+            return get_collection(lambda after, limit: resume_store.entries('user', after, limit),
+                                  USER_FIELDS,
+                                  lambda entries: [user for _, user in entries])
+        user = current_store().find_user(email)
+        if user is None:
+            return jsonify({"error": "User not found !"}), 404
+        return jsonify(user), 200
+
     if request.method == 'GET':
-        return jsonify(data['user']), 200
+        return get_users(request.args.get('email'))
 
     body = request.get_json()
-    if not body or not all(key in body for key in ['name', 'phone_number', 'email_address']):
+    if not body or not all(key in body for key in USER_FIELDS):
         return jsonify({"error": "Missing required fields"}), 400
 
     name = body['name']
@@ -38,36 +411,38 @@ def user_route():
     if not check_phone_number(phone_number):
         return jsonify({"error": "Incorrect phone number"}), 400
 
+    user = {
+        'name': name,
+        'phone_number': phone_number,
+        'email_address': email
+    }
     if request.method == 'POST':
-        # Create a new user and add it to the data
-        new_user = {
-            'name': name,
-            'phone_number': phone_number,
-            'email_address': email
-        }
-        data['user'].append(new_user)
-        return jsonify(new_user), 201
+        # Create a new user unless the email address is already taken
+        if current_store().add_user(user):
+            return jsonify(user), 201
+        return jsonify({"error": "User already exists"}), 409
 
     # Handle PUT request
-    for i, current_user in enumerate(data['user']):
-        if current_user['email_address'] == email:
-            data['user'][i] = {
-                'name': name,
-                'phone_number': phone_number,
-                'email_address': email
-            }
-            return jsonify(data['user'][i]), 200
+    if current_store().put_user(user):
+        return jsonify(user), 200
 
     return jsonify({"error": "User not found !"}), 404
 
 
-@app.route("/resume/experience", methods=["GET", "POST", 'PUT'])
+@resume_routes.route("/experience", methods=["GET", "POST", 'PUT', 'DELETE', 'PATCH'])
+@conditional("experience")
 def experience():
     """
     Handle experience requests
     """
+    if request.method == 'PATCH':
+        return patch_section('experience')
+
+    if 'id' in request.args or request.method == 'DELETE':
+        return handle_item('experience', Experience)
+
     if request.method == "GET":
-        return jsonify({"experience": list(data["experience"])}), 200
+        return get_section("experience", Experience, "experience")
 
     if request.method == "POST":
         new_experience = request.json
@@ -80,8 +455,7 @@ def experience():
             new_exp["description"],
             new_exp["logo"],
         )
-        data["experience"].append(experience_instance)
-        return jsonify({"id": len(data["experience"]) - 1}), 201
+        return jsonify({"id": current_store().append("experience", experience_instance)}), 201
 
     if request.method == 'PUT':
         body = request.get_json()
@@ -97,20 +471,26 @@ def experience():
             new_experience_order.append(
                 Experience(title, company, start_date, end_date, description, logo)
             )
-        data['experience'] = new_experience_order
-        return_data = list(data['experience'])
+        current_store().replace('experience', new_experience_order)
+        return_data = current_store().list('experience')
         return jsonify(return_data), 200
 
     return jsonify({"error": "Unsupported request method !"}), 405
 
-@app.route('/resume/education', methods=['GET', 'POST', 'PUT'])
+@resume_routes.route('/education', methods=['GET', 'POST', 'PUT', 'DELETE', 'PATCH'])
+@conditional("education")
 def education():
     """
     Handles education requests
     """
+    if request.method == 'PATCH':
+        return patch_section('education')
+
+    if 'id' in request.args or request.method == 'DELETE':
+        return handle_item('education', Education)
 
     if request.method == "GET":
-        return jsonify({"education": list(data["education"])}), 200
+        return get_section("education", Education, "education")
 
     if request.method == "POST":
         new_education = request.json
@@ -123,8 +503,7 @@ def education():
             new_edu["grade"],
             new_edu["logo"],
         )
-        data["education"].append(education_instance)
-        return jsonify({"id": len(data["education"]) - 1}), 201
+        return jsonify({"id": current_store().append("education", education_instance)}), 201
 
     if request.method == 'PUT':
         body = request.get_json()
@@ -137,22 +516,28 @@ def education():
             grade = edu['grade']
             logo = edu['logo']
             new_education_order.append(Education(course, school, start_date, end_date, grade, logo))
-        data['education'] = new_education_order
+        current_store().replace('education', new_education_order)
 
-        return_data = list(data['education'])
+        return_data = current_store().list('education')
         return jsonify(return_data), 200
     return jsonify({}), 405
 
 
 
-@app.route("/resume/skill", methods=["GET", "POST", 'PUT'])
+@resume_routes.route("/skill", methods=["GET", "POST", 'PUT', 'DELETE', 'PATCH'])
+@conditional("skill")
 def skill():
     """
     Handles Skill requests
     """
+    if request.method == 'PATCH':
+        return patch_section('skill')
+
+    if 'id' in request.args or request.method == 'DELETE':
+        return handle_item('skill', Skill)
 
     if request.method == "GET":
-        return jsonify({"skills": list(data["skill"])}), 200
+        return get_section("skill", Skill, "skills")
 
     if request.method == "POST":
         new_skill = request.json
@@ -162,8 +547,7 @@ def skill():
             skill_data["proficiency"],
             skill_data["logo"]
         )
-        data["skill"].append(skill_instance)
-        return jsonify({"id": len(data["skill"]) - 1}), 201
+        return jsonify({"id": current_store().append("skill", skill_instance)}), 201
 
     if request.method == 'PUT':
         body = request.get_json()
@@ -173,15 +557,16 @@ def skill():
             proficiency = _skill['proficiency']
             logo = _skill['logo']
             new_skill_order.append(Skill(name, proficiency, logo))
-        data['skill'] = new_skill_order
+        current_store().replace('skill', new_skill_order)
 
-        return_data = [item.__dict__ for item in data['skill']]
+        return_data = current_store().list('skill')
         return jsonify(return_data), 200
 
     return jsonify({}), 405
 
 
-@app.route('/resume/project', methods=['GET', 'POST', 'PUT', 'DELETE'])
+@resume_routes.route('/project', methods=['GET', 'POST', 'PUT', 'DELETE'])
+@conditional("project")
 def project():
     '''
     Handles Project requests
@@ -190,15 +575,8 @@ def project():
         '''
         Validates the id
         '''
-        if project_id is None:
-            raise ValueError("Missing id")
-
-        if not project_id.isdigit():
-            raise ValueError("Invalid id")
-
-        # Check if the id is within the range of the project list
-        int_id = int(project_id)
-        if int_id < 0 or int_id >= len(data['project']):
+        int_id = parse_id(project_id)
+        if current_store().get('project', int_id) is None:
             raise ValueError("Project not found")
 
         return int_id
@@ -210,14 +588,22 @@ def project():
         if project_id is not None:
             try:
                 project_id = validate_id(project_id)
-                return jsonify(data['project'][project_id]), 200
+                return jsonify(current_store().get('project', project_id)), 200
             except ValueError as error:
                 return jsonify({"error": str(error)}), 400
 
-        return jsonify([
-                        {**project, "id": str(index)}
-                        for index, project in enumerate(data['project'])
-                ]), 200
+        technology = request.args.get('technology')
+        if technology is not None:
+            def fetch(after, limit):
+                return current_store().projects_with_technology(technology, after, limit)
+        else:
+            def fetch(after, limit):
+                return current_store().entries('project', after, limit)
+        return get_collection(fetch, {field.name for field in fields(Project)},
+                              lambda entries: [
+                                  {**project, "id": str(item_id)}
+                                  for item_id, project in entries
+                              ])
 
     def add_project(body):
         '''
@@ -228,6 +614,10 @@ def project():
 
         if missing_fields:
             return jsonify({"error": f"Missing fields: {', '.join(missing_fields)}"}), 400
+        try:
+            check_technologies(Project, body)
+        except ValueError as error:
+            return jsonify({"error": str(error)}), 400
 
         new_project = Project(
                             body['title'],
@@ -235,9 +625,9 @@ def project():
                             body['technologies'],
                             body['link']
                         )
-        data['project'].append(new_project)
+        project_id = current_store().append('project', new_project)
 
-        return jsonify({**new_project.__dict__, "id": str(len(data['project']) - 1)}), 201
+        return jsonify({**to_record(new_project), "id": str(project_id)}), 201
 
     def edit_project(project_id, body):
         '''
@@ -248,13 +638,17 @@ def project():
         except ValueError as error:
             return jsonify({"error": str(error)}), 400
 
-        for key, value in body.items():
-            if hasattr(data['project'][project_id], key):
-                setattr(data['project'][project_id], key, value)
-            else:
+        project_fields = {field.name for field in fields(Project)}
+        for key in body:
+            if key not in project_fields:
                 return jsonify({"error": f"Invalid field: {key}"}), 400
+        try:
+            check_technologies(Project, body)
+        except ValueError as error:
+            return jsonify({"error": str(error)}), 400
+        current_store().update('project', project_id, body)
 
-        return jsonify({**data['project'][project_id].__dict__, "id": str(project_id)}), 200
+        return jsonify({**current_store().get('project', project_id), "id": str(project_id)}), 200
 
     def delete_project(project_id):
         '''
@@ -265,7 +659,7 @@ def project():
         except ValueError as error:
             return jsonify({"error": str(error)}), 400
 
-        del data['project'][project_id]
+        current_store().delete('project', project_id)
         return jsonify({}), 204
 
     if request.method == 'GET':
@@ -290,21 +684,217 @@ def project():
     return jsonify({"error": "Unsupported request method"}), 405
 
 
+@resume_routes.route("/batch", methods=["POST"])
+def batch():
+    """
+    Applies an ordered list of operations across sections all-or-nothing.
+    Each operation names its section: users take add and put, the other
+    sections append, insert, move, update, remove and replace. Every
+    operation is checked before any is applied, and they are applied in
+    one store transaction, so readers of the store and its journal see
+    either all of them or none.
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({"error": "Body must be a JSON object"}), 400
+    operations = body.get('operations')
+    resume_store = current_store()
+    removed, emails = {}, {}
+
+    def parse(operation):
+        section = operation.get('section') if isinstance(operation, dict) else None
+        if section == 'user':
+            return section, parse_user_operation(resume_store, operation, emails)
+        if section not in SECTION_MODELS:
+            raise ValueError(f"Unknown section: {section}")
+        return section, parse_operation(resume_store, section, operation,
+                                        removed.setdefault(section, set()), BATCH_OPERATIONS)
+
+    with resume_store.transaction():
+        try:
+            checked = check_operations(operations, parse)
+        except ValueError as error:
+            return jsonify({"error": str(error)}), 400
+        except LookupError as error:
+            return jsonify({"error": str(error)}), 404
+        results = [{"section": section, **apply_operation(resume_store, section, operation)}
+                   for section, operation in checked]
+
+    for section in {section for section, _ in checked}:
+        get_response_cache().invalidate(cache_section(section))
+    return jsonify({"results": results}), 200
+
+
+@resume_routes.route("/export", methods=["GET"])
+def export_resume():
+    """
+    Streams every item of the resume as NDJSON, one
+    {"section", "id", "item"} record per line, reading the store a page at
+    a time. The stream is gzipped when the client accepts it.
+    """
+    def generate():
+        for record in export_records(current_store()):
+            yield app.json.encode(record) + b"\n"
+
+    return stream_ndjson(generate(), compress=True)
+
+
+def apply_chunk(chunk):
+    '''
+    Applies the operations of an import chunk in one store transaction
+    '''
+    resume_store = current_store()
+    with resume_store.transaction():
+        for section, operation in chunk:
+            apply_operation(resume_store, section, operation)
+    for section in {section for section, _ in chunk}:
+        get_response_cache().invalidate(cache_section(section))
+
+
+@resume_routes.route("/import", methods=["POST"])
+def import_resume():
+    """
+    Imports NDJSON records in the format of /resume/export, reading and
+    validating the request body a line at a time. Items get new ids. Valid
+    records are added in chunks, each in one transaction. With
+    ?replace=true every section is emptied in the transaction of the first
+    chunk, so a body without any valid record leaves the resume as it was.
+
+    The response is NDJSON too: an {"line", "error"} line for each record
+    that was rejected, a {"progress"} line after each chunk and a final
+    {"done"} line with the counts.
+    """
+    replace = request.args.get('replace') == 'true'
+
+    def generate():
+        counts = {"records": 0, "imported": 0, "errors": 0}
+        # Applied with the first chunk; until then records are checked
+        # against the empty resume they will be added to
+        emptying = ([(section, {'op': 'replace', 'items': []}) for section in SECTIONS]
+                    if replace else [])
+        emptied = MemoryStore({})
+
+        chunk, emails = [], {}
+        for number, record, error in read_records(request.stream):
+            counts["records"] += 1
+            if error is None:
+                try:
+                    chunk.append(parse_import_record(emptied if emptying else current_store(),
+                                                     record, emails))
+                except (ValueError, LookupError) as failure:
+                    error = str(failure)
+            if error is not None:
+                counts["errors"] += 1
+                yield app.json.encode({"line": number, "error": error}) + b"\n"
+
+            if len(chunk) >= IMPORT_CHUNK_SIZE:
+                apply_chunk(emptying + chunk)
+                counts["imported"] += len(chunk)
+                chunk, emails, emptying = [], {}, []
+                yield app.json.encode({"progress": counts}) + b"\n"
+
+        if chunk:
+            apply_chunk(emptying + chunk)
+            counts["imported"] += len(chunk)
+        yield app.json.encode({"done": counts}) + b"\n"
+
+    return stream_ndjson(generate())
+
+
+@app.route("/resumes", methods=["GET", "POST"])
+def resumes():
+    """
+    GET: Lists the ids of the hosted resumes
+    POST: Creates an empty hosted resume, with the "id" given in the body
+    or a new one. Its routes are those of /resume under
+    /resumes/<resume_id>/resume.
+    """
+    if request.method == 'GET':
+        return jsonify({"resumes": get_resumes().ids()}), 200
+
+    try:
+        resume_id = get_resumes().create((request.get_json(silent=True) or {}).get('id'))
+    except ValueError as error:
+        return jsonify({"error": str(error)}), 400
+    if resume_id is None:
+        return jsonify({"error": "Resume already exists"}), 409
+    return jsonify({"id": resume_id}), 201
+
+
+@app.route("/resumes/stats", methods=["GET"])
+def resumes_stats():
+    """
+    Returns the size of the working set of hosted resumes, its load and
+    eviction counters and the load latency in seconds
+    """
+    return jsonify(get_resumes().stats()), 200
+
+
+@app.route("/resume/cache/stats", methods=["GET"])
+def response_cache_stats():
+    """
+    Returns the response cache counters
+    """
+    return jsonify(get_response_cache().stats()), 200
+
+
+@app.route("/resume/compression/stats", methods=["GET"])
+def compression_stats():
+    """
+    Returns the bytes saved by gzip and the CPU time spent on it
+    """
+    return jsonify(get_compressor().stats()), 200
+
+
 @app.route("/resume/spellcheck", methods=["POST"])
 def spellcheck():
     """
-    Corrects the spelling of a text
+    Corrects the spelling of a text, or of a list of texts in order
     """
-    body = request.get_json()
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({"error": "Body must be a JSON object"}), 400
+    if "texts" in body:
+        texts = body["texts"]
+        if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+            return jsonify({"error": "texts must be a list of strings"}), 400
+
+        with get_metrics().timed("spellcheck"):
+            results = check_spelling_batch(texts)
+        return jsonify({"results": [
+            {"before": text, "after": corrected_text, "corrections": corrections}
+            for text, (corrected_text, corrections) in zip(texts, results)
+        ]}), 200
+
     try:
         text = body["text"]
-        corrected_text = correct_spelling(text)
+        with get_metrics().timed("spellcheck"):
+            corrected_text, corrections = check_spelling(text)
 
-        return jsonify({"before": text, "after": corrected_text}), 200
+        return jsonify({"before": text, "after": corrected_text, "corrections": corrections}), 200
     except KeyError:
         return jsonify({"error": "Missing text parameter"}), 400
 
 
+@resume_routes.route("/spellcheck/all", methods=["GET"])
+def spellcheck_all():
+    """
+    Spellchecks every free-text field of the resume and returns patches
+    """
+    data = {section: dict(current_store().entries(section)) for section in SPELLCHECK_FIELDS}
+    with get_metrics().timed("spellcheck"):
+        patches = spellcheck_resume(data)
+    return jsonify(patches), 200
+
+
+@app.route("/resume/spellcheck/stats", methods=["GET"])
+def spellcheck_stats():
+    """
+    Returns the spellcheck correction cache counters
+    """
+    return jsonify(get_spell_engine().stats()), 200
+
+
 @app.route("/suggestion", methods=["POST"])
 def get_description_suggestion():
     """
@@ -314,5 +904,88 @@ def get_description_suggestion():
     description_type = request.json.get("type")
     if not description or not description_type:
         return jsonify({"error": "Description and type are required"}), 400
+    if description_type not in PROMPT_TEMPLATES:
+        return jsonify({"error": f"Unsupported type: {description_type}"}), 400
+
+    if request.json.get("async"):
+        try:
+            job_id = get_suggestion_jobs().submit(get_suggestion, description, description_type)
+        except JobQueueFull:
+            return jsonify({"error": "Too many pending suggestions, try again later"}), 503
+        return jsonify({"job_id": job_id, "status": "pending"}), 202
+
     suggestion = get_suggestion(description, description_type)
     return jsonify({"suggestion": suggestion}), 200
+
+
+@app.route("/suggestion/batch", methods=["POST"])
+def get_description_suggestions():
+    """
+    Handles suggestion requests for several descriptions in one call
+    """
+    items = (request.get_json() or {}).get("items")
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "items must be a non-empty list"}), 400
+    return jsonify({"results": get_suggestions(items)}), 200
+
+
+@app.route("/suggestion/<job_id>", methods=["GET"])
+def get_suggestion_job(job_id):
+    """
+    Returns the status of an asynchronous suggestion job
+    """
+    job = get_suggestion_jobs().get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job["status"] in ("pending", "running"):
+        return jsonify(job), 202
+    return jsonify(job), 200
+
+
+@app.route("/suggestion/stats", methods=["GET"])
+def suggestion_stats():
+    """
+    Returns the suggestion cache and job queue counters
+    """
+    return jsonify({
+        "cache": get_suggestion_cache().stats(),
+        "jobs": get_suggestion_jobs().stats(),
+    }), 200
+
+
+@app.route("/profiles/hot", methods=["GET"])
+def hot_functions():
+    """
+    Returns the functions that took the most time across the newest
+    request profiles, by own time or, with ?sort=cumtime, including callees
+    """
+    profiler = get_profiler()
+    if not profiler.enabled:
+        return jsonify({"error": "Profiling is disabled"}), 404
+    if profiler.token is not None and not profiler.authorized(
+            request.headers.get(PROFILE_TOKEN_HEADER)):
+        return jsonify({"error": "Missing or wrong profiling token"}), 403
+
+    sort = request.args.get('sort', 'tottime')
+    if sort not in PROFILE_SORT_KEYS:
+        return jsonify({"error": f"sort must be one of {', '.join(PROFILE_SORT_KEYS)}"}), 400
+    counts = {}
+    for name, default in (('samples', 50), ('limit', 20)):
+        value = request.args.get(name, str(default))
+        if not value.isdigit() or int(value) < 1:
+            return jsonify({"error": f"{name} must be a positive integer"}), 400
+        counts[name] = int(value)
+    return jsonify(profiler.hot_functions(sort=sort, **counts)), 200
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """
+    Returns the request and stage metrics of every server process in the
+    Prometheus text format
+    """
+    return render_metrics(), 200, {"Content-Type": METRICS_CONTENT_TYPE}
+
+
+app.register_blueprint(resume_routes, url_prefix='/resume')
+app.register_blueprint(resume_routes, name='resumes', url_prefix='/resumes/<resume_id>/resume')
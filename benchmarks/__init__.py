@@ -0,0 +1,4 @@
+"""
+Offline benchmarks for the Resume API. Run each one with
+``python -m benchmarks.<name>``.
+"""
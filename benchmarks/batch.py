@@ -0,0 +1,81 @@
+"""
+Compares saving a whole resume form with one request per section against
+one POST /resume/batch, for each storage backend.
+
+    python -m benchmarks.batch
+"""
+import os
+import tempfile
+import time
+
+import app as resume_app
+from sqlite_store import SQLiteStore
+from store import MemoryStore
+
+USER = {"name": "Jackie Stewart", "phone_number": "+4478322678",
+        "email_address": "jack@resume.com"}
+EXPERIENCE = [{"title": f"Engineer {index}", "company": "A Cool Company",
+               "start_date": "October 2022", "end_date": "Present",
+               "description": "Writing Python code", "logo": "example-logo.png"}
+              for index in range(3)]
+EDUCATION = [{"course": f"Course {index}", "school": "University of Tech",
+              "start_date": "September 2019", "end_date": "July 2022", "grade": "80%",
+              "logo": "example-logo.png"} for index in range(2)]
+SKILLS = [{"name": f"Skill {index}", "proficiency": "2 years", "logo": "example-logo.png"}
+          for index in range(5)]
+SEED = {"user": [USER], "experience": EXPERIENCE, "education": EDUCATION, "skill": SKILLS,
+        "project": [{"title": "My Title", "description": "A sample project",
+                     "technologies": ["Python"], "link": "https://example.com"}]}
+
+
+def save_per_section(client):
+    """Saves the form the way the frontend does today"""
+    client.put("/resume/user", json=USER)
+    client.put("/resume/experience", json={"data": EXPERIENCE})
+    client.put("/resume/education", json={"data": EDUCATION})
+    client.put("/resume/skill", json={"data": SKILLS})
+    client.put("/resume/project", query_string={"id": 0}, json={"title": "New Title"})
+
+
+def save_batch(client):
+    """Saves the same form in one request"""
+    response = client.post("/resume/batch", json={"operations": [
+        {"section": "user", "op": "put", "item": USER},
+        {"section": "experience", "op": "replace", "items": EXPERIENCE},
+        {"section": "education", "op": "replace", "items": EDUCATION},
+        {"section": "skill", "op": "replace", "items": SKILLS},
+        {"section": "project", "op": "update", "id": 0, "fields": {"title": "New Title"}},
+    ]})
+    assert response.status_code == 200, response.json
+
+
+def throughput(save, number):
+    """Returns forms saved per second"""
+    client = resume_app.app.test_client()
+    save(client)
+    start = time.perf_counter()
+    for _ in range(number):
+        save(client)
+    return number / (time.perf_counter() - start)
+
+
+def run(number=300):
+    """Prints forms saved per second for each backend and approach"""
+    backends = {
+        "memory": lambda directory: MemoryStore(SEED),
+        "memory + journal": lambda directory: MemoryStore.open(directory, SEED),
+        "sqlite": lambda directory: SQLiteStore.open(os.path.join(directory, "resume.db"), SEED),
+    }
+    print(f"{'backend':<18} {'per-section/s':>14} {'batch/s':>10} {'speed-up':>10}")
+    for label, open_store in backends.items():
+        rates = []
+        for save in (save_per_section, save_batch):
+            with tempfile.TemporaryDirectory() as directory:
+                resume_app.store = open_store(directory)
+                rates.append(throughput(save, number))
+                resume_app.store.close()
+        print(f"{label:<18} {rates[0]:14.1f} {rates[1]:10.1f} {rates[1] / rates[0]:9.1f}x")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,55 @@
+"""
+Measures what the request metrics cost: the bookkeeping of one request on
+its own, and GETs of a small section with and without the metrics
+middleware. Without it the before-request hook still counts requests in
+flight, so the end-to-end difference is a lower bound.
+
+    python -m benchmarks.metrics
+"""
+import time
+
+import app as resume_app
+from metrics import Metrics
+
+
+def bookkeeping(number):
+    """Returns the seconds spent recording one request, on average"""
+    metrics = Metrics()
+    start = time.perf_counter()
+    for index in range(number):
+        metrics.started("GET", "/resume/experience")
+        metrics.finished(("GET", "/resume/experience", "200", True), index * 1e-6, None, 512)
+    return (time.perf_counter() - start) / number
+
+
+def requests_per_second(client, number):
+    """Returns GETs per second, reading and closing every response"""
+    start = time.perf_counter()
+    for _ in range(number):
+        client.get("/resume/skill", buffered=True)
+    return number / (time.perf_counter() - start)
+
+
+def run(number=5_000, rounds=3):
+    """Prints the cost of the bookkeeping and the best end-to-end throughput"""
+    print(f"bookkeeping per request: {bookkeeping(number * 20) * 1e6:.2f} us")
+    client = resume_app.app.test_client()
+    middleware = resume_app.app.wsgi_app
+    requests_per_second(client, number // 5)
+    best = {"off": 0.0, "on": 0.0}
+    # Rounds alternate, so drift in the machine's speed hits both alike
+    for _ in range(rounds):
+        try:
+            resume_app.app.wsgi_app = middleware.wsgi_app
+            best["off"] = max(best["off"], requests_per_second(client, number))
+        finally:
+            resume_app.app.wsgi_app = middleware
+        best["on"] = max(best["on"], requests_per_second(client, number))
+    print(f"{'metrics':<10} {'req/s':>10} {'us/request':>12}")
+    for label, rate in best.items():
+        print(f"{label:<10} {rate:10.1f} {1e6 / rate:12.1f}")
+    print(f"overhead: {(1 / best['on'] - 1 / best['off']) * 1e6:.1f} us per request")
+
+
+if __name__ == "__main__":
+    run()
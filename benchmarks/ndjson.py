@@ -0,0 +1,70 @@
+"""
+Measures the working memory of the streaming NDJSON export and import
+against collection size, next to a whole-section GET and PUT of the same
+data. Working memory is the traced peak less what is still allocated
+afterwards, so the imported items the store keeps are not counted.
+
+    python -m benchmarks.ndjson
+"""
+import io
+import json
+import tracemalloc
+
+import app as resume_app
+from benchmarks.pagination import EXPERIENCE
+from store import MemoryStore
+
+
+def peak_kib(func):
+    """Runs func and returns the working memory it traced, in KiB"""
+    tracemalloc.start()
+    func()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (peak - retained) / 1024
+
+
+def consume(response):
+    """Reads a response body chunk by chunk, the way a server sends it"""
+    for _ in response.response:
+        pass
+    response.close()
+
+
+def post(client, path, body, method="POST", **kwargs):
+    """Sends body as a stream, so the request isn't buffered up front"""
+    return client.open(path, method=method, input_stream=io.BytesIO(body),
+                       content_length=len(body), buffered=False, **kwargs)
+
+
+def measure(client, size):
+    """Returns the working memory in KiB of each path for `size` experiences"""
+    items = [dict(EXPERIENCE) for _ in range(size)]
+    lines = "\n".join(json.dumps({"section": "experience", "item": item})
+                      for item in items).encode("utf-8")
+    whole = json.dumps({"data": items}).encode("utf-8")
+    resume_app.store = MemoryStore({"experience": items})
+    try:
+        return (
+            peak_kib(lambda: consume(client.get("/resume/export", buffered=False))),
+            peak_kib(lambda: client.get("/resume/experience")),
+            peak_kib(lambda: consume(post(client, "/resume/import", lines,
+                                          query_string={"replace": "true"}))),
+            peak_kib(lambda: post(client, "/resume/experience", whole, method="PUT",
+                                  content_type="application/json")),
+        )
+    finally:
+        resume_app.store.close()
+
+
+def run(sizes=(1_000, 10_000, 50_000)):
+    """Prints working memory per collection size for each path"""
+    client = resume_app.app.test_client()
+    print(f"{'items':>8} {'export KiB':>12} {'GET KiB':>12} {'import KiB':>12} {'PUT KiB':>12}")
+    for size in sizes:
+        export, whole_get, imported, whole_put = measure(client, size)
+        print(f"{size:>8} {export:12.1f} {whole_get:12.1f} {imported:12.1f} {whole_put:12.1f}")
+
+
+if __name__ == "__main__":
+    run()
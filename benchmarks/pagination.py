@@ -0,0 +1,58 @@
+"""
+Measures GET /resume/experience latency and peak memory against collection
+size, for the whole collection, a page and a projected page.
+
+    python -m benchmarks.pagination
+"""
+import time
+import tracemalloc
+
+import app as resume_app
+from store import MemoryStore
+
+EXPERIENCE = {
+    "title": "Software Developer",
+    "company": "A Cool Company",
+    "start_date": "October 2022",
+    "end_date": "Present",
+    "description": "Writing Python code and reviewing pull requests for the team",
+    "logo": "example-logo.png",
+}
+QUERIES = {
+    "whole collection": {},
+    "limit=50": {"limit": 50},
+    "limit=50&fields=title": {"limit": 50, "fields": "title"},
+    "limit=50, last page": {"limit": 50, "cursor": None},
+}
+
+
+def measure(client, query, number):
+    """Returns the mean latency in ms and the peak traced memory in KiB of a GET"""
+    start = time.perf_counter()
+    for _ in range(number):
+        client.get("/resume/experience", query_string=query)
+    latency = (time.perf_counter() - start) / number
+
+    tracemalloc.start()
+    client.get("/resume/experience", query_string=query)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return latency * 1e3, peak / 1024
+
+
+def run(sizes=(100, 1_000, 10_000, 100_000), number=20):
+    """Prints latency and peak memory per collection size and query"""
+    client = resume_app.app.test_client()
+    print(f"{'items':>8} {'query':<24} {'latency ms':>12} {'peak KiB':>12}")
+    for size in sizes:
+        resume_app.store = MemoryStore({"experience": [dict(EXPERIENCE) for _ in range(size)]})
+        for label, query in QUERIES.items():
+            if "cursor" in query:
+                query = {**query, "cursor": size - 51}
+            latency, peak = measure(client, query, number)
+            print(f"{size:>8} {label:<24} {latency:12.3f} {peak:12.1f}")
+        resume_app.store.close()
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,98 @@
+"""
+Benchmarks the journaled store: write throughput with group commit, and
+recovery time as the journal grows.
+
+    python -m benchmarks.persistence
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+
+from store import MemoryStore
+
+SEED = {"user": [], "experience": [], "education": [], "skill": [], "project": []}
+
+
+def make_experience(index):
+    """Returns a synthetic experience record"""
+    return {
+        "title": f"Engineer {index}",
+        "company": "A Cool Company",
+        "start_date": "October 2022",
+        "end_date": "Present",
+        "description": "Writing Python code and reviewing pull requests " * 4,
+        "logo": "example-logo.png",
+    }
+
+
+def journal_throughput(threads, writes_per_thread):
+    """Returns durable writes per second with `threads` concurrent writers"""
+    with tempfile.TemporaryDirectory() as directory:
+        store = MemoryStore.open(directory, SEED, compact_records=10 ** 9)
+
+        def writer(offset):
+            for index in range(writes_per_thread):
+                store.append("experience", make_experience(offset + index))
+
+        workers = [threading.Thread(target=writer, args=(number * writes_per_thread,))
+                   for number in range(threads)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+        store.close()
+    return threads * writes_per_thread / elapsed
+
+
+def rewrite_throughput(writes, section_size):
+    """Returns writes per second when every write rewrites and fsyncs the whole file"""
+    data = {**SEED, "experience": [make_experience(index) for index in range(section_size)]}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "resume.json")
+        start = time.perf_counter()
+        for index in range(writes):
+            data["experience"].append(make_experience(index))
+            with open(path, "w", encoding="utf-8") as file:
+                json.dump(data, file)
+                file.flush()
+                os.fsync(file.fileno())
+        elapsed = time.perf_counter() - start
+    return writes / elapsed
+
+
+def recovery_time(records):
+    """Returns the seconds needed to reopen a store with `records` journal records"""
+    with tempfile.TemporaryDirectory() as directory:
+        store = MemoryStore.open(directory, SEED, compact_records=10 ** 9)
+        store.journal.wait = lambda seq: None  # build the journal quickly; fsync once at close
+        for index in range(records):
+            store.append("experience", make_experience(index))
+        store.close()
+
+        start = time.perf_counter()
+        store = MemoryStore.open(directory, SEED)
+        elapsed = time.perf_counter() - start
+        assert store.count("experience") == records
+        store.close()
+    return elapsed
+
+
+def run():
+    """Prints throughput and recovery results"""
+    print("durable writes per second")
+    for threads in (1, 4, 16):
+        print(f"  journal, {threads:>2} writers: "
+              f"{journal_throughput(threads, 2000 // threads):10.0f}")
+    print(f"  full-file rewrite, 1000 items: {rewrite_throughput(200, 1000):10.0f}")
+
+    print("recovery time")
+    for records in (10_000, 100_000):
+        print(f"  {records:>7} journal records: {recovery_time(records):8.3f}s")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,66 @@
+"""
+Compares GET /resume/experience served from the encoded response cache
+with encoding on every request, using the standard encoder and orjson,
+and the same with gzip. Reports the bytes gzip saved and the CPU time it
+took.
+
+    python -m benchmarks.responses
+"""
+import time
+
+import app as resume_app
+from benchmarks.pagination import EXPERIENCE
+from response_cache import GzipCompressor, ResponseCache, set_compressor, set_response_cache
+from store import MemoryStore
+
+# encoder, response cache size, Accept-Encoding
+MODES = {
+    "uncached, json": ("json", 0, ""),
+    "uncached, orjson": ("orjson", 0, ""),
+    "cached": ("orjson", 256, ""),
+    "uncached, gzip": ("orjson", 0, "gzip"),
+    "cached, gzip": ("orjson", 256, "gzip"),
+}
+
+
+def measure(client, number, accept_encoding):
+    """Returns the mean latency of a GET in ms and the size of its body"""
+    headers = {"Accept-Encoding": accept_encoding}
+    size = len(client.get("/resume/experience", headers=headers).data)
+    start = time.perf_counter()
+    for _ in range(number):
+        client.get("/resume/experience", headers=headers)
+    return (time.perf_counter() - start) / number * 1e3, size
+
+
+def run(sizes=(10, 100, 1_000, 10_000), number=50):
+    """Prints the latency of each mode per section size"""
+    client = resume_app.app.test_client()
+    encoder = resume_app.app.json.encoder
+    print(f"{'items':>8} {'mode':<18} {'latency ms':>12} {'speed-up':>10} {'bytes':>10} "
+          f"{'gzip saved':>12} {'gzip cpu ms':>12}")
+    try:
+        for size in sizes:
+            resume_app.store = MemoryStore({"experience": [dict(EXPERIENCE)
+                                                           for _ in range(size)]})
+            baseline = None
+            for label, (name, cache_size, accept_encoding) in MODES.items():
+                resume_app.app.json.encoder = name
+                set_response_cache(ResponseCache(max_entries=cache_size))
+                compressor = GzipCompressor()
+                set_compressor(compressor)
+                latency, body_size = measure(client, number, accept_encoding)
+                baseline = baseline or latency
+                stats = compressor.stats()
+                print(f"{size:>8} {label:<18} {latency:12.3f} {baseline / latency:9.1f}x "
+                      f"{body_size:>10} {stats['bytes_saved']:>12} "
+                      f"{stats['cpu_seconds'] * 1e3:12.2f}")
+            resume_app.store.close()
+    finally:
+        resume_app.app.json.encoder = encoder
+        set_response_cache(None)
+        set_compressor(None)
+
+
+if __name__ == "__main__":
+    run()
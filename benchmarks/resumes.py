@@ -0,0 +1,68 @@
+"""
+Serves GETs spread over many hosted resumes, a few of them popular, with
+working set budgets that hold a part or all of them. Reports throughput,
+how often a resume had to be loaded and how long loading took, for each
+storage backend.
+
+    python -m benchmarks.resumes
+"""
+import random
+import tempfile
+import time
+
+import app as resume_app
+from benchmarks.pagination import EXPERIENCE
+from resumes import JournalResumes, ResumeRegistry, SQLiteResumes, set_resumes
+
+BACKENDS = {"memory + journal": JournalResumes, "sqlite": SQLiteResumes}
+
+
+def seed(storage, count, size):
+    """Creates `count` resumes of `size` experiences; returns their footprint"""
+    registry = ResumeRegistry(storage)
+    for index in range(count):
+        resume_id = registry.create(f"resume-{index}")
+        registry.acquire(resume_id).replace("experience", [dict(EXPERIENCE)] * size)
+        registry.release(resume_id)
+    footprint = registry.stats()["bytes"]
+    registry.close()
+    return footprint
+
+
+def serve(client, count, number):
+    """Returns GETs per second, with resumes picked by a Zipf-like popularity"""
+    picker = random.Random(0)
+    weights = [1 / (rank + 1) for rank in range(count)]
+    resume_ids = picker.choices(range(count), weights, k=number)
+    start = time.perf_counter()
+    for index in resume_ids:
+        client.get(f"/resumes/resume-{index}/resume/experience")
+    return number / (time.perf_counter() - start)
+
+
+def run(count=200, size=50, number=5_000, fractions=(0.1, 0.5, 1.0)):
+    """Prints throughput and load counters per backend and budget"""
+    client = resume_app.app.test_client()
+    print(f"{'backend':<18} {'budget':>8} {'req/s':>10} {'hit rate':>9} {'loads':>7} "
+          f"{'resident':>9} {'load p50 ms':>12} {'load p99 ms':>12}")
+    try:
+        for label, storage_class in BACKENDS.items():
+            with tempfile.TemporaryDirectory() as directory:
+                footprint = seed(storage_class(directory), count, size)
+                for fraction in fractions:
+                    registry = ResumeRegistry(storage_class(directory),
+                                              max_bytes=int(footprint * fraction))
+                    set_resumes(registry)
+                    rate = serve(client, count, number)
+                    stats = registry.stats()
+                    registry.close()
+                    print(f"{label:<18} {fraction:>7.0%} {rate:10.1f} "
+                          f"{stats['hits'] / number:>9.1%} {stats['loads']:>7} "
+                          f"{stats['resident']:>9} {stats['load_p50'] * 1e3:12.2f} "
+                          f"{stats['load_p99'] * 1e3:12.2f}")
+    finally:
+        set_resumes(None)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,114 @@
+"""
+Load-tests the development server (`flask run`) against the production
+entry point (`python -m serve`) over HTTP. Client processes keep
+connections open and send a mix of section reads and writes for a fixed
+time; each server gets a fresh copy of the resume.
+
+    python -m benchmarks.serving
+"""
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from suggestions import percentile
+
+HOST = "127.0.0.1"
+PORT = 5099
+SKILL = {"name": "Go", "proficiency": "1 year", "logo": "go.png"}
+
+
+@contextmanager
+def serving(command, env):
+    """Runs a server while the block runs, once it answers"""
+    with subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL,
+                          stderr=subprocess.DEVNULL) as server:
+        try:
+            deadline = time.monotonic() + 30
+            while True:
+                try:
+                    connection = http.client.HTTPConnection(HOST, PORT, timeout=1)
+                    connection.request("GET", "/test")
+                    if connection.getresponse().status == 200:
+                        break
+                except OSError:
+                    if time.monotonic() > deadline:
+                        raise RuntimeError(f"{' '.join(command)} did not start") from None
+                    time.sleep(0.1)
+            yield
+        finally:
+            server.terminate()
+
+
+def client(seconds, write_ratio, seed):
+    """Sends requests for `seconds`; returns their latencies and the errors"""
+    rng = random.Random(seed)
+    connection = http.client.HTTPConnection(HOST, PORT, timeout=10)
+    body = json.dumps({"data": [SKILL]})
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        start_time = time.perf_counter()
+        try:
+            if rng.random() < write_ratio:
+                connection.request("POST", "/resume/skill", body,
+                                   {"Content-Type": "application/json"})
+            else:
+                connection.request("GET", "/resume/experience")
+            response = connection.getresponse()
+            response.read()
+            errors += response.status >= 400
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            connection.close()
+            connection = http.client.HTTPConnection(HOST, PORT, timeout=10)
+            continue
+        latencies.append(time.perf_counter() - start_time)
+    return latencies, errors
+
+
+def load(clients, seconds, write_ratio):
+    """Returns requests per second, p50 and p99 latency and the error count"""
+    with ProcessPoolExecutor(clients) as pool:
+        results = list(pool.map(client, [seconds] * clients, [write_ratio] * clients,
+                                range(clients)))
+    latencies = [latency for result, _ in results for latency in result]
+    return (len(latencies) / seconds, percentile(latencies, 0.5), percentile(latencies, 0.99),
+            sum(errors for _, errors in results))
+
+
+def measure(backend, command, extra_env, load_args):
+    """Load-tests a server started on a fresh store of `backend`"""
+    with tempfile.TemporaryDirectory() as directory:
+        env = {**os.environ, **extra_env, "RESUME_BACKEND": backend,
+               "RESUME_DB_PATH": os.path.join(directory, "resume.db"),
+               "RESUMES_DIR": os.path.join(directory, "resumes")}
+        with serving(command, env):
+            return load(*load_args)
+
+
+def run(clients=8, seconds=5.0, write_ratio=0.1, workers=(2, 4)):
+    """Prints throughput and latency for each server"""
+    flask_run = [sys.executable, "-m", "flask", "--app", "app", "run", "--port", str(PORT)]
+    servers = {"flask run, memory": ("memory", flask_run, {}),
+               "flask run, sqlite": ("sqlite", flask_run, {})}
+    for count in workers:
+        servers[f"serve, {count} workers"] = ("sqlite", [sys.executable, "-m", "serve"],
+                                              {"WEB_CONCURRENCY": str(count),
+                                               "WEB_BIND": f"{HOST}:{PORT}"})
+    print(f"{clients} clients, {write_ratio:.0%} writes, {os.cpu_count()} CPUs")
+    print(f"{'server':<22} {'req/s':>10} {'p50 ms':>10} {'p99 ms':>10} {'errors':>8}")
+    for label, (backend, command, extra) in servers.items():
+        rate, p50, p99, errors = measure(backend, command, extra,
+                                         (clients, seconds, write_ratio))
+        print(f"{label:<22} {rate:10.1f} {p50 * 1e3:10.2f} {p99 * 1e3:10.2f} {errors:>8}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,72 @@
+"""
+Compares read throughput of the memory store, whose readers use the last
+published snapshot without locking, with a baseline whose readers take the
+same global lock as its writers. Reader threads list and page a section
+while a writer thread keeps committing transactions of several updates.
+
+    python -m benchmarks.snapshots
+"""
+import threading
+import time
+
+from benchmarks.pagination import EXPERIENCE
+from store import MemoryStore
+
+
+class GlobalLockStore(MemoryStore):
+    """Memory store whose reads wait for the writer lock, like a single global lock"""
+
+    def entries(self, section, after=None, limit=None):
+        with self._lock:
+            return super().entries(section, after, limit)
+
+    def get(self, section, item_id):
+        with self._lock:
+            return super().get(section, item_id)
+
+
+def measure(store, readers, seconds, updates):
+    """Returns reads per second across `readers` threads and commits per second"""
+    stop = threading.Event()
+    counts = [0] * (readers + 1)
+    ids = [item_id for item_id, _ in store.entries("experience")]
+
+    def read(slot):
+        while not stop.is_set():
+            store.entries("experience", limit=20)
+            store.get("experience", ids[slot % len(ids)])
+            counts[slot] += 1
+
+    def write():
+        while not stop.is_set():
+            with store.transaction():
+                for item_id in ids[:updates]:
+                    store.update("experience", item_id, {"title": f"Engineer {counts[-1]}"})
+            counts[-1] += 1
+
+    threads = [threading.Thread(target=read, args=(slot,)) for slot in range(readers)]
+    threads.append(threading.Thread(target=write))
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sum(counts[:-1]) / seconds, counts[-1] / seconds
+
+
+def run(readers=(1, 4, 8), size=1_000, updates=50, seconds=2.0):
+    """Prints read and commit throughput for each store and reader count"""
+    print(f"{'readers':>8} {'store':<12} {'reads/s':>10} {'commits/s':>10} {'speed-up':>10}")
+    for count in readers:
+        baseline = None
+        for label, store_class in (("global lock", GlobalLockStore), ("snapshots", MemoryStore)):
+            store = store_class({"experience": [dict(EXPERIENCE) for _ in range(size)]})
+            reads, commits = measure(store, count, seconds, updates)
+            baseline = baseline or reads
+            print(f"{count:>8} {label:<12} {reads:10.0f} {commits:10.0f} "
+                  f"{reads / baseline:9.1f}x")
+
+
+if __name__ == "__main__":
+    run()
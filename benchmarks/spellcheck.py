@@ -0,0 +1,67 @@
+"""
+Compares the span-based spellcheck rewrite with the previous
+replace-per-typo implementation on multi-kilobyte descriptions.
+
+    python -m benchmarks.spellcheck
+"""
+import random
+import re
+import timeit
+
+from spelling import check_spelling, get_spell_engine
+
+WORDS = (
+    "designed implemented maintained scalable services for customer facing "
+    "applications using python flask and postgres while mentoring engineers "
+    "reviewing code improving reliability and reducing latency across teams"
+).split()
+
+
+def legacy_correct_spelling(text, engine):
+    """The original implementation: one str.replace per misspelled word"""
+    misspelled = engine.unknown(re.findall(r"\w+|[^\w\s]", text))
+    corrected_text = text
+    for word in misspelled:
+        correction = engine.correction(word)
+        if correction:
+            corrected_text = corrected_text.replace(word, correction)
+    return corrected_text
+
+
+def make_typo(rng, word):
+    """Drops one letter from a word"""
+    index = rng.randrange(len(word))
+    return word[:index] + word[index + 1:]
+
+
+def make_description(size, typo_rate=0.1, seed=0):
+    """Builds a description of roughly `size` characters with typos mixed in"""
+    rng = random.Random(seed)
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        if len(word) > 4 and rng.random() < typo_rate:
+            word = make_typo(rng, word)
+        words.append(word + ("." if rng.random() < 0.08 else ""))
+        length += len(words[-1]) + 1
+    return " ".join(words)
+
+
+def run(sizes=(2_000, 8_000, 32_000), repeat=5, number=20):
+    """Prints the best per-call time of both implementations for each size"""
+    engine = get_spell_engine()
+    print(f"{'size':>8} {'legacy ms':>10} {'span ms':>10} {'speedup':>8}")
+    for size in sizes:
+        text = make_description(size)
+        # Warm the correction cache so both sides measure the rewrite only.
+        check_spelling(text, engine)
+        legacy = min(timeit.repeat(lambda t=text: legacy_correct_spelling(t, engine),
+                                   repeat=repeat, number=number)) / number
+        span = min(timeit.repeat(lambda t=text: check_spelling(t, engine),
+                                 repeat=repeat, number=number)) / number
+        print(f"{len(text):>8} {legacy * 1e3:>10.3f} {span * 1e3:>10.3f} {legacy / span:>7.1f}x")
+
+
+if __name__ == "__main__":
+    run()
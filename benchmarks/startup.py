@@ -0,0 +1,58 @@
+"""
+Measures cold start: the time from interpreter start-up to the first
+/test response, with and without the WARM_UP preload.
+
+    python -m benchmarks.startup [--runs N] [--max-seconds S]
+
+With --max-seconds the command exits non-zero when the median cold start
+is slower, so import-time regressions can fail a CI job.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+PROBE = (
+    "import time; start = time.perf_counter(); "
+    "from app import app; "
+    "app.test_client().get('/test'); "
+    "print(time.perf_counter() - start)"
+)
+
+
+def measure(runs, warm_up=False):
+    """Returns the cold start of `runs` fresh interpreters, in seconds"""
+    env = dict(os.environ)
+    env.pop("WARM_UP", None)
+    if warm_up:
+        env["WARM_UP"] = "1"
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    timings = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-c", PROBE], capture_output=True, text=True,
+                                check=True, cwd=root, env=env)
+        timings.append(float(result.stdout.strip().splitlines()[-1]))
+    return timings
+
+
+def main():
+    """Prints the median and spread of both start-up modes"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=None)
+    args = parser.parse_args()
+
+    lazy = measure(args.runs)
+    warm = measure(args.runs, warm_up=True)
+    for label, timings in (("lazy", lazy), ("warm-up", warm)):
+        print(f"{label:>8}: median {statistics.median(timings) * 1e3:8.1f}ms "
+              f"min {min(timings) * 1e3:8.1f}ms max {max(timings) * 1e3:8.1f}ms")
+
+    if args.max_seconds is not None and statistics.median(lazy) > args.max_seconds:
+        print(f"cold start exceeds {args.max_seconds}s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
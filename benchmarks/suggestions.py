@@ -0,0 +1,48 @@
+"""
+Measures /suggestion latency with a cold and a warm suggestion cache,
+using the local stub backend with a simulated generation delay.
+
+    python -m benchmarks.suggestions
+"""
+import random
+import time
+
+from app import app
+from suggestions import StubBackend, SuggestionCache, set_suggestion_backend, set_suggestion_cache
+
+
+def run(requests=400, distinct=50, delay=0.02, seed=0):
+    """Replays a skewed request mix and prints latency and cache counters"""
+    rng = random.Random(seed)
+    descriptions = [f"Built feature number {index} for the payments team"
+                    for index in range(distinct)]
+    workload = [descriptions[min(int(rng.paretovariate(1.2)) - 1, distinct - 1)]
+                for _ in range(requests)]
+
+    backend = StubBackend(delay=delay)
+    cache = SuggestionCache()
+    set_suggestion_backend(backend)
+    set_suggestion_cache(cache)
+    client = app.test_client()
+    try:
+        latencies = []
+        for description in workload:
+            start = time.perf_counter()
+            client.post("/suggestion", json={"description": description, "type": "experience"})
+            latencies.append(time.perf_counter() - start)
+    finally:
+        set_suggestion_backend(None)
+        set_suggestion_cache(None)
+
+    latencies.sort()
+    uncached = requests * delay
+    print(f"requests:        {requests}")
+    print(f"backend calls:   {backend.calls}")
+    print(f"cache counters:  {cache.stats()}")
+    print(f"total time:      {sum(latencies):.2f}s (uncached estimate {uncached:.2f}s)")
+    print(f"p50 latency:     {latencies[len(latencies) // 2] * 1e3:.2f}ms")
+    print(f"p99 latency:     {latencies[int(len(latencies) * 0.99)] * 1e3:.2f}ms")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,277 @@
+"""
+Offline benchmark suite: p50/p99 latency and throughput of each route and
+of the helpers in utils, on a synthetic resume of configurable size, with
+the memory high-water mark of each. Suggestions come from the local stub
+backend. Results are written as JSON; given a saved baseline, metrics that
+got worse by more than the threshold are flagged and the command exits
+non-zero.
+
+    python -m benchmarks.suite [--size N] [--number N] [--backend memory|sqlite]
+                               [--output FILE] [--baseline FILE] [--threshold F]
+                               [--input FILE]
+
+With --input the results of an earlier run are compared instead of
+running the suite again.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import app as resume_app
+from benchmarks.spellcheck import make_description
+from sqlite_store import SQLiteStore
+from store import MemoryStore
+from suggestions import (StubBackend, SuggestionCache, percentile, set_suggestion_backend,
+                         set_suggestion_cache)
+from utils import check_phone_number, correct_spelling, load_data
+
+# Metrics compared with a baseline, and whether a higher value is better.
+# p99 is reported but too noisy to flag on.
+COMPARED = {"p50_ms": False, "rps": True, "peak_kib": False}
+TECHNOLOGIES = ("Python", "Flask", "SQLite", "Docker", "Go", "React")
+
+
+def synthetic_resume(size, seed=0):
+    """
+    Returns a resume with `size` experiences, educations, skills and
+    projects and size // 10 + 1 users, whose descriptions contain typos
+    """
+    rng = random.Random(seed)
+    return {
+        "user": [{"name": f"User {index}", "phone_number": f"+44{7_000_000_000 + index}",
+                  "email_address": f"user{index}@example.com"}
+                 for index in range(size // 10 + 1)],
+        "experience": [{"title": f"Engineer {index}", "company": f"Company {index % 50}",
+                        "start_date": "October 2022", "end_date": "Present",
+                        "description": make_description(200, seed=index),
+                        "logo": "example-logo.png"} for index in range(size)],
+        "education": [{"course": f"Course {index}", "school": "University of Tech",
+                       "start_date": "September 2019", "end_date": "July 2022",
+                       "grade": f"{rng.randrange(40, 100)}%", "logo": "example-logo.png"}
+                      for index in range(size)],
+        "skill": [{"name": f"Skill {index}", "proficiency": f"{rng.randrange(1, 10)} years",
+                   "logo": "example-logo.png"} for index in range(size)],
+        "project": [{"title": f"Project {index}", "description": make_description(100, seed=index),
+                     "technologies": rng.sample(TECHNOLOGIES, 2),
+                     "link": f"https://example.com/{index}"} for index in range(size)],
+    }
+
+
+def route_cases(client):
+    """Returns name -> callable making one request, for each benchmarked route"""
+    counter = iter(range(sys.maxsize))
+    skill = {"name": "Go", "proficiency": "1 year", "logo": "go.png"}
+    etag = {}
+
+    def conditional_get():
+        if "experience" not in etag:
+            etag["experience"] = client.get("/resume/experience").headers["ETag"]
+        return client.get("/resume/experience", headers={"If-None-Match": etag["experience"]})
+
+    cases = {
+        "GET /resume/user": lambda: client.get("/resume/user"),
+        "GET /resume/user?email=": lambda: client.get(
+            "/resume/user", query_string={"email": "user0@example.com"}),
+        "GET /resume/experience": lambda: client.get("/resume/experience"),
+        "GET /resume/experience?limit=50": lambda: client.get(
+            "/resume/experience", query_string={"limit": 50}),
+        "GET /resume/experience 304": conditional_get,
+        "GET /resume/education": lambda: client.get("/resume/education"),
+        "GET /resume/skill": lambda: client.get("/resume/skill"),
+        "GET /resume/project?technology=": lambda: client.get(
+            "/resume/project", query_string={"technology": "Python"}),
+        "POST /resume/skill": lambda: client.post("/resume/skill", json={"data": [skill]}),
+        "PUT /resume/project": lambda: client.put(
+            "/resume/project", query_string={"id": 0}, json={"title": f"Title {next(counter)}"}),
+        "PATCH /resume/experience": lambda: client.patch("/resume/experience", json={
+            "operations": [{"op": "update", "id": 0, "fields": {"title": "Lead"}},
+                           {"op": "move", "id": 0, "index": 1}]}),
+        "POST /resume/batch": lambda: client.post("/resume/batch", json={"operations": [
+            {"section": "skill", "op": "append", "item": skill},
+            {"section": "project", "op": "update", "id": 0, "fields": {"title": "Batch"}}]}),
+        "GET /resume/export": lambda: client.get("/resume/export"),
+        "POST /resume/spellcheck": lambda: client.post(
+            "/resume/spellcheck", json={"text": make_description(500, seed=next(counter))}),
+        "GET /resume/spellcheck/all": lambda: client.get("/resume/spellcheck/all"),
+        # A new description every time, so each request reaches the backend
+        "POST /suggestion": lambda: client.post("/suggestion", json={
+            "description": f"Wrote Python code {next(counter)}", "type": "experience"}),
+        "POST /suggestion/batch": lambda: client.post("/suggestion/batch", json={"items": [
+            {"description": f"Wrote Python code {next(counter)}", "type": "experience"}
+            for _ in range(10)]}),
+    }
+    # Reading the body includes the time to stream it
+    return {name: lambda request=request: request().get_data() for name, request in cases.items()}
+
+
+def helper_cases(resume_path):
+    """Returns name -> callable for the helpers in utils"""
+    texts = [make_description(200, seed=seed) for seed in range(100)]
+    counter = iter(range(sys.maxsize))
+    quiet = io.StringIO()
+
+    def load():
+        # load_data reports every load on stdout
+        with contextlib.redirect_stdout(quiet):
+            load_data(resume_path)
+        quiet.seek(0)
+        quiet.truncate()
+
+    return {
+        "correct_spelling": lambda: correct_spelling(texts[next(counter) % len(texts)]),
+        "check_phone_number": lambda: check_phone_number("+447832267812"),
+        "load_data": load,
+    }
+
+
+def time_case(func, number):
+    """Returns the latencies of `number` calls after one warm-up call, in seconds"""
+    func()
+    latencies = []
+    for _ in range(number):
+        start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def peak_kib(func, number):
+    """Returns the most memory traced while making `number` calls, in KiB"""
+    tracemalloc.start()
+    try:
+        for _ in range(number):
+            func()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def open_store(backend, resume, directory):
+    """Returns a fresh store of `backend` holding the synthetic resume"""
+    if backend == "sqlite":
+        path = os.path.join(directory, f"resume-{time.monotonic_ns()}.db")
+        return SQLiteStore.open(path, resume)
+    return MemoryStore(json.loads(json.dumps(resume)))
+
+
+def run_suite(size, number, backend):
+    """Runs every case on a fresh copy of the resume and returns the results"""
+    resume = synthetic_resume(size)
+    client = resume_app.app.test_client()
+    set_suggestion_backend(StubBackend())
+    set_suggestion_cache(SuggestionCache())
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        resume_path = os.path.join(directory, "resume.json")
+        with open(resume_path, "w", encoding="utf-8") as file:
+            json.dump(resume, file)
+        cases = {**route_cases(client), **helper_cases(resume_path)}
+        try:
+            for name, func in cases.items():
+                resume_app.store = open_store(backend, resume, directory)
+                latencies = time_case(func, number)
+                results[name] = {
+                    "p50_ms": percentile(latencies, 0.5) * 1e3,
+                    "p99_ms": percentile(latencies, 0.99) * 1e3,
+                    "rps": len(latencies) / sum(latencies),
+                    "peak_kib": peak_kib(func, max(1, number // 20)),
+                }
+                resume_app.store.close()
+        finally:
+            set_suggestion_backend(None)
+            set_suggestion_cache(None)
+    return results
+
+
+def max_rss_kib():
+    """Returns the process's resident memory high-water mark in KiB, where known"""
+    try:
+        import resource  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux KiB
+    return peak / 1024 if sys.platform == "darwin" else peak
+
+
+def compare(results, baseline, threshold):
+    """
+    Returns (case, metric, baseline value, value, change) for every compared
+    metric that got worse by more than `threshold`, a fraction
+    """
+    regressions = []
+    for name, metrics in results.items():
+        for metric, higher_is_better in COMPARED.items():
+            before = baseline.get(name, {}).get(metric)
+            after = metrics.get(metric)
+            if not before or after is None:
+                continue
+            change = after / before - 1
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append((name, metric, before, after, change))
+    return regressions
+
+
+def report(results):
+    """Prints the results as a table"""
+    print(f"{'case':<34} {'p50 ms':>10} {'p99 ms':>10} {'req/s':>10} {'peak KiB':>10}")
+    for name, metrics in results.items():
+        print(f"{name:<34} {metrics['p50_ms']:10.3f} {metrics['p99_ms']:10.3f} "
+              f"{metrics['rps']:10.1f} {metrics['peak_kib']:10.1f}")
+
+
+def main():
+    """Runs or loads the suite, saves it and compares it with a baseline"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", type=int, default=100)
+    parser.add_argument("--number", type=int, default=200)
+    parser.add_argument("--backend", choices=("memory", "sqlite"), default="memory")
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--baseline", default=None)
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument("--input", default=None)
+    args = parser.parse_args()
+
+    if args.input:
+        with open(args.input, encoding="utf-8") as file:
+            document = json.load(file)
+    else:
+        document = {
+            "meta": {"size": args.size, "number": args.number, "backend": args.backend,
+                     "python": platform.python_version(), "platform": platform.platform(),
+                     "time": time.strftime("%Y-%m-%dT%H:%M:%S%z")},
+            "results": run_suite(args.size, args.number, args.backend),
+        }
+        document["meta"]["max_rss_kib"] = max_rss_kib()
+    report(document["results"])
+    print(f"max RSS: {document['meta']['max_rss_kib']} KiB")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(document, file, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+        for key in ("size", "number", "backend"):
+            if baseline["meta"].get(key) != document["meta"].get(key):
+                print(f"note: the baseline has {key} {baseline['meta'].get(key)}, "
+                      f"this run {document['meta'].get(key)}")
+        regressions = compare(document["results"], baseline["results"], args.threshold)
+        for name, metric, before, after, change in regressions:
+            print(f"REGRESSION {name} {metric}: {before:.3f} -> {after:.3f} ({change:+.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions beyond {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Compares user lookup, update and duplicate detection by email against the
+previous linear scan, on a resume with 100k users.
+
+    python -m benchmarks.users
+"""
+import os
+import random
+import tempfile
+import timeit
+
+from sqlite_store import SQLiteStore
+from store import MemoryStore
+
+
+def make_users(count):
+    """Returns `count` users with distinct email addresses"""
+    return [{"name": f"User {index}", "phone_number": "+441234567890",
+             "email_address": f"user{index}@example.com"} for index in range(count)]
+
+
+def linear_find(users, email):
+    """The previous lookup: scan the user list"""
+    for user in users:
+        if user["email_address"] == email:
+            return user
+    return None
+
+
+def report(label, func, number):
+    """Prints the mean time of one call in microseconds"""
+    seconds = timeit.timeit(func, number=number) / number
+    print(f"  {label:<32} {seconds * 1e6:12.2f} us")
+
+
+def run(count=100_000, number=200, seed=0):
+    """Prints per-operation timings for each approach"""
+    rng = random.Random(seed)
+    users = make_users(count)
+    emails = [user["email_address"] for user in users]
+    missing = "nobody@example.com"
+
+    memory = MemoryStore({"user": [dict(user) for user in users]})
+    print(f"{count} users, in memory")
+    report("linear scan lookup", lambda: linear_find(users, rng.choice(emails)), number)
+    report("linear scan duplicate check", lambda: linear_find(users, missing), number)
+    report("indexed lookup", lambda: memory.find_user(rng.choice(emails)), number * 100)
+    report("indexed update (PUT)", lambda: memory.put_user(dict(rng.choice(users))), number * 100)
+    report("indexed duplicate check (POST)", lambda: memory.add_user(rng.choice(users)),
+           number * 100)
+
+    with tempfile.TemporaryDirectory() as directory:
+        sqlite = SQLiteStore.open(os.path.join(directory, "users.db"), {"user": users})
+        print(f"{count} users, SQLite")
+        report("indexed lookup", lambda: sqlite.find_user(rng.choice(emails)), number * 10)
+        report("indexed update (PUT)", lambda: sqlite.put_user(dict(rng.choice(users))),
+               number * 10)
+        report("indexed duplicate check (POST)", lambda: sqlite.add_user(rng.choice(users)),
+               number * 10)
+        sqlite.close()
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,248 @@
+"""
+Write-ahead journal and snapshots for the resume store
+"""
+import json
+import os
+import re
+import threading
+
+SNAPSHOT_NAME = "snapshot.json"
+SEGMENT_PATTERN = re.compile(r"^journal-(\d+)\.log$")
+
+
+def segment_path(directory, segment):
+    """Returns the path of a journal segment"""
+    return os.path.join(directory, f"journal-{segment:08d}.log")
+
+
+def list_segments(directory):
+    """Returns the journal segment numbers found in directory, oldest first"""
+    segments = []
+    for name in os.listdir(directory):
+        match = SEGMENT_PATTERN.match(name)
+        if match:
+            segments.append(int(match.group(1)))
+    return sorted(segments)
+
+
+def _fsync_directory(directory):
+    """Makes renames and new files in directory durable"""
+    descriptor = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+class Journal:  # pylint: disable=too-many-instance-attributes
+    """
+    Append-only log of store mutations, one JSON record per line.
+
+    Records are numbered with a sequence that keeps growing across segments.
+    write() only buffers a record; wait() blocks until it is on disk. Callers
+    waiting at the same time share one fsync (group commit): whichever finds
+    no sync running flushes everything written so far.
+    """
+
+    def __init__(self, directory, segment, last_seq=0):
+        self.directory = directory
+        self.segment = segment
+        self._file = open(segment_path(directory, segment), "ab")  # pylint: disable=consider-using-with
+        self._condition = threading.Condition()
+        self._written = last_seq
+        self._synced = last_seq
+        self._syncing = False
+        self.records_in_segment = 0
+
+    @property
+    def last_seq(self):
+        """Sequence number of the last record written"""
+        return self._written
+
+    def write(self, record):
+        """Buffers a record and returns its sequence number"""
+        with self._condition:
+            seq = self._written + 1
+            line = json.dumps({"seq": seq, **record}, separators=(",", ":"))
+            self._file.write(line.encode("utf-8") + b"\n")
+            self._written = seq
+            self.records_in_segment += 1
+            return seq
+
+    def wait(self, seq):
+        """Blocks until the record numbered seq has been fsynced"""
+        with self._condition:
+            while self._synced < seq:
+                if self._syncing:
+                    self._condition.wait()
+                    continue
+                self._sync_locked()
+
+    def _sync_locked(self):
+        self._syncing = True
+        target = self._written
+        self._file.flush()
+        descriptor = self._file.fileno()
+        self._condition.release()
+        try:
+            os.fsync(descriptor)
+        finally:
+            self._condition.acquire()
+            self._syncing = False
+            self._synced = max(self._synced, target)
+            self._condition.notify_all()
+
+    def rotate(self):
+        """
+        Syncs and closes the current segment and starts the next one.
+        Returns the number of the segment that was closed.
+        """
+        with self._condition:
+            while self._syncing:
+                self._condition.wait()
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._synced = self._written
+            self._file.close()
+            closed = self.segment
+            self.segment += 1
+            self._file = open(segment_path(self.directory, self.segment), "ab")  # pylint: disable=consider-using-with
+            self.records_in_segment = 0
+            _fsync_directory(self.directory)
+            return closed
+
+    def close(self):
+        """Syncs and closes the journal"""
+        with self._condition:
+            while self._syncing:
+                self._condition.wait()
+            if not self._file.closed:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+            self._synced = self._written
+
+
+def write_snapshot(directory, state, segment, seq):
+    """
+    Atomically replaces the snapshot with `state`, which must already be
+    JSON-serialised. It covers every journal segment up to `segment`.
+    """
+    path = os.path.join(directory, SNAPSHOT_NAME)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        file.write(f'{{"segment":{segment},"seq":{seq},"data":{state}}}')
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+    _fsync_directory(directory)
+
+
+def remove_segments(directory, up_to):
+    """Deletes journal segments already covered by the snapshot"""
+    for segment in list_segments(directory):
+        if segment <= up_to:
+            os.remove(segment_path(directory, segment))
+
+
+def read_journal(directory, after_segment, after_seq):
+    """
+    Yields the records of every segment newer than the snapshot, in order.
+    A torn final line, left by a crash mid-write, ends the replay.
+    """
+    for segment in list_segments(directory):
+        if segment <= after_segment:
+            continue
+        with open(segment_path(directory, segment), "rb") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if record["seq"] > after_seq:
+                    yield record
+
+
+def load_state(data):
+    """
+    Returns the keyed store state for `data`, which is either a saved state
+    or resume data with a list per section (as in resume.json). Items of a
+    list get ids counting up from 0 and every section starts at version 0.
+    """
+    if "sections" in data and "next_ids" in data:
+        return {
+            "sections": {section: {int(item_id): item for item_id, item in items.items()}
+                         for section, items in data["sections"].items()},
+            "next_ids": dict(data["next_ids"]),
+            "versions": dict(data.get("versions", {})),
+        }
+    return {
+        "sections": {section: dict(enumerate(items or [])) for section, items in data.items()},
+        "next_ids": {section: len(items or []) for section, items in data.items()},
+        "versions": {},
+    }
+
+
+def recover(directory, seed):
+    """
+    Rebuilds the store state from the snapshot and journal in directory,
+    starting from `seed` when there is no snapshot yet. Returns the state,
+    the last applied sequence number and the next free segment number.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, SNAPSHOT_NAME)
+    segment, seq, state = 0, 0, load_state(seed)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as file:
+            snapshot = json.load(file)
+        segment, seq, state = snapshot["segment"], snapshot["seq"], load_state(snapshot["data"])
+
+    for record in read_journal(directory, segment, seq):
+        apply_mutation(state, record)
+        seq = record["seq"]
+
+    segments = list_segments(directory)
+    next_segment = max([segment, *segments]) + 1
+    return state, seq, next_segment
+
+
+def apply_mutation(state, record):
+    """
+    Applies one journal record to the keyed store state. Items are addressed
+    by ids that are never reused; records carry the ids they assign. A
+    section's dict is kept in list order, so inserting or moving an item
+    rebuilds it. Every record bumps the version of its section. A batch
+    record holds the records of one transaction, so it replays whole or,
+    if torn, not at all.
+    """
+    operation = record["op"]
+    if operation == "batch":
+        for batched in record["records"]:
+            apply_mutation(state, batched)
+        return
+    name = record["section"]
+    section = state["sections"].setdefault(name, {})
+    next_ids = state["next_ids"]
+    if operation == "append":
+        section[record["id"]] = record["item"]
+        next_ids[name] = max(next_ids.get(name, 0), record["id"] + 1)
+    elif operation == "set":
+        section[record["id"]] = record["item"]
+    elif operation == "update":
+        # A new dict, so shallow copies of the section keep the old item
+        section[record["id"]] = {**section[record["id"]], **record["fields"]}
+    elif operation == "delete":
+        del section[record["id"]]
+    elif operation in ("insert", "move"):
+        item = record["item"] if operation == "insert" else section.pop(record["id"])
+        entries = list(section.items())
+        entries.insert(record["index"], (record["id"], item))
+        state["sections"][name] = dict(entries)
+        if operation == "insert":
+            next_ids[name] = max(next_ids.get(name, 0), record["id"] + 1)
+    elif operation == "replace":
+        state["sections"][name] = dict(zip(record["ids"], record["items"]))
+        next_ids[name] = max([next_ids.get(name, 0), *(item_id + 1 for item_id in record["ids"])])
+    else:
+        raise ValueError(f"Unknown journal operation: {operation}")
+    state["versions"][name] = state["versions"].get(name, 0) + 1
@@ -0,0 +1,424 @@
+"""
+Request and internal timing metrics, exposed in the Prometheus text format.
+
+MetricsMiddleware wraps the WSGI app and records every request once its
+response has been sent: latency and payload size histograms per route and
+method, status code counters and a gauge of the requests in flight. Parts
+of the work done for a request (spellchecking, calls to the suggestion
+backend, JSON serialization) are timed separately with `timed`.
+
+Every update takes one lock for a few dict lookups and a bisect, so the
+cost per request stays in the microseconds.
+
+Several server processes share their metrics through METRICS_DIR: each one
+publishes a snapshot of its own as <pid>.json every METRICS_PUBLISH_SECONDS
+and when it exits, and /metrics sums every snapshot in the directory, so a
+scrape reports the whole server whichever worker answers it. Counters and
+histograms of workers that have exited still count; their gauges don't.
+"""
+import atexit
+import bisect
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import settings
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                   2.5, 5.0, 10.0)
+# 64 B to 16 MiB, in powers of 4
+SIZE_BUCKETS = tuple(64 * 4 ** power for power in range(10))
+# Set on the WSGI environ by the app once the request is routed
+ROUTE_KEY = "resume.metrics.route"
+UNMATCHED_ROUTE = "<unmatched>"
+
+_LOCK = threading.Lock()
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A value per label set that only goes up"""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self._values = {}
+
+    def add(self, labels, amount=1):
+        """Adds `amount` to the series of `labels`; the caller holds the registry lock"""
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        """Yields (name suffix, labels, extra label, value) for each series"""
+        for labels, value in sorted(self._values.items()):
+            yield "", labels, "", value
+
+    def dump(self):
+        """Returns every series as JSON-compatible [labels, value] pairs"""
+        return [[list(labels), value] for labels, value in self._values.items()]
+
+    def load(self, series):
+        """Adds series returned by dump(); the caller holds the registry lock"""
+        for labels, value in series:
+            self.add(tuple(labels), value)
+
+
+class Gauge(Counter):
+    """A value per label set that goes up and down"""
+
+    kind = "gauge"
+
+
+class Histogram:
+    """Observations per label set, counted into cumulative buckets"""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # labels -> [count per bucket..., count above the last bucket, sum]
+        self._series = {}
+
+    def observe(self, labels, value):
+        """Records one observation; the caller holds the registry lock"""
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def samples(self):
+        """Yields (name suffix, labels, extra label, value) for each series"""
+        for labels, series in sorted(self._series.items()):
+            total = 0
+            for bound, count in zip((*self.buckets, float("inf")), series):
+                total += count
+                yield "_bucket", labels, f'le="{_format_value(float(bound))}"', total
+            yield "_sum", labels, "", series[-1]
+            yield "_count", labels, "", total
+
+    def dump(self):
+        """Returns every series as JSON-compatible [labels, counts and sum] pairs"""
+        return [[list(labels), list(series)] for labels, series in self._series.items()]
+
+    def load(self, series):
+        """Adds series returned by dump(); the caller holds the registry lock"""
+        for labels, counts in series:
+            current = self._series.setdefault(tuple(labels),
+                                              [0] * (len(self.buckets) + 1) + [0.0])
+            for index, count in enumerate(counts):
+                current[index] += count
+
+
+class Metrics:  # pylint: disable=too-many-instance-attributes
+    """
+    The app's metrics: what MetricsMiddleware records for each request and
+    the time spent in each timed stage
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        route = ("method", "route")
+        self.requests = Counter("resume_http_requests_total",
+                                "Requests answered, by route, method and status code",
+                                (*route, "status"))
+        self.latency = Histogram("resume_http_request_duration_seconds",
+                                 "Time from receiving a request to sending the last byte "
+                                 "of its response", route)
+        self.in_flight = Gauge("resume_http_requests_in_flight",
+                               "Requests being handled, by route and method", route)
+        self.request_size = Histogram("resume_http_request_size_bytes",
+                                      "Size of request bodies", route, SIZE_BUCKETS)
+        self.response_size = Histogram("resume_http_response_size_bytes",
+                                       "Size of response bodies as sent", route, SIZE_BUCKETS)
+        self.stages = Histogram("resume_stage_duration_seconds",
+                                "Time spent spellchecking, waiting on the suggestion "
+                                "backend and serializing JSON", ("stage",))
+        # Bumped by every update, so an unchanged snapshot isn't published again
+        self.updates = 0
+
+    def _all(self):
+        return (self.requests, self.latency, self.in_flight, self.request_size,
+                self.response_size, self.stages)
+
+    def started(self, method, route):
+        """Counts a routed request in flight"""
+        with self._lock:
+            self.updates += 1
+            self.in_flight.add((method, route))
+
+    def finished(self, request, seconds, request_bytes, response_bytes):
+        """
+        Records a request once its response is sent. `request` is (method,
+        route, status, in_flight), where in_flight says whether started()
+        counted it.
+        """
+        method, route, status, in_flight = request
+        labels = (method, route)
+        with self._lock:
+            self.updates += 1
+            if in_flight:
+                self.in_flight.add(labels, -1)
+            self.requests.add((method, route, status))
+            self.latency.observe(labels, seconds)
+            if request_bytes is not None:
+                self.request_size.observe(labels, request_bytes)
+            self.response_size.observe(labels, response_bytes)
+
+    def observe(self, stage, seconds):
+        """Records the time spent in one run of a stage"""
+        with self._lock:
+            self.updates += 1
+            self.stages.observe((stage,), seconds)
+
+    @contextmanager
+    def timed(self, stage):
+        """Times the block as one run of `stage`, whether or not it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def render(self):
+        """Returns every metric in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for metric in self._all():
+                lines.append(f"# HELP {metric.name} {metric.help_text}")
+                lines.append(f"# TYPE {metric.name} {metric.kind}")
+                for suffix, labels, extra, value in metric.samples():
+                    lines.append(f"{metric.name}{suffix}"
+                                 f"{_format_labels(metric.labelnames, labels, extra)} "
+                                 f"{_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """Returns every series by metric name, in a JSON-compatible form"""
+        with self._lock:
+            return {metric.name: metric.dump() for metric in self._all()}
+
+    def merge(self, snapshot, gauges=True):
+        """Adds the series of a snapshot, leaving out its gauges unless `gauges`"""
+        with self._lock:
+            self.updates += 1
+            for metric in self._all():
+                if gauges or metric.kind != "gauge":
+                    metric.load(snapshot.get(metric.name, ()))
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class SharedMetrics:
+    """
+    Snapshots of the metrics of every server process, one file per process
+    in `directory`
+    """
+
+    def __init__(self, directory, interval=1.0):
+        self.directory = Path(directory)
+        self.interval = interval
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._published = None
+        # The publisher thread, scrapes and the exit hook all publish
+        self._lock = threading.Lock()
+
+    def publish(self, metrics):
+        """Writes this process's snapshot, replacing the previous one at once"""
+        with self._lock:
+            updates = (id(metrics), metrics.updates)
+            if updates == self._published:
+                return
+            descriptor, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                with os.fdopen(descriptor, "w", encoding="utf-8") as file:
+                    json.dump(metrics.snapshot(), file)
+                os.replace(temporary, self.directory / f"{os.getpid()}.json")
+            except BaseException:
+                os.unlink(temporary)
+                raise
+            self._published = updates
+
+    def collect(self, metrics):
+        """
+        Returns the sum of every process's metrics, `metrics` being this
+        process's, up to date
+        """
+        self.publish(metrics)
+        total = Metrics()
+        for path in self.directory.glob("*.json"):
+            try:
+                snapshot = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                continue
+            pid = int(path.stem) if path.stem.isdigit() else None
+            total.merge(snapshot, gauges=pid is not None and _alive(pid))
+        return total
+
+    def start(self):
+        """Publishes the process-wide metrics every interval from a daemon thread, and at exit"""
+        def loop():
+            while True:
+                time.sleep(self.interval)
+                self.publish(get_metrics())
+
+        threading.Thread(target=loop, name="metrics-publisher", daemon=True).start()
+        atexit.register(lambda: self.publish(get_metrics()))
+
+
+def clear_shared_metrics(directory):
+    """Removes the snapshots a previous run of the server left in `directory`"""
+    for path in Path(directory).glob("*.json"):
+        path.unlink(missing_ok=True)
+
+
+class _ObservedBody:
+    """
+    Response iterable that counts the bytes sent and reports them when the
+    server closes it
+    """
+
+    def __init__(self, body, on_close):
+        self._body = body
+        self._on_close = on_close
+        self._sent = 0
+
+    def __iter__(self):
+        for chunk in self._body:
+            self._sent += len(chunk)
+            yield chunk
+
+    def close(self):
+        """Closes the wrapped body, then records the request"""
+        try:
+            if hasattr(self._body, "close"):
+                self._body.close()
+        finally:
+            self._on_close(self._sent)
+
+
+class MetricsMiddleware:  # pylint: disable=too-few-public-methods
+    """
+    WSGI middleware recording each request in the process-wide metrics.
+    Streamed responses are timed and measured until their last chunk is
+    sent. The route label is the URL rule the app matched, read from
+    ROUTE_KEY, so hosted resumes share their routes' series.
+    """
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+        # Starts publishing this process's metrics when they are shared
+        get_shared_metrics()
+
+    def __call__(self, environ, start_response):
+        start = time.perf_counter()
+        status = []
+
+        def capture(status_line, headers, exc_info=None):
+            status[:] = [status_line.split(" ", 1)[0]]
+            return start_response(status_line, headers, exc_info)
+
+        def finish(sent):
+            route = environ.get(ROUTE_KEY)
+            content_length = environ.get("CONTENT_LENGTH")
+            get_metrics().finished(
+                (environ.get("REQUEST_METHOD", "GET"), route or UNMATCHED_ROUTE,
+                 status[0] if status else "500", route is not None),
+                time.perf_counter() - start,
+                int(content_length) if content_length and content_length.isdigit() else None,
+                sent)
+
+        try:
+            body = self.wsgi_app(environ, capture)
+        except BaseException:
+            finish(0)
+            raise
+        return _ObservedBody(body, finish)
+
+
+_METRICS = None
+_SHARED = None
+_SHARED_OPENED = False
+
+
+def get_metrics():
+    """Returns the process-wide metrics"""
+    global _METRICS  # pylint: disable=global-statement
+    with _LOCK:
+        if _METRICS is None:
+            _METRICS = Metrics()
+        return _METRICS
+
+
+def set_metrics(metrics):
+    """Replaces the process-wide metrics"""
+    global _METRICS  # pylint: disable=global-statement
+    with _LOCK:
+        _METRICS = metrics
+
+
+def get_shared_metrics():
+    """
+    Returns where the server processes share their metrics, publishing this
+    process's from then on, or None when METRICS_DIR is unset
+    """
+    global _SHARED, _SHARED_OPENED  # pylint: disable=global-statement
+    with _LOCK:
+        if not _SHARED_OPENED:
+            _SHARED_OPENED = True
+            directory = settings.getenv("METRICS_DIR")
+            if directory:
+                _SHARED = SharedMetrics(directory,
+                                        float(settings.getenv("METRICS_PUBLISH_SECONDS", "1")))
+                _SHARED.start()
+        return _SHARED
+
+
+def set_shared_metrics(shared):
+    """Replaces where the metrics are shared; None keeps them to this process"""
+    global _SHARED, _SHARED_OPENED  # pylint: disable=global-statement
+    with _LOCK:
+        _SHARED, _SHARED_OPENED = shared, True
+
+
+def render_metrics():
+    """Returns the metrics of every server process, or of this one when they aren't shared"""
+    shared = get_shared_metrics()
+    if shared is None:
+        return get_metrics().render()
+    return shared.collect(get_metrics()).render()
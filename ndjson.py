@@ -0,0 +1,40 @@
+"""
+Streaming NDJSON export and import of whole resumes
+"""
+import json
+
+from store import SECTIONS
+
+MIMETYPE = "application/x-ndjson"
+EXPORT_PAGE_SIZE = 500
+IMPORT_CHUNK_SIZE = 500
+
+
+def export_records(store, page_size=EXPORT_PAGE_SIZE):
+    """
+    Yields a {"section", "id", "item"} record for every item of every
+    section, reading the store a page at a time
+    """
+    for section in SECTIONS:
+        for item_id, item in store.scan(section, page_size):
+            yield {"section": section, "id": item_id, "item": item}
+
+
+def read_records(lines):
+    """
+    Parses an NDJSON stream one line at a time, yielding (line number,
+    record, error) for every line that isn't blank. Exactly one of record
+    and error is None.
+    """
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as error:
+            yield number, None, f"Invalid JSON: {error}"
+            continue
+        if not isinstance(record, dict):
+            yield number, None, "Record must be an object"
+            continue
+        yield number, record, None
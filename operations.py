@@ -0,0 +1,166 @@
+"""
+Validation and application of the write operations of PATCH, batch and
+import requests
+"""
+from dataclasses import fields
+
+from models import Experience, Education, Skill, Project
+from utils import check_phone_number
+
+PATCH_OPERATIONS = ('move', 'insert', 'update', 'remove')
+BATCH_OPERATIONS = (*PATCH_OPERATIONS, 'append', 'replace')
+SECTION_MODELS = {'experience': Experience, 'education': Education, 'skill': Skill,
+                  'project': Project}
+USER_FIELDS = ('name', 'phone_number', 'email_address')
+
+
+def check_technologies(model, item):
+    """
+    Raises a ValueError unless the technologies of a project, when `item`
+    sets them, are a list of strings, which is what both stores filter on
+    """
+    if model is not Project or 'technologies' not in item:
+        return
+    technologies = item['technologies']
+    if not isinstance(technologies, list) or not all(isinstance(technology, str)
+                                                     for technology in technologies):
+        raise ValueError("technologies must be a list of strings")
+
+
+def build_item(model, body):
+    """
+    Builds a model instance from a request body, naming any missing fields
+    """
+    if body is not None and not isinstance(body, dict):
+        raise ValueError("Item must be an object")
+    names = [field.name for field in fields(model)]
+    missing_fields = [name for name in names if name not in (body or {})]
+    if missing_fields:
+        raise ValueError(f"Missing fields: {', '.join(missing_fields)}")
+    check_technologies(model, body)
+    return model(*(body[name] for name in names))
+
+
+def parse_operation(store, section, operation, removed, allowed=PATCH_OPERATIONS):
+    """
+    Validates one operation on a list section of `store`, building the
+    items it adds. `removed` holds the ids that earlier operations of the
+    same request removed or replaced.
+    """
+    model = SECTION_MODELS[section]
+    kind = operation.get('op') if isinstance(operation, dict) else None
+    if kind not in allowed:
+        raise ValueError(f"Unknown op: {kind}")
+
+    index = operation.get('index')
+    if kind in ('insert', 'move') and (not isinstance(index, int) or isinstance(index, bool)
+                                       or index < 0):
+        raise ValueError("index must be a non-negative integer")
+    if kind in ('append', 'insert'):
+        return {'op': kind, 'index': index, 'item': build_item(model, operation.get('item'))}
+    if kind == 'replace':
+        items = operation.get('items')
+        if not isinstance(items, list):
+            raise ValueError("items must be a list")
+        removed.update(item_id for item_id, _ in store.entries(section))
+        return {'op': kind, 'items': [build_item(model, item) for item in items]}
+
+    item_id = operation.get('id')
+    if (not isinstance(item_id, int) or item_id in removed
+            or store.get(section, item_id) is None):
+        raise LookupError(f"{model.__name__} {item_id} not found")
+    if kind == 'remove':
+        removed.add(item_id)
+    if kind != 'update':
+        return {'op': kind, 'id': item_id, 'index': index}
+
+    changes = operation.get('fields')
+    if not isinstance(changes, dict) or not changes:
+        raise ValueError("fields must be a non-empty object")
+    names = {field.name for field in fields(model)}
+    invalid_fields = [name for name in changes if name not in names]
+    if invalid_fields:
+        raise ValueError(f"Invalid fields: {', '.join(invalid_fields)}")
+    check_technologies(model, changes)
+    return {'op': kind, 'id': item_id, 'fields': changes}
+
+
+def parse_user_operation(store, operation, emails):
+    """
+    Validates an add or put of a user of `store`. `emails` maps the
+    addresses added by earlier operations of the same request to True.
+    """
+    kind = operation.get('op')
+    if kind not in ('add', 'put'):
+        raise ValueError(f"Unknown op: {kind}")
+    user = operation.get('item')
+    if not isinstance(user, dict) or not all(key in user for key in USER_FIELDS):
+        raise ValueError("Missing required fields")
+    if not all(isinstance(user[key], str) for key in USER_FIELDS):
+        raise ValueError(f"{', '.join(USER_FIELDS)} must be strings")
+    if not check_phone_number(user['phone_number']):
+        raise ValueError("Incorrect phone number")
+
+    email = user['email_address']
+    exists = emails.get(email) or store.find_user(email) is not None
+    if kind == 'add' and exists:
+        raise ValueError("User already exists")
+    if kind == 'put' and not exists:
+        raise LookupError("User not found !")
+    emails[email] = True
+    return {'op': kind, 'item': {key: user[key] for key in USER_FIELDS}}
+
+
+def check_operations(operations, parse):
+    """
+    Validates every operation with `parse`, naming the failing one in the
+    ValueError (bad request) or LookupError (missing item) raised
+    """
+    if not isinstance(operations, list) or not operations:
+        raise ValueError("operations must be a non-empty list")
+    checked = []
+    for number, operation in enumerate(operations):
+        try:
+            checked.append(parse(operation))
+        except (ValueError, LookupError) as error:
+            raise type(error)(f"Operation {number}: {error}") from error
+    return checked
+
+
+def apply_operation(store, section, operation):
+    """
+    Applies a validated operation to `store` and returns its result
+    """
+    kind, item_id = operation['op'], operation.get('id')
+    if kind == 'append':
+        item_id = store.append(section, operation['item'])
+    elif kind == 'insert':
+        item_id = store.insert(section, operation['index'], operation['item'])
+    elif kind == 'replace':
+        return {"op": kind, "ids": store.replace(section, operation['items'])}
+    elif kind == 'move':
+        store.move(section, item_id, operation['index'])
+    elif kind == 'update':
+        store.update(section, item_id, operation['fields'])
+    elif kind == 'remove':
+        store.delete(section, item_id)
+    elif kind == 'add':
+        store.add_user(operation['item'])
+    else:
+        store.put_user(operation['item'])
+    return {"op": kind, "id": item_id} if item_id is not None else {"op": kind}
+
+
+def parse_import_record(store, record, emails):
+    """
+    Validates an imported record, returning its section and the operation
+    that adds its item to `store`
+    """
+    section = record.get('section')
+    if section == 'user':
+        return section, parse_user_operation(store, {'op': 'add', 'item': record.get('item')},
+                                             emails)
+    if section not in SECTION_MODELS:
+        raise ValueError(f"Unknown section: {section}")
+    return section, {'op': 'append', 'item': build_item(SECTION_MODELS[section],
+                                                        record.get('item'))}
@@ -0,0 +1,220 @@
+"""
+Opt-in sampled request profiling.
+
+With PROFILE_SAMPLE_RATE above 0, that fraction of requests runs under
+cProfile; with PROFILE_TOKEN set, a request carrying the token in its
+X-Profile-Token header is always profiled. Each profiled request is dumped
+to PROFILE_DIR as a pstats file named after its time, process, method and
+route, and only the newest PROFILE_MAX_FILES dumps are kept.
+
+When neither is configured the middleware is not installed at all, so
+requests don't pay for it.
+"""
+import cProfile
+import hmac
+import os
+import pstats
+import random
+import re
+import threading
+import time
+
+import settings
+from metrics import ROUTE_KEY, UNMATCHED_ROUTE
+
+TOKEN_HEADER = "X-Profile-Token"
+DEFAULT_DIR = "data/profiles"
+DEFAULT_MAX_FILES = 200
+SUFFIX = ".prof"
+SORT_KEYS = {"tottime": 2, "cumtime": 3}
+
+_LOCK = threading.Lock()
+
+
+def _slug(route):
+    return re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+
+
+class RequestProfiler:
+    """
+    Decides which requests are profiled, writes their dumps to a rotating
+    directory and summarizes the newest ones
+    """
+
+    def __init__(self, directory=DEFAULT_DIR, sample_rate=0.0, token=None,
+                 max_files=DEFAULT_MAX_FILES):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.token = token or None
+        self.max_files = max_files
+        # cProfile can't profile two requests at once (Python 3.12 allows
+        # one active profiler per process), so a request sampled while
+        # another one is profiled runs normally
+        self._active = threading.Lock()
+        self._counters = {"profiled": 0, "skipped_busy": 0}
+
+    @property
+    def enabled(self):
+        """Whether any request can be profiled"""
+        return self.sample_rate > 0 or self.token is not None
+
+    def authorized(self, token):
+        """Whether a request carries the profiling token"""
+        return (self.token is not None and token is not None
+                and hmac.compare_digest(token.encode(), self.token.encode()))
+
+    def wants(self, environ):
+        """Whether to profile the request of a WSGI environ"""
+        if self.authorized(environ.get("HTTP_" + TOKEN_HEADER.upper().replace("-", "_"))):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def start(self):
+        """Returns a running profiler, or None when another request holds it"""
+        if not self._active.acquire(blocking=False):  # pylint: disable=consider-using-with
+            with _LOCK:
+                self._counters["skipped_busy"] += 1
+            return None
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def finish(self, profile, environ):
+        """Stops the profiler, dumps it tagged with the request and rotates the directory"""
+        profile.disable()
+        self._active.release()
+        now = time.time()
+        name = (f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime(now))}"
+                f".{int(now % 1 * 1e6):06d}Z-{os.getpid()}-{environ.get('REQUEST_METHOD', 'GET')}"
+                f"-{_slug(environ.get(ROUTE_KEY, UNMATCHED_ROUTE))}{SUFFIX}")
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, name)
+        # Written aside and renamed, so readers never see half a dump
+        profile.dump_stats(path + ".tmp")
+        os.replace(path + ".tmp", path)
+        with _LOCK:
+            self._counters["profiled"] += 1
+        self._rotate()
+        return path
+
+    def dumps(self):
+        """Returns the paths of the dumps, newest first"""
+        try:
+            names = [name for name in os.listdir(self.directory) if name.endswith(SUFFIX)]
+        except FileNotFoundError:
+            return []
+        return [os.path.join(self.directory, name) for name in sorted(names, reverse=True)]
+
+    def _rotate(self):
+        for path in self.dumps()[self.max_files:]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # another worker removed it first
+
+    def hot_functions(self, samples=50, limit=20, sort="tottime"):
+        """
+        Merges the newest `samples` dumps and returns the `limit` functions
+        that took the most time, by own time (tottime) or including their
+        callees (cumtime)
+        """
+        stats = None
+        merged = []
+        for path in self.dumps()[:samples]:
+            try:
+                if stats is None:
+                    stats = pstats.Stats(path)
+                else:
+                    stats.add(path)
+            except (OSError, EOFError, ValueError, TypeError):
+                continue  # rotated away or unreadable
+            merged.append(os.path.basename(path))
+        with _LOCK:
+            counters = dict(self._counters)
+        return {**counters, "samples": merged, "sort": sort,
+                "functions": [] if stats is None else _top_functions(stats, limit, sort)}
+
+
+def _top_functions(stats, limit, sort):
+    """Returns the `limit` entries of a pstats.Stats with the highest `sort` time"""
+    entries = sorted(stats.stats.items(), key=lambda item: item[1][SORT_KEYS[sort]],
+                     reverse=True)
+    return [{"function": function, "file": filename, "line": line, "calls": calls,
+             "tottime": tottime, "cumtime": cumtime}
+            for (filename, line, function), (_, calls, tottime, cumtime, _) in entries[:limit]]
+
+
+class _ProfiledBody:
+    """
+    Response iterable that keeps the profiler running while the body is
+    produced, and dumps the profile when the server closes it
+    """
+
+    def __init__(self, body, on_close):
+        self._body = body
+        self._on_close = on_close
+
+    def __iter__(self):
+        return iter(self._body)
+
+    def close(self):
+        """Closes the wrapped body, then finishes the profile"""
+        try:
+            if hasattr(self._body, "close"):
+                self._body.close()
+        finally:
+            self._on_close()
+
+
+class ProfilingMiddleware:  # pylint: disable=too-few-public-methods
+    """
+    WSGI middleware running the requests the profiler picks under cProfile,
+    streamed bodies included. Other requests go straight to the app.
+    """
+
+    def __init__(self, wsgi_app, profiler):
+        self.wsgi_app = wsgi_app
+        self.profiler = profiler
+
+    def __call__(self, environ, start_response):
+        if not self.profiler.wants(environ):
+            return self.wsgi_app(environ, start_response)
+        profile = self.profiler.start()
+        if profile is None:
+            return self.wsgi_app(environ, start_response)
+        try:
+            body = self.wsgi_app(environ, start_response)
+        except BaseException:
+            self.profiler.finish(profile, environ)
+            raise
+        return _ProfiledBody(body, lambda: self.profiler.finish(profile, environ))
+
+
+def install(wsgi_app):
+    """Wraps a WSGI app in the profiling middleware, only when profiling is enabled"""
+    profiler = get_profiler()
+    return ProfilingMiddleware(wsgi_app, profiler) if profiler.enabled else wsgi_app
+
+
+_PROFILER = None
+
+
+def get_profiler():
+    """Returns the process-wide request profiler, configured from the environment"""
+    global _PROFILER  # pylint: disable=global-statement
+    with _LOCK:
+        if _PROFILER is None:
+            _PROFILER = RequestProfiler(
+                directory=settings.getenv("PROFILE_DIR", DEFAULT_DIR),
+                sample_rate=float(settings.getenv("PROFILE_SAMPLE_RATE", "0")),
+                token=settings.getenv("PROFILE_TOKEN"),
+                max_files=int(settings.getenv("PROFILE_MAX_FILES", str(DEFAULT_MAX_FILES))),
+            )
+        return _PROFILER
+
+
+def set_profiler(profiler):
+    """Replaces the process-wide request profiler"""
+    global _PROFILER  # pylint: disable=global-statement
+    with _LOCK:
+        _PROFILER = profiler
@@ -0,0 +1,296 @@
+"""
+JSON encoding, response compression and the cache of encoded section
+responses
+"""
+import gzip
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from flask.json.provider import DefaultJSONProvider
+
+import settings
+from metrics import get_metrics
+
+DEFAULT_CACHE_SIZE = 256
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+DEFAULT_GZIP_LEVEL = 6
+DEFAULT_GZIP_MIN_BYTES = 1024
+
+_LOCK = threading.Lock()
+_ORJSON = None
+
+
+def _orjson():
+    """Imports orjson on first use; returns None when it is not installed"""
+    global _ORJSON  # pylint: disable=global-statement
+    with _LOCK:
+        if _ORJSON is None:
+            try:
+                import orjson  # pylint: disable=import-outside-toplevel
+            except ImportError:
+                orjson = False
+            _ORJSON = orjson
+        return _ORJSON or None
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider that encodes with orjson when it is installed and
+    JSON_ENCODER is not set to "json". The output is compact with sorted
+    keys, like the default provider's; debug mode's indented output and
+    calls with extra encoder options still use the standard encoder.
+    """
+
+    def __init__(self, app, encoder=None):
+        super().__init__(app)
+        self.encoder = encoder
+
+    def _fast(self):
+        if self.encoder is None:
+            self.encoder = settings.getenv("JSON_ENCODER", "orjson")
+        return _orjson() if self.encoder == "orjson" else None
+
+    def encode(self, obj):
+        """Returns obj as compact JSON bytes"""
+        orjson = self._fast()
+        with get_metrics().timed("serialization"):
+            if orjson is None:
+                return super().dumps(obj, separators=(",", ":")).encode("utf-8")
+            # Dataclasses go through default() so their keys get sorted too
+            return orjson.dumps(obj, default=self.default,
+                                option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+                                | orjson.OPT_PASSTHROUGH_DATACLASS)
+
+    def dumps(self, obj, **kwargs):
+        orjson = self._fast()
+        if orjson is None or kwargs:
+            with get_metrics().timed("serialization"):
+                return super().dumps(obj, **kwargs)
+        return self.encode(obj).decode("utf-8")
+
+    def response(self, *args, **kwargs):
+        if self._fast() is None or self.compact is False or (
+                self.compact is None and self._app.debug):
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.encode(obj) + b"\n", mimetype=self.mimetype)
+
+
+class ResponseCache:
+    """
+    LRU cache of encoded GET responses, keyed by section and view (the
+    request's query arguments).
+
+    Each entry remembers the ETag of the section state it was encoded from
+    and is only served while the section still has that tag, so a write to
+    the section makes its entries stale wherever it happened. Writes made
+    through the routes also drop the section's entries straight away.
+    Compressed variants of a body are kept in its entry and go with it.
+    """
+
+    def __init__(self, max_entries=DEFAULT_CACHE_SIZE, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "stale": 0, "invalidations": 0}
+
+    def get(self, section, view, etag):
+        """Returns the cached (body, headers) of a view at etag, or None"""
+        key = (section, view)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            if entry[0] != etag:
+                self._counters["stale"] += 1
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return entry[1], entry[2]
+
+    def set(self, section, view, etag, body, headers):
+        """Stores the encoded body and extra headers of a view at etag"""
+        if len(body) > self.max_bytes or not self.max_entries:
+            return
+        key = (section, view)
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (etag, body, headers, {})
+            self._bytes += len(body)
+            self._evict()
+
+    def variant(self, section, view, etag, encoding):
+        """Returns the cached `encoding` variant of a view at etag, or None"""
+        with self._lock:
+            entry = self._entries.get((section, view))
+            if entry is None or entry[0] != etag:
+                return None
+            return entry[3].get(encoding)
+
+    def set_variant(self, section, view, etag, encoding, body):
+        """Keeps an encoded variant with the view's body, if that is cached at etag"""
+        with self._lock:
+            entry = self._entries.get((section, view))
+            if entry is None or entry[0] != etag or encoding in entry[3]:
+                return
+            entry[3][encoding] = body
+            self._bytes += len(body)
+            self._evict()
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[1]) + sum(len(body) for body in entry[3].values())
+
+    def invalidate(self, section):
+        """Drops every cached view of a section"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == section]:
+                self._drop(key)
+            self._counters["invalidations"] += 1
+
+    def stats(self):
+        """Returns the hit/miss counters and current size"""
+        with self._lock:
+            return {**self._counters, "size": len(self._entries), "max_size": self.max_entries,
+                    "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+    def clear(self):
+        """Drops every entry and resets the counters"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._counters = dict.fromkeys(self._counters, 0)
+
+
+class GzipCompressor:
+    """
+    Gzips response bodies of at least `min_bytes` bytes and counts what it
+    saves: the bytes left out of responses and the CPU time spent
+    compressing. Bodies compressed earlier and reused from the response
+    cache count towards the savings but cost no CPU. A level of 0 turns
+    compression off.
+    """
+
+    def __init__(self, level=DEFAULT_GZIP_LEVEL, min_bytes=DEFAULT_GZIP_MIN_BYTES):
+        self.level = level
+        self.min_bytes = min_bytes
+        self._lock = threading.Lock()
+        self._counters = {"compressed": 0, "reused": 0, "bytes_in": 0, "bytes_out": 0,
+                          "cpu_seconds": 0.0}
+
+    def wants(self, body):
+        """Whether a body is worth compressing"""
+        return self.level > 0 and len(body) >= self.min_bytes
+
+    def compress(self, body):
+        """Returns the gzipped body"""
+        start = time.thread_time()
+        compressed = gzip.compress(body, compresslevel=self.level, mtime=0)
+        elapsed = time.thread_time() - start
+        with self._lock:
+            self._counters["compressed"] += 1
+            self._counters["cpu_seconds"] += elapsed
+            self._count(body, compressed)
+        return compressed
+
+    def compress_stream(self, chunks):
+        """
+        Gzips a stream of chunks as it is produced, yielding output whenever
+        zlib has some, and closes the stream when it ends or is closed
+        """
+        # wbits 31 writes the gzip header and trailer, with no mtime
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        counts = {"bytes_in": 0, "bytes_out": 0, "cpu_seconds": 0.0}
+
+        def compress(data, flush=False):
+            start = time.thread_time()
+            compressed = compressor.flush() if flush else compressor.compress(data)
+            counts["cpu_seconds"] += time.thread_time() - start
+            counts["bytes_in"] += len(data)
+            counts["bytes_out"] += len(compressed)
+            return compressed
+
+        try:
+            for chunk in chunks:
+                compressed = compress(chunk)
+                if compressed:
+                    yield compressed
+            yield compress(b"", flush=True)
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
+            with self._lock:
+                self._counters["compressed"] += 1
+                for name, value in counts.items():
+                    self._counters[name] += value
+
+    def record_reuse(self, body, compressed):
+        """Counts a response sent with a body compressed earlier"""
+        with self._lock:
+            self._counters["reused"] += 1
+            self._count(body, compressed)
+
+    def _count(self, body, compressed):
+        self._counters["bytes_in"] += len(body)
+        self._counters["bytes_out"] += len(compressed)
+
+    def stats(self):
+        """Returns the compression counters and settings"""
+        with self._lock:
+            counters = dict(self._counters)
+        return {**counters, "bytes_saved": counters["bytes_in"] - counters["bytes_out"],
+                "level": self.level, "min_bytes": self.min_bytes}
+
+
+_CACHE = None
+_COMPRESSOR = None
+
+
+def get_response_cache():
+    """Returns the process-wide response cache, sized from the environment"""
+    global _CACHE  # pylint: disable=global-statement
+    with _LOCK:
+        if _CACHE is None:
+            _CACHE = ResponseCache(
+                max_entries=int(settings.getenv("RESPONSE_CACHE_SIZE", str(DEFAULT_CACHE_SIZE))),
+                max_bytes=int(settings.getenv("RESPONSE_CACHE_BYTES", str(DEFAULT_CACHE_BYTES))),
+            )
+        return _CACHE
+
+
+def set_response_cache(cache):
+    """Replaces the process-wide response cache"""
+    global _CACHE  # pylint: disable=global-statement
+    with _LOCK:
+        _CACHE = cache
+
+
+def get_compressor():
+    """Returns the process-wide gzip compressor, configured from the environment"""
+    global _COMPRESSOR  # pylint: disable=global-statement
+    with _LOCK:
+        if _COMPRESSOR is None:
+            _COMPRESSOR = GzipCompressor(
+                level=int(settings.getenv("RESPONSE_GZIP_LEVEL", str(DEFAULT_GZIP_LEVEL))),
+                min_bytes=int(settings.getenv("RESPONSE_GZIP_MIN_BYTES",
+                                              str(DEFAULT_GZIP_MIN_BYTES))),
+            )
+        return _COMPRESSOR
+
+
+def set_compressor(compressor):
+    """Replaces the process-wide gzip compressor"""
+    global _COMPRESSOR  # pylint: disable=global-statement
+    with _LOCK:
+        _COMPRESSOR = compressor
@@ -0,0 +1,337 @@
+"""
+Hosting of many resumes: where each one is stored, and the working set of
+resumes kept open in memory
+"""
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+import settings
+from sqlite_store import SQLiteStore
+from store import DEFAULT_COMPACT_RECORDS, SECTIONS, MemoryStore
+from suggestions import percentile
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+RESUME_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+def check_resume_id(resume_id):
+    """Raises ValueError unless resume_id is safe to use as a file name"""
+    if not isinstance(resume_id, str) or not RESUME_ID_PATTERN.fullmatch(resume_id):
+        raise ValueError("Resume id must be 1 to 64 letters, digits, '-' or '_'")
+
+
+class MemoryResumes:
+    """
+    Resumes that only live in memory. They are lost on restart and, since
+    there is nothing to load them back from, never evicted.
+    """
+
+    persistent = False
+
+    def __init__(self):
+        self._stores = {}
+        self._lock = threading.Lock()
+
+    def exists(self, resume_id):
+        """Whether the resume has been created"""
+        return resume_id in self._stores
+
+    def create(self, resume_id):
+        """Creates an empty resume; returns False when it already exists"""
+        with self._lock:
+            if resume_id in self._stores:
+                return False
+            self._stores[resume_id] = MemoryStore({})
+            return True
+
+    def load(self, resume_id):
+        """Returns the store of the resume"""
+        return self._stores[resume_id]
+
+    def ids(self):
+        """Returns the ids of every resume"""
+        return sorted(self._stores)
+
+
+class JournalResumes:
+    """
+    Resumes kept in memory, each journaled to its own subdirectory of
+    `directory`
+    """
+
+    persistent = True
+
+    def __init__(self, directory, compact_records=DEFAULT_COMPACT_RECORDS):
+        self.directory = directory
+        self.compact_records = compact_records
+
+    def exists(self, resume_id):
+        """Whether the resume has been created"""
+        return os.path.isdir(os.path.join(self.directory, resume_id))
+
+    def create(self, resume_id):
+        """Creates an empty resume; returns False when it already exists"""
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            os.mkdir(os.path.join(self.directory, resume_id))
+        except FileExistsError:
+            return False
+        return True
+
+    def load(self, resume_id):
+        """Recovers the store of the resume from its snapshot and journal"""
+        return MemoryStore.open(os.path.join(self.directory, resume_id), {},
+                                compact_records=self.compact_records)
+
+    def ids(self):
+        """Returns the ids of every resume"""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name for name in os.listdir(self.directory)
+                      if os.path.isdir(os.path.join(self.directory, name)))
+
+
+class SQLiteResumes:
+    """
+    Resumes kept in SQLite, one `<id>.db` database per resume in `directory`
+    """
+
+    persistent = True
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, resume_id):
+        return os.path.join(self.directory, f"{resume_id}.db")
+
+    def exists(self, resume_id):
+        """Whether the resume has been created"""
+        return os.path.isfile(self._path(resume_id))
+
+    def create(self, resume_id):
+        """Creates an empty resume; returns False when it already exists"""
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            # SQLite treats an empty file as a new database
+            with open(self._path(resume_id), "x", encoding="utf-8"):
+                pass
+        except FileExistsError:
+            return False
+        return True
+
+    def load(self, resume_id):
+        """Opens the database of the resume"""
+        return SQLiteStore.open(self._path(resume_id), {})
+
+    def ids(self):
+        """Returns the ids of every resume"""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name[:-len(".db")] for name in os.listdir(self.directory)
+                      if name.endswith(".db"))
+
+
+def _versions(store):
+    return tuple(store.version(section) for section in SECTIONS)
+
+
+class ResumeRegistry:  # pylint: disable=too-many-instance-attributes
+    """
+    Working set of the resumes open in memory, in least recently used order.
+
+    A resume is loaded from `storage` the first time it is acquired and
+    stays resident afterwards. Its footprint is measured when it is loaded
+    and again whenever a request that changed it releases it. While the
+    resident resumes add up to more than `max_bytes`, the least recently
+    used ones that no request holds are closed; they are loaded again the
+    next time they are asked for. Resumes of storage that isn't persistent
+    are never evicted.
+    """
+
+    def __init__(self, storage, max_bytes=DEFAULT_MAX_BYTES):
+        self.storage = storage
+        self.max_bytes = max_bytes
+        # Resume id -> {"store", "users", "bytes", "versions"}
+        self._resident = OrderedDict()
+        # Resume id -> Event set once the resume has been loaded or closed
+        self._busy = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "loads": 0, "not_found": 0, "evictions": 0}
+        self._load_seconds = deque(maxlen=1000)
+
+    def create(self, resume_id=None):
+        """
+        Creates an empty resume, with a new id unless one is given. Returns
+        the id, or None when a resume with that id already exists.
+        """
+        resume_id = uuid.uuid4().hex if resume_id is None else resume_id
+        check_resume_id(resume_id)
+        return resume_id if self.storage.create(resume_id) else None
+
+    def ids(self):
+        """Returns the ids of every resume, resident or not"""
+        return self.storage.ids()
+
+    def acquire(self, resume_id):
+        """
+        Returns the store of a resume, loading it if it isn't resident, or
+        None when there is no such resume. The store stays open until it is
+        handed back with release().
+        """
+        if not isinstance(resume_id, str) or not RESUME_ID_PATTERN.fullmatch(resume_id):
+            return None
+        while True:
+            with self._lock:
+                entry = self._resident.get(resume_id)
+                if entry is not None:
+                    self._resident.move_to_end(resume_id)
+                    entry["users"] += 1
+                    self._counters["hits"] += 1
+                    return entry["store"]
+                busy = self._busy.get(resume_id)
+                if busy is None:
+                    busy = self._busy[resume_id] = threading.Event()
+                    break
+            # Another request is loading the resume, or closing it
+            busy.wait()
+
+        try:
+            return self._load(resume_id)
+        finally:
+            with self._lock:
+                del self._busy[resume_id]
+            busy.set()
+
+    def _load(self, resume_id):
+        start = time.perf_counter()
+        store = self.storage.load(resume_id) if self.storage.exists(resume_id) else None
+        elapsed = time.perf_counter() - start
+        if store is None:
+            with self._lock:
+                self._counters["not_found"] += 1
+            return None
+
+        entry = {"store": store, "users": 1, "bytes": store.footprint(),
+                 "versions": _versions(store)}
+        with self._lock:
+            self._counters["loads"] += 1
+            self._load_seconds.append(elapsed)
+            self._resident[resume_id] = entry
+            self._bytes += entry["bytes"]
+            evicted = self._evict()
+        self._close(evicted)
+        return store
+
+    def release(self, resume_id):
+        """Hands back a store from acquire(), measuring it again if it changed"""
+        with self._lock:
+            entry = self._resident[resume_id]
+        # Measured while still held, so it can't be closed underneath
+        versions = _versions(entry["store"])
+        footprint = entry["store"].footprint() if versions != entry["versions"] else None
+        with self._lock:
+            entry["users"] -= 1
+            if footprint is not None:
+                self._bytes += footprint - entry["bytes"]
+                entry["bytes"], entry["versions"] = footprint, versions
+            evicted = self._evict()
+        self._close(evicted)
+
+    def _evict(self):
+        """
+        Takes the least recently used idle resumes out of the working set
+        until it fits the budget; the caller must hold the lock and close
+        what is returned
+        """
+        evicted = []
+        if not self.storage.persistent:
+            return evicted
+        for resume_id in list(self._resident):
+            if self._bytes <= self.max_bytes:
+                break
+            entry = self._resident[resume_id]
+            if entry["users"]:
+                continue
+            del self._resident[resume_id]
+            self._bytes -= entry["bytes"]
+            self._counters["evictions"] += 1
+            # Keeps the resume from being loaded again before it is closed
+            self._busy[resume_id] = threading.Event()
+            evicted.append((resume_id, entry["store"]))
+        return evicted
+
+    def _close(self, evicted):
+        for resume_id, store in evicted:
+            try:
+                store.close()
+            finally:
+                with self._lock:
+                    busy = self._busy.pop(resume_id)
+                busy.set()
+
+    def stats(self):
+        """Returns the working set size, load counters and load latency in seconds"""
+        with self._lock:
+            samples = list(self._load_seconds)
+            return {**self._counters, "resident": len(self._resident), "bytes": self._bytes,
+                    "max_bytes": self.max_bytes,
+                    "load_p50": percentile(samples, 0.5),
+                    "load_p99": percentile(samples, 0.99),
+                    "load_max": max(samples, default=0.0)}
+
+    def close(self):
+        """Closes every resident resume"""
+        with self._lock:
+            stores = [entry["store"] for entry in self._resident.values()]
+            self._resident.clear()
+            self._bytes = 0
+        for store in stores:
+            store.close()
+
+
+def open_storage():
+    """
+    Returns where hosted resumes are kept, following the default resume:
+    RESUME_BACKEND=sqlite keeps each one in a database in RESUMES_DIR
+    (data/resumes by default). The memory backend journals each one to a
+    subdirectory of RESUMES_DIR, or of RESUME_DATA_DIR/resumes when that is
+    set; with neither they only live in memory.
+    """
+    directory = settings.getenv("RESUMES_DIR")
+    if settings.getenv("RESUME_BACKEND", "memory") == "sqlite":
+        return SQLiteResumes(directory or os.path.join("data", "resumes"))
+    data_dir = settings.getenv("RESUME_DATA_DIR")
+    if not directory and data_dir:
+        directory = os.path.join(data_dir, "resumes")
+    if not directory:
+        return MemoryResumes()
+    return JournalResumes(directory, int(settings.getenv("RESUME_COMPACT_RECORDS",
+                                                         str(DEFAULT_COMPACT_RECORDS))))
+
+
+_LOCK = threading.Lock()
+_REGISTRY = None
+
+
+def get_resumes():
+    """Returns the process-wide resume registry, configured from the environment"""
+    global _REGISTRY  # pylint: disable=global-statement
+    with _LOCK:
+        if _REGISTRY is None:
+            _REGISTRY = ResumeRegistry(
+                open_storage(),
+                max_bytes=int(settings.getenv("RESUMES_MAX_BYTES", str(DEFAULT_MAX_BYTES))),
+            )
+        return _REGISTRY
+
+
+def set_resumes(registry):
+    """Replaces the process-wide resume registry"""
+    global _REGISTRY  # pylint: disable=global-statement
+    with _LOCK:
+        _REGISTRY = registry
@@ -0,0 +1,88 @@
+"""
+Production server: runs the app under gunicorn with several worker
+processes, which all read and write the one SQLite store
+
+    python -m serve
+"""
+import os
+import sys
+
+from gunicorn.app.base import BaseApplication
+
+import settings
+from metrics import clear_shared_metrics
+
+DEFAULT_BIND = "0.0.0.0:5000"
+DEFAULT_THREADS = 4
+DEFAULT_TIMEOUT = 30
+DEFAULT_METRICS_DIR = "data/metrics"
+
+
+def server_options():
+    """
+    Returns the gunicorn settings from the environment. WEB_CONCURRENCY
+    worker processes, one per CPU by default, each serve WEB_THREADS
+    requests at once.
+    """
+    return {
+        "bind": settings.getenv("WEB_BIND", DEFAULT_BIND),
+        "workers": int(settings.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1))),
+        "threads": int(settings.getenv("WEB_THREADS", str(DEFAULT_THREADS))),
+        "worker_class": "gthread",
+        "timeout": int(settings.getenv("WEB_TIMEOUT", str(DEFAULT_TIMEOUT))),
+        # Each worker opens the store after it is forked, so none shares a
+        # database connection or journal thread with the master
+        "preload_app": False,
+        "accesslog": "-",
+    }
+
+
+def check_shared_store(options):
+    """
+    Returns why the configured store can't be shared by the workers, or
+    None. Only the SQLite backend keeps one copy of the resume that every
+    process reads and writes; the memory backend would give each worker a
+    copy of its own.
+    """
+    if options["workers"] > 1 and settings.getenv("RESUME_BACKEND", "memory") != "sqlite":
+        return ("Several workers need a shared store: set RESUME_BACKEND=sqlite, "
+                "or WEB_CONCURRENCY=1")
+    return None
+
+
+class ResumeServer(BaseApplication):  # pylint: disable=abstract-method
+    """
+    Gunicorn application serving the resume app with the given settings
+    """
+
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from app import app  # pylint: disable=import-outside-toplevel
+        return app
+
+
+def main():
+    """Checks the configuration and runs the server until it is stopped"""
+    options = server_options()
+    error = check_shared_store(options)
+    if error is not None:
+        sys.exit(error)
+    # Tells the workers how many of them share the CPUs, for sizing pools
+    os.environ["WEB_CONCURRENCY"] = str(options["workers"])
+    # Each worker publishes its metrics there, so /metrics sums all of them;
+    # what an earlier run left would be counted again
+    metrics_dir = settings.getenv("METRICS_DIR", DEFAULT_METRICS_DIR)
+    os.environ["METRICS_DIR"] = metrics_dir
+    clear_shared_metrics(metrics_dir)
+    ResumeServer(options).run()
+
+
+if __name__ == "__main__":
+    main()
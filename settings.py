@@ -0,0 +1,26 @@
+"""
+Environment settings
+"""
+import os
+import threading
+
+_LOADED = False
+_LOCK = threading.Lock()
+
+
+def load_environment():
+    """Reads the .env file into the environment, once per process"""
+    global _LOADED  # pylint: disable=global-statement
+    if not _LOADED:
+        with _LOCK:
+            if not _LOADED:
+                # Imported here so modules that never read a setting don't pay for it.
+                from dotenv import load_dotenv  # pylint: disable=import-outside-toplevel
+                load_dotenv()
+                _LOADED = True
+
+
+def getenv(name, default=None):
+    """Returns an environment setting, loading the .env file on first use"""
+    load_environment()
+    return os.getenv(name, default)
@@ -0,0 +1,267 @@
+"""
+Shared spellcheck engine
+"""
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import settings
+
+DEFAULT_CACHE_SIZE = 4096
+DEFAULT_POOL_MIN_BATCH = 32
+
+# Free-text fields checked by the resume-wide pass. Names, companies,
+# schools and skills are mostly proper nouns, so they are left out.
+SPELLCHECK_FIELDS = {
+    "experience": ("title", "description"),
+    "education": ("course",),
+    "project": ("title", "description"),
+}
+WORD_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+class SpellEngine:
+    """
+    Process-wide wrapper around a single SpellChecker.
+
+    The word-frequency dictionary is loaded once and only read afterwards,
+    so the engine can be shared between request threads. Corrections are
+    memoised in a bounded LRU cache, which is thread-safe in CPython.
+    """
+
+    def __init__(self, cache_size=DEFAULT_CACHE_SIZE):
+        # Imported here so the dictionary package is only loaded with the engine.
+        from spellchecker import SpellChecker  # pylint: disable=import-outside-toplevel
+        self._checker = SpellChecker()
+        self._cached_correction = lru_cache(maxsize=cache_size)(self._checker.correction)
+
+    def unknown(self, words):
+        """Returns the (lower-cased) subset of words not in the dictionary"""
+        return self._checker.unknown(words)
+
+    def correction(self, word):
+        """Returns the most probable correction for a word, or None"""
+        return self._cached_correction(word)
+
+    def stats(self):
+        """Returns the correction cache counters"""
+        info = self._cached_correction.cache_info()
+        return {
+            "hits": info.hits,
+            "misses": info.misses,
+            "size": info.currsize,
+            "max_size": info.maxsize,
+        }
+
+    def clear_cache(self):
+        """Drops every cached correction and resets the counters"""
+        self._cached_correction.cache_clear()
+
+
+_ENGINE = None
+_ENGINE_LOCK = threading.Lock()
+
+
+def get_spell_engine():
+    """Returns the process-wide engine, building it on first use"""
+    global _ENGINE  # pylint: disable=global-statement
+    if _ENGINE is None:
+        with _ENGINE_LOCK:
+            if _ENGINE is None:
+                cache_size = int(settings.getenv("SPELLCHECK_CACHE_SIZE", str(DEFAULT_CACHE_SIZE)))
+                _ENGINE = SpellEngine(cache_size=cache_size)
+    return _ENGINE
+
+
+def tokenize(text):
+    """Returns (start, end, token) for every word and punctuation mark in text"""
+    return [(match.start(), match.end(), match.group()) for match in WORD_PATTERN.finditer(text)]
+
+
+def _match_case(token, correction):
+    """Carries a leading capital from the original token over to its correction"""
+    if token[:1].isupper():
+        return correction[:1].upper() + correction[1:]
+    return correction
+
+
+def _find_replacements(tokens, engine):
+    """Maps every distinct misspelled token to its correction, checking each once"""
+    misspelled = engine.unknown(tokens)
+    replacements = {}
+    if not misspelled:
+        return replacements
+
+    for token in tokens:
+        word = token.lower()
+        if word in misspelled:
+            correction = engine.correction(word)
+            if correction and correction != word:
+                replacements[token] = _match_case(token, correction)
+    return replacements
+
+
+def _apply_replacements(text, tokens, replacements):
+    """Rebuilds text with one join, recording the offsets of every replaced token"""
+    pieces = []
+    corrections = []
+    position = 0
+    shift = 0
+    for start, end, token in tokens:
+        correction = replacements.get(token)
+        if correction is None:
+            continue
+        pieces.append(text[position:start])
+        pieces.append(correction)
+        position = end
+        corrections.append({
+            "word": token,
+            "correction": correction,
+            "start": start,
+            "end": end,
+            "after_start": start + shift,
+            "after_end": start + shift + len(correction),
+        })
+        shift += len(correction) - (end - start)
+    if not corrections:
+        return text, corrections
+    pieces.append(text[position:])
+    return "".join(pieces), corrections
+
+
+def check_spelling(text, engine=None):
+    """
+    Corrects the spelling of a text in a single pass over its tokens.
+
+    Returns the corrected text and one entry per corrected token, holding
+    its offsets in the original text (start/end) and in the corrected text
+    (after_start/after_end).
+    """
+    engine = engine or get_spell_engine()
+    tokens = tokenize(text)
+    replacements = _find_replacements({token for _, _, token in tokens}, engine)
+    if not replacements:
+        return text, []
+    return _apply_replacements(text, tokens, replacements)
+
+
+def _field_value(item, field):
+    """Reads a field from a stored item, which may be a dict or a dataclass"""
+    if isinstance(item, dict):
+        return item.get(field)
+    return getattr(item, field, None)
+
+
+def spellcheck_resume(data, engine=None):
+    """
+    Spellchecks every free-text field of a resume in one pass.
+
+    Each section of `data` is a list, or a dict keyed by item id. Tokens are
+    collected across all sections so each distinct word is looked up once.
+    Returns a patch per field that needs corrections, addressed by section,
+    id and field, plus counters describing the pass.
+    """
+    engine = engine or get_spell_engine()
+    fields = []
+    for section, names in SPELLCHECK_FIELDS.items():
+        items = data.get(section) or []
+        for item_id, item in items.items() if isinstance(items, dict) else enumerate(items):
+            for field in names:
+                text = _field_value(item, field)
+                if isinstance(text, str) and text:
+                    fields.append((section, item_id, field, text, tokenize(text)))
+
+    unique_tokens = {token for *_, tokens in fields for _, _, token in tokens}
+    replacements = _find_replacements(unique_tokens, engine)
+
+    patches = []
+    for section, item_id, field, text, tokens in fields:
+        if not replacements:
+            break
+        _, corrections = _apply_replacements(text, tokens, replacements)
+        if corrections:
+            patches.append({
+                "section": section,
+                "id": item_id,
+                "field": field,
+                "path": f"/{section}/{item_id}/{field}",
+                "corrections": corrections,
+            })
+    return {
+        "patches": patches,
+        "fields_checked": len(fields),
+        "unique_words": len(unique_tokens),
+        "corrected_words": len(replacements),
+    }
+
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+def pool_workers():
+    """
+    Number of pool processes, from SPELLCHECK_WORKERS (0 disables the pool).
+    By default the CPUs are shared out between the WEB_CONCURRENCY server
+    processes, which each start a pool of their own.
+    """
+    servers = max(1, int(settings.getenv("WEB_CONCURRENCY", "1")))
+    default = max(1, (os.cpu_count() or 1) // servers)
+    return int(settings.getenv("SPELLCHECK_WORKERS", str(default)))
+
+
+def _pool_context():
+    """
+    Start method of the pool processes. The server is threaded, and forking
+    it could copy a lock some other thread (journal, compactor, SQLite)
+    holds, so processes come from a fork server, or are spawned where there
+    is none.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+
+def get_spell_pool():
+    """Returns the shared process pool, or None when it is disabled"""
+    global _POOL  # pylint: disable=global-statement
+    if _POOL is None:
+        with _POOL_LOCK:
+            workers = pool_workers()
+            if _POOL is None and workers > 0:
+                _POOL = ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context())
+    return _POOL
+
+
+def shutdown_spell_pool():
+    """Stops the shared process pool, if one was started"""
+    global _POOL  # pylint: disable=global-statement
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.shutdown()
+            _POOL = None
+
+
+def check_spelling_batch(texts, min_batch=None, chunksize=None):
+    """
+    Runs check_spelling over a list of texts, returning results in order.
+
+    Batches of at least `min_batch` texts (SPELLCHECK_POOL_MIN_BATCH) are
+    fanned out over the shared process pool in chunks; smaller ones run
+    in-process so they don't pay the IPC overhead.
+    """
+    if min_batch is None:
+        min_batch = int(settings.getenv("SPELLCHECK_POOL_MIN_BATCH", str(DEFAULT_POOL_MIN_BATCH)))
+    pool = get_spell_pool() if len(texts) >= max(min_batch, 2) else None
+    if pool is None:
+        engine = get_spell_engine()
+        return [check_spelling(text, engine) for text in texts]
+
+    if chunksize is None:
+        chunksize = int(settings.getenv("SPELLCHECK_POOL_CHUNKSIZE", "0"))
+    if chunksize <= 0:
+        chunksize = max(1, len(texts) // (pool_workers() * 4))
+    return list(pool.map(check_spelling, texts, chunksize=chunksize))
@@ -0,0 +1,393 @@
+"""
+SQLite resume store
+"""
+import json
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+
+from store import SECTIONS, ResumeStore, to_record
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS sequence (section TEXT PRIMARY KEY, next_id INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS section_version (section TEXT PRIMARY KEY, version INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS "user" (
+    id INTEGER PRIMARY KEY,
+    email_address TEXT,
+    body TEXT NOT NULL,
+    position REAL NOT NULL DEFAULT 0
+);
+CREATE UNIQUE INDEX IF NOT EXISTS user_email_address_unique ON "user" (email_address);
+CREATE TABLE IF NOT EXISTS experience (
+    id INTEGER PRIMARY KEY, body TEXT NOT NULL, position REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS education (
+    id INTEGER PRIMARY KEY, body TEXT NOT NULL, position REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS skill (
+    id INTEGER PRIMARY KEY, body TEXT NOT NULL, position REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS project (
+    id INTEGER PRIMARY KEY, body TEXT NOT NULL, position REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS project_technology (
+    project_id INTEGER NOT NULL REFERENCES project (id) ON DELETE CASCADE,
+    technology TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS project_technology_technology
+    ON project_technology (technology, project_id);
+CREATE INDEX IF NOT EXISTS project_technology_project ON project_technology (project_id);
+"""
+
+# Every statement is a constant string with placeholders, so sqlite3 compiles
+# each one once and reuses it from the connection's statement cache.
+SELECT_ALL = {section: f'SELECT id, body FROM "{section}" ORDER BY position'
+              for section in SECTIONS}
+SELECT_PAGE = {section: f'SELECT id, body FROM "{section}" WHERE position > ? '
+                        'ORDER BY position LIMIT ?'
+               for section in SECTIONS}
+SELECT_POSITION = {section: f'SELECT position FROM "{section}" WHERE id = ?'
+                   for section in SECTIONS}
+# The position of the item at an index, leaving out the item being moved
+SELECT_POSITION_AT = {section: f'SELECT position FROM "{section}" WHERE id != ? '
+                               'ORDER BY position LIMIT 1 OFFSET ?'
+                      for section in SECTIONS}
+SELECT_LAST_POSITION = {section: f'SELECT MAX(position) FROM "{section}"' for section in SECTIONS}
+SELECT_ORDER = {section: f'SELECT id FROM "{section}" ORDER BY position' for section in SECTIONS}
+UPDATE_POSITION = {section: f'UPDATE "{section}" SET position = ? WHERE id = ?'
+                   for section in SECTIONS}
+SELECT_BODY = {section: f'SELECT body FROM "{section}" WHERE id = ?' for section in SECTIONS}
+SELECT_COUNT = {section: f'SELECT COUNT(*) FROM "{section}"' for section in SECTIONS}
+INSERT = {section: f'INSERT INTO "{section}" (id, body, position) VALUES (?, ?, ?)'
+          for section in SECTIONS}
+UPDATE = {section: f'UPDATE "{section}" SET body = ? WHERE id = ?' for section in SECTIONS}
+DELETE = {section: f'DELETE FROM "{section}" WHERE id = ?' for section in SECTIONS}
+DELETE_ALL = {section: f'DELETE FROM "{section}"' for section in SECTIONS}
+INIT_SEQUENCE = {section: "INSERT OR IGNORE INTO sequence (section, next_id) "
+                          f'SELECT ?, COALESCE(MAX(id) + 1, 0) FROM "{section}"'
+                 for section in SECTIONS}
+INSERT["user"] = 'INSERT INTO "user" (id, body, position, email_address) VALUES (?, ?, ?, ?)'
+UPDATE["user"] = 'UPDATE "user" SET body = ?, email_address = ? WHERE id = ?'
+SELECT_USER_BY_EMAIL = 'SELECT id, body FROM "user" WHERE email_address = ?'
+SELECT_PROJECTS_BY_TECHNOLOGY = (
+    "SELECT project.id, project.body FROM project_technology "
+    "JOIN project ON project.id = project_technology.project_id "
+    "WHERE project_technology.technology = ? AND project.position > ? "
+    "ORDER BY project.position LIMIT ?"
+)
+INSERT_TECHNOLOGY = "INSERT INTO project_technology (project_id, technology) VALUES (?, ?)"
+DELETE_TECHNOLOGIES = "DELETE FROM project_technology WHERE project_id = ?"
+DELETE_ALL_TECHNOLOGIES = "DELETE FROM project_technology"
+INIT_VERSION = "INSERT OR IGNORE INTO section_version (section, version) VALUES (?, 0)"
+SELECT_VERSION = "SELECT version FROM section_version WHERE section = ?"
+BUMP_VERSION = "UPDATE section_version SET version = version + 1 WHERE section = ?"
+INIT_EPOCH = "INSERT OR IGNORE INTO meta (key, value) VALUES ('epoch', ?)"
+SELECT_EPOCH = "SELECT value FROM meta WHERE key = 'epoch'"
+SELECT_NEXT_ID = "SELECT next_id FROM sequence WHERE section = ?"
+UPDATE_NEXT_ID = "UPDATE sequence SET next_id = ? WHERE section = ?"
+
+
+def _add_position_column(connection, section):
+    """Orders the rows of a table created before items had positions by id"""
+    columns = [row[1] for row in connection.execute(f'PRAGMA table_info("{section}")')]
+    if "position" not in columns:
+        connection.execute(
+            f'ALTER TABLE "{section}" ADD COLUMN position REAL NOT NULL DEFAULT 0')
+        connection.execute(f'UPDATE "{section}" SET position = id')
+    connection.execute(
+        f'CREATE INDEX IF NOT EXISTS "{section}_position" ON "{section}" (position)')
+
+
+class SQLiteStore(ResumeStore):
+    """
+    Keeps each resume section in its own table, one JSON body per row keyed
+    by the item id. Ids come from a per-section sequence so they are never
+    reused, even after the newest item is deleted. Rows are listed by an
+    indexed position; an item inserted or moved between two others takes
+    the midpoint of their positions, so no other row is rewritten until
+    the midpoints run out of precision and the section is renumbered.
+
+    Users are uniquely indexed by email address and project technologies
+    live in an indexed join table, so those lookups don't scan the section.
+    One connection is shared between threads behind a lock. Section
+    versions are kept in the database and bumped in the same transaction as
+    the change they count.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False,
+                                           cached_statements=256)
+        self._lock = threading.RLock()
+        self._transaction_depth = 0
+        if path != ":memory:":
+            self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.execute("PRAGMA synchronous = NORMAL")
+        self._connection.execute("PRAGMA foreign_keys = ON")
+        # Every statement of the schema is IF NOT EXISTS, so processes
+        # opening the database at the same time can all run it
+        self._connection.executescript(SCHEMA)
+        with self._writing():
+            for section in SECTIONS:
+                _add_position_column(self._connection, section)
+                self._connection.execute(INIT_SEQUENCE[section], (section,))
+                self._connection.execute(INIT_VERSION, (section,))
+            # The epoch lives with the versions, so every process sharing the
+            # database hands out the same tags
+            self._connection.execute(INIT_EPOCH, (uuid.uuid4().hex[:12],))
+            self.epoch = self._connection.execute(SELECT_EPOCH).fetchone()[0]
+
+    @classmethod
+    def open(cls, path, seed):
+        """Opens the database at path, loading `seed` into it the first time"""
+        store = cls(path)
+        with store._writing():
+            seeded = store._connection.execute(
+                "SELECT value FROM meta WHERE key = 'seeded'").fetchone()
+            if not seeded:
+                for section in SECTIONS:
+                    items = (seed or {}).get(section, [])
+                    ids = store._allocate_ids(section, len(items))
+                    for item_id, item in zip(ids, items):
+                        store._insert(section, item_id, item, item_id)
+                store._connection.execute("INSERT INTO meta (key, value) VALUES ('seeded', '1')")
+        return store
+
+    @contextmanager
+    def _writing(self):
+        """
+        Runs the block in a transaction of its own, or in the open
+        transaction(). Its reads are then made under the write lock, so
+        another process sharing the database can't change what was read
+        before the block writes.
+        """
+        with self.transaction():
+            yield
+
+    def _bump(self, section):
+        self._connection.execute(BUMP_VERSION, (section,))
+
+    def _allocate_ids(self, section, count):
+        first = self._connection.execute(SELECT_NEXT_ID, (section,)).fetchone()[0]
+        self._connection.execute(UPDATE_NEXT_ID, (first + count, section))
+        return list(range(first, first + count))
+
+    def _insert(self, section, item_id, item, position):
+        item = to_record(item)
+        body = json.dumps(item)
+        if section == "user":
+            self._connection.execute(INSERT[section], (item_id, body, position,
+                                                       item.get("email_address")))
+        else:
+            self._connection.execute(INSERT[section], (item_id, body, position))
+        if section == "project":
+            self._index_technologies(item_id, item)
+
+    def _write_body(self, section, item_id, item):
+        body = json.dumps(item)
+        if section == "user":
+            self._connection.execute(UPDATE[section], (body, item.get("email_address"), item_id))
+        else:
+            self._connection.execute(UPDATE[section], (body, item_id))
+        if section == "project":
+            self._connection.execute(DELETE_TECHNOLOGIES, (item_id,))
+            self._index_technologies(item_id, item)
+
+    def _index_technologies(self, project_id, item):
+        technologies = item.get("technologies") or []
+        self._connection.executemany(INSERT_TECHNOLOGY,
+                                     [(project_id, technology) for technology in technologies])
+
+    def _last_position(self, section):
+        last = self._connection.execute(SELECT_LAST_POSITION[section]).fetchone()[0]
+        return -1 if last is None else last
+
+    def _position_at(self, section, index, moving=-1):
+        """Returns a position that puts an item at `index` of its section"""
+        def position(offset):
+            row = self._connection.execute(SELECT_POSITION_AT[section],
+                                           (moving, offset)).fetchone()
+            return None if row is None else row[0]
+
+        following = position(index)
+        if following is None:
+            return self._last_position(section) + 1
+        if index == 0:
+            return following - 1
+        previous = position(index - 1)
+        middle = (previous + following) / 2
+        if previous < middle < following:
+            return middle
+        self._renumber(section)
+        return self._position_at(section, index, moving)
+
+    def _renumber(self, section):
+        ids = [row[0] for row in self._connection.execute(SELECT_ORDER[section])]
+        self._connection.executemany(UPDATE_POSITION[section], enumerate(ids))
+
+    def _body(self, section, item_id):
+        row = self._connection.execute(SELECT_BODY[section], (item_id,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def _start_position(self, section, after):
+        """Returns the position a page after the item `after` starts from; KeyError if none"""
+        if after is None:
+            return float("-inf")
+        row = self._connection.execute(SELECT_POSITION[section], (after,)).fetchone()
+        if row is None:
+            raise KeyError(after)
+        return row[0]
+
+    def entries(self, section, after=None, limit=None):
+        with self._lock:
+            if after is None and limit is None:
+                rows = self._connection.execute(SELECT_ALL[section]).fetchall()
+            else:
+                rows = self._connection.execute(SELECT_PAGE[section], (
+                    self._start_position(section, after),
+                    -1 if limit is None else limit)).fetchall()
+        return [(item_id, json.loads(body)) for item_id, body in rows]
+
+    def get(self, section, item_id):
+        with self._lock:
+            return self._body(section, item_id)
+
+    def count(self, section):
+        with self._lock:
+            return self._connection.execute(SELECT_COUNT[section]).fetchone()[0]
+
+    def find_user(self, email):
+        with self._lock:
+            row = self._connection.execute(SELECT_USER_BY_EMAIL, (email,)).fetchone()
+        return json.loads(row[1]) if row else None
+
+    def add_user(self, user):
+        try:
+            with self._writing():
+                self._insert("user", self._allocate_ids("user", 1)[0], user,
+                             self._last_position("user") + 1)
+                self._bump("user")
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    def put_user(self, user):
+        user = to_record(user)
+        with self._writing():
+            row = self._connection.execute(SELECT_USER_BY_EMAIL,
+                                           (user["email_address"],)).fetchone()
+            if row is None:
+                return False
+            self._write_body("user", row[0], user)
+            self._bump("user")
+        return True
+
+    def projects_with_technology(self, technology, after=None, limit=None):
+        with self._lock:
+            rows = self._connection.execute(SELECT_PROJECTS_BY_TECHNOLOGY, (
+                technology, self._start_position("project", after),
+                -1 if limit is None else limit)).fetchall()
+        return [(project_id, json.loads(body)) for project_id, body in rows]
+
+    def append(self, section, item):
+        with self._writing():
+            item_id = self._allocate_ids(section, 1)[0]
+            self._insert(section, item_id, item, self._last_position(section) + 1)
+            self._bump(section)
+        return item_id
+
+    def insert(self, section, index, item):
+        with self._writing():
+            item_id = self._allocate_ids(section, 1)[0]
+            self._insert(section, item_id, item, self._position_at(section, index))
+            self._bump(section)
+        return item_id
+
+    def move(self, section, item_id, index):
+        with self._writing():
+            if self._body(section, item_id) is None:
+                return False
+            self._connection.execute(UPDATE_POSITION[section], (
+                self._position_at(section, index, item_id), item_id))
+            self._bump(section)
+        return True
+
+    def set_item(self, section, item_id, item):
+        with self._writing():
+            if self._body(section, item_id) is None:
+                return False
+            self._write_body(section, item_id, to_record(item))
+            self._bump(section)
+        return True
+
+    def update(self, section, item_id, fields):
+        with self._writing():
+            item = self._body(section, item_id)
+            if item is None:
+                return False
+            self._write_body(section, item_id, {**item, **fields})
+            self._bump(section)
+        return True
+
+    def delete(self, section, item_id):
+        with self._writing():
+            deleted = self._connection.execute(DELETE[section], (item_id,)).rowcount > 0
+            if deleted:
+                self._bump(section)
+        return deleted
+
+    def replace(self, section, items):
+        with self._writing():
+            self._connection.execute(DELETE_ALL[section])
+            if section == "project":
+                self._connection.execute(DELETE_ALL_TECHNOLOGIES)
+            ids = self._allocate_ids(section, len(items))
+            for position, (item_id, item) in enumerate(zip(ids, items)):
+                self._insert(section, item_id, item, position)
+            self._bump(section)
+        return ids
+
+    def version(self, section):
+        with self._lock:
+            return self._connection.execute(SELECT_VERSION, (section,)).fetchone()[0]
+
+    @contextmanager
+    def transaction(self):
+        # BEGIN IMMEDIATE also keeps out writers in other processes. Writes
+        # in the block join it and are committed together, or rolled back
+        # if the block raises.
+        with self._lock:
+            if self._transaction_depth:
+                self._transaction_depth += 1
+                try:
+                    yield
+                finally:
+                    self._transaction_depth -= 1
+                return
+            self._connection.execute("BEGIN IMMEDIATE")
+            self._transaction_depth = 1
+            try:
+                yield
+            except BaseException:
+                self._connection.rollback()
+                raise
+            else:
+                self._connection.commit()
+            finally:
+                self._transaction_depth = 0
+
+    def footprint(self):
+        """The page cache, which holds at most the database and its size limit"""
+        with self._lock:
+            page_size, pages, cache_size = (
+                self._connection.execute(f"PRAGMA {name}").fetchone()[0]
+                for name in ("page_size", "page_count", "cache_size"))
+        # A negative cache_size is a limit in KiB rather than in pages
+        limit = -cache_size * 1024 if cache_size < 0 else cache_size * page_size
+        return min(pages * page_size, limit)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,505 @@
+"""
+In-memory resume store with optional journal persistence
+"""
+import copy
+import uuid
+from itertools import islice
+import json
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from dataclasses import asdict, is_dataclass
+
+from journal import (Journal, apply_mutation, load_state, recover, remove_segments,
+                     write_snapshot)
+
+DEFAULT_COMPACT_RECORDS = 10000
+SECTIONS = ("user", "experience", "education", "skill", "project")
+
+
+def to_record(item):
+    """Returns the plain-dict form of an item, which is what the store keeps"""
+    if is_dataclass(item):
+        return asdict(item)
+    return item
+
+
+class ResumeStore(ABC):  # pylint: disable=too-many-public-methods
+    """
+    Storage backend interface used by the routes. Items are plain dicts,
+    kept in list order and addressed by integer ids that stay valid across
+    deletes and moves and are never reused. Positions passed to insert()
+    and move() count from 0 and are capped at the end of the list.
+
+    Each section has a version that every change to it increases. Together
+    with the store's epoch, which differs whenever the versions could start
+    over, it names one state of the section.
+    """
+
+    epoch = ""
+
+    @abstractmethod
+    def entries(self, section, after=None, limit=None):
+        """
+        Returns (id, item) for the items of a section in order, starting
+        after the item with id `after` and stopping after `limit` items.
+        Raises KeyError when there is no item with id `after`.
+        """
+
+    @abstractmethod
+    def get(self, section, item_id):
+        """Returns the item with this id, or None"""
+
+    @abstractmethod
+    def count(self, section):
+        """Returns the number of items in a section"""
+
+    @abstractmethod
+    def find_user(self, email):
+        """Returns the user with this email address, or None"""
+
+    @abstractmethod
+    def add_user(self, user):
+        """Adds a user unless one with the same email address exists; returns success"""
+
+    @abstractmethod
+    def put_user(self, user):
+        """Replaces the user with the same email address; False if there is none"""
+
+    @abstractmethod
+    def projects_with_technology(self, technology, after=None, limit=None):
+        """
+        Returns (id, project) for the projects using a technology in list
+        order, paged like entries. Raises KeyError when there is no project
+        with id `after`.
+        """
+
+    @abstractmethod
+    def version(self, section):
+        """Returns the current version of a section"""
+
+    @abstractmethod
+    def footprint(self):
+        """Returns an estimate of the memory the store holds, in bytes"""
+
+    @abstractmethod
+    def transaction(self):
+        """
+        Context manager that keeps other writers out, so a version read in
+        the block still holds when the block writes. The writes made in the
+        block are committed together, or undone if the block raises.
+        """
+
+    @abstractmethod
+    def append(self, section, item):
+        """Adds an item at the end of a section and returns its new id"""
+
+    @abstractmethod
+    def insert(self, section, index, item):
+        """Adds an item at a position in a section and returns its new id"""
+
+    @abstractmethod
+    def move(self, section, item_id, index):
+        """Moves an item to a position in its section; returns False if there is none"""
+
+    @abstractmethod
+    def set_item(self, section, item_id, item):
+        """Replaces an item; returns False if there is no item with this id"""
+
+    @abstractmethod
+    def update(self, section, item_id, fields):
+        """Updates some fields of an item; returns False if there is none"""
+
+    @abstractmethod
+    def delete(self, section, item_id):
+        """Removes an item; returns False if there is none"""
+
+    @abstractmethod
+    def replace(self, section, items):
+        """Replaces a whole section and returns the ids given to the new items"""
+
+    def etag(self, section):
+        """Returns the entity tag of the current state of a section"""
+        return f"{self.epoch}.{self.version(section)}"
+
+    def scan(self, section, page_size=500):
+        """
+        Yields (id, item) for every item of a section, reading a page at a
+        time so the section is never copied whole. The scan is not a
+        snapshot: each page starts after the last item of the previous one
+        that still exists, and the scan ends if none of them do.
+        """
+        cursors = [None]
+        while True:
+            for after in cursors:
+                try:
+                    page = self.entries(section, after, page_size)
+                    break
+                except KeyError:
+                    continue
+            else:
+                return
+            yield from page
+            if len(page) < page_size:
+                return
+            cursors = [item_id for item_id, _ in reversed(page)]
+
+    def list(self, section):
+        """Returns every item of a section, in order"""
+        return [item for _, item in self.entries(section)]
+
+    def export(self):
+        """Returns every section as a dict of lists"""
+        return {section: self.list(section) for section in SECTIONS}
+
+    def close(self):
+        """Releases the resources held by the store"""
+
+
+def _email_index(state):
+    """Maps each email address to the id of the first user with it"""
+    emails = {}
+    for user_id, user in state["sections"].get("user", {}).items():
+        emails.setdefault(user.get("email_address"), user_id)
+    return emails
+
+
+def _encoded_size(item):
+    return len(json.dumps(item))
+
+
+def _size_change(section, record):
+    """
+    Returns how much a record, not yet applied to `section`, changes the
+    encoded size of its items
+    """
+    operation = record["op"]
+    if operation in ("append", "insert"):
+        return _encoded_size(record["item"])
+    if operation == "set":
+        return _encoded_size(record["item"]) - _encoded_size(section[record["id"]])
+    if operation == "update":
+        item = section[record["id"]]
+        return _encoded_size({**item, **record["fields"]}) - _encoded_size(item)
+    if operation == "delete":
+        return -_encoded_size(section[record["id"]])
+    if operation == "replace":
+        return (sum(_encoded_size(item) for item in record["items"])
+                - sum(_encoded_size(item) for item in section.values()))
+    return 0
+
+
+class MemoryStore(ResumeStore):  # pylint: disable=too-many-instance-attributes
+    """
+    Keeps each resume section as a dict of id -> item in list order.
+
+    Readers take no lock: they read the last published snapshot, whose
+    dicts never change once published. Writers are serialized by a lock.
+    The first change a transaction makes to a section copies that section,
+    and the transaction publishes its state with one assignment when it
+    commits. A transaction that raises is dropped and leaves nothing
+    behind. While a transaction is open, its own thread reads its changes.
+    Every mutation outside a transaction runs as a transaction of its own.
+
+    When a journal is attached, the records of each commit are appended to
+    it, as one batch record when there are several, and the call returns
+    only once they are durable. A background thread writes a new snapshot
+    after `compact_records` journal records, so the journal stays short.
+    """
+
+    def __init__(self, data, journal=None, compact_records=DEFAULT_COMPACT_RECORDS):
+        state = load_state(data or {})
+        # The published state with its email -> user id index, and the ids
+        # of each section in order, cached as they are asked for
+        self._snapshot = {"state": state, "emails": _email_index(state), "order": {},
+                          "bytes": sum(_encoded_size(item)
+                                       for section in state["sections"].values()
+                                       for item in section.values())}
+        # The unpublished copy of the open transaction
+        self._working = None
+        # A new epoch per instance keeps tags handed out by an earlier process,
+        # whose unjournaled edits are gone, from matching
+        self.epoch = uuid.uuid4().hex[:12]
+        self.journal = journal
+        self.compact_records = compact_records
+        self._lock = threading.RLock()
+        self._compact_needed = threading.Event()
+        self._closed = False
+        if journal is not None:
+            threading.Thread(target=self._compact_loop, daemon=True,
+                             name="store-compactor").start()
+
+    @classmethod
+    def open(cls, directory, seed, compact_records=DEFAULT_COMPACT_RECORDS):
+        """
+        Recovers a store from the snapshot and journal in directory, seeding
+        it with a copy of `seed`, if any, the first time
+        """
+        state, seq, segment = recover(directory, copy.deepcopy(seed or {}))
+        return cls(state, Journal(directory, segment, last_seq=seq), compact_records)
+
+    def _view(self):
+        """
+        Returns the snapshot a read sees: the published one, or the open
+        transaction's copy when the calling thread is the one writing it
+        """
+        working = self._working
+        if working is not None and working["thread"] == threading.get_ident():
+            return working
+        return self._snapshot
+
+    def _section(self, section, view=None):
+        return (view or self._view())["state"]["sections"].get(section, {})
+
+    def _write(self, record):
+        """
+        Applies a record to the open transaction's copy of the state; the
+        caller must hold the lock. A section is copied before its first
+        change, so the published one is left as it was. Items are replaced,
+        never changed in place, so a shallow copy is enough.
+        """
+        working = self._working
+        name = record["section"]
+        if name not in working["copied"]:
+            sections = working["state"]["sections"]
+            sections[name] = dict(sections.get(name, {}))
+            working["copied"].add(name)
+        working["bytes"] += _size_change(working["state"]["sections"][name], record)
+        apply_mutation(working["state"], record)
+        working["order"].pop(name, None)
+        if name == "user":
+            self._index_user(working, record)
+        working["records"].append(record)
+
+    def _commit(self):
+        """
+        Journals the records of the open transaction and publishes its
+        state; the caller must hold the lock. Returns the sequence number to
+        wait for.
+        """
+        working = self._working
+        records = working["records"]
+        if not records:
+            return None
+        seq = None
+        if self.journal is not None:
+            seq = self.journal.write(
+                records[0] if len(records) == 1 else {"op": "batch", "records": records})
+        # Sections the transaction left alone keep their cached order
+        order = dict(self._snapshot["order"])
+        for name in working["copied"]:
+            order.pop(name, None)
+        order.update(working["order"])
+        self._snapshot = {"state": working["state"], "emails": working["emails"],
+                          "order": order, "bytes": working["bytes"]}
+        return seq
+
+    def _wait(self, seq):
+        """Waits, outside the lock, until a journaled record is durable"""
+        if seq is not None:
+            self.journal.wait(seq)
+            if self.journal.records_in_segment >= self.compact_records:
+                self._compact_needed.set()
+
+    def _next_ids(self, section, count):
+        first = self._working["state"]["next_ids"].get(section, 0)
+        return list(range(first, first + count))
+
+    @staticmethod
+    def _index_user(working, record):
+        """
+        Keeps the email -> id index in step with a user mutation, copying
+        the published index only when the mutation changes it
+        """
+        operation = record["op"]
+        address = record.get("item", {}).get("email_address")
+        if operation == "append":
+            if address not in working["emails"]:
+                if "emails" not in working["copied"]:
+                    working["emails"] = dict(working["emails"])
+                    working["copied"].add("emails")
+                working["emails"][address] = record["id"]
+        elif operation != "set" or working["emails"].get(address) != record["id"]:
+            # Other edits may change or remove an address.
+            working["emails"] = _email_index(working["state"])
+            working["copied"].add("emails")
+
+    @staticmethod
+    def _order(view, section):
+        """
+        Returns the ids of a section in list order and the position of each,
+        cached in the snapshot, which doesn't change
+        """
+        order = view["order"].get(section)
+        if order is None:
+            ids = list(view["state"]["sections"].get(section, {}))
+            order = (ids, {item_id: index for index, item_id in enumerate(ids)})
+            view["order"][section] = order
+        return order
+
+    def entries(self, section, after=None, limit=None):
+        view = self._view()
+        items = self._section(section, view)
+        if after is None and limit is None:
+            return list(items.items())
+        # A page is a slice of the cached id list, so neither the section
+        # nor the items before the cursor are copied.
+        ids, positions = self._order(view, section)
+        start = 0 if after is None else positions[after] + 1
+        stop = len(ids) if limit is None else start + limit
+        page = ((item_id, items.get(item_id)) for item_id in ids[start:stop])
+        return [(item_id, item) for item_id, item in page if item is not None]
+
+    def get(self, section, item_id):
+        return self._section(section).get(item_id)
+
+    def count(self, section):
+        return len(self._section(section))
+
+    def find_user(self, email):
+        view = self._view()
+        user_id = view["emails"].get(email)
+        return None if user_id is None else self._section("user", view)[user_id]
+
+    def add_user(self, user):
+        with self.transaction():
+            if user["email_address"] in self._working["emails"]:
+                return False
+            self._write({"op": "append", "section": "user",
+                         "id": self._next_ids("user", 1)[0], "item": to_record(user)})
+        return True
+
+    def put_user(self, user):
+        with self.transaction():
+            user_id = self._working["emails"].get(user["email_address"])
+            if user_id is None:
+                return False
+            self._write({"op": "set", "section": "user", "id": user_id, "item": to_record(user)})
+        return True
+
+    def version(self, section):
+        return self._view()["state"]["versions"].get(section, 0)
+
+    def footprint(self):
+        """
+        The encoded size of the items, which is what the state grows with.
+        Each write adjusts it by the items it adds and drops, so reading it
+        costs nothing.
+        """
+        return self._snapshot["bytes"]
+
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            if self._working is not None:
+                yield
+                return
+            state = self._snapshot["state"]
+            self._working = {
+                "state": {"sections": dict(state["sections"]),
+                          "next_ids": dict(state["next_ids"]),
+                          "versions": dict(state["versions"])},
+                "emails": self._snapshot["emails"], "order": {},
+                "bytes": self._snapshot["bytes"],
+                # The sections, and "emails" for the index, copied so far
+                "copied": set(),
+                "records": [], "thread": threading.get_ident(),
+            }
+            seq = None
+            try:
+                yield
+                seq = self._commit()
+            finally:
+                self._working = None
+        self._wait(seq)
+
+    def projects_with_technology(self, technology, after=None, limit=None):
+        view = self._view()
+        projects = self._section("project", view)
+        candidates = projects.items()
+        if after is not None:
+            # Pages follow the list order, like entries()
+            ids, positions = self._order(view, "project")
+            candidates = ((project_id, projects[project_id])
+                          for project_id in ids[positions[after] + 1:])
+        matches = ((project_id, project) for project_id, project in candidates
+                   if technology in (project.get("technologies") or []))
+        return list(islice(matches, limit))
+
+    def append(self, section, item):
+        with self.transaction():
+            item_id = self._next_ids(section, 1)[0]
+            self._write({"op": "append", "section": section, "id": item_id,
+                         "item": to_record(item)})
+        return item_id
+
+    def insert(self, section, index, item):
+        with self.transaction():
+            item_id = self._next_ids(section, 1)[0]
+            self._write({"op": "insert", "section": section, "id": item_id,
+                         "index": index, "item": to_record(item)})
+        return item_id
+
+    def move(self, section, item_id, index):
+        return self._mutate_existing(section, item_id, {
+            "op": "move", "section": section, "id": item_id, "index": index})
+
+    def _mutate_existing(self, section, item_id, record):
+        with self.transaction():
+            if item_id not in self._section(section):
+                return False
+            self._write(record)
+        return True
+
+    def set_item(self, section, item_id, item):
+        return self._mutate_existing(section, item_id, {
+            "op": "set", "section": section, "id": item_id, "item": to_record(item)})
+
+    def update(self, section, item_id, fields):
+        return self._mutate_existing(section, item_id, {
+            "op": "update", "section": section, "id": item_id, "fields": fields})
+
+    def delete(self, section, item_id):
+        return self._mutate_existing(section, item_id, {
+            "op": "delete", "section": section, "id": item_id})
+
+    def replace(self, section, items):
+        items = [to_record(item) for item in items]
+        with self.transaction():
+            ids = self._next_ids(section, len(items))
+            self._write({"op": "replace", "section": section, "ids": ids, "items": items})
+        return ids
+
+    def compact(self):
+        """
+        Writes a snapshot of the current state and drops the journal segments
+        it covers. A published state never changes, so it is serialised
+        without blocking writers.
+        """
+        if self.journal is None:
+            return
+        with self._lock:
+            if self._closed:
+                return
+            state = self._snapshot["state"]
+            seq = self.journal.last_seq
+            segment = self.journal.rotate()
+        write_snapshot(self.journal.directory, json.dumps(state, separators=(",", ":")),
+                       segment, seq)
+        remove_segments(self.journal.directory, segment)
+
+    def _compact_loop(self):
+        while True:
+            self._compact_needed.wait()
+            self._compact_needed.clear()
+            if self._closed:
+                return
+            self.compact()
+
+    def close(self):
+        """Flushes and closes the journal"""
+        if self.journal is not None:
+            with self._lock:
+                self._closed = True
+                self.journal.close()
+            self._compact_needed.set()
@@ -0,0 +1,527 @@
+"""
+Suggestion backends, result cache and background jobs
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import settings
+
+DEFAULT_MODEL = "gemini-pro"
+DEFAULT_CACHE_SIZE = 1024
+DEFAULT_CACHE_TTL = 7 * 24 * 60 * 60
+DEFAULT_MAX_CONCURRENCY = 4
+DEFAULT_MAX_PENDING = 64
+FINISHED = ("done", "error")
+
+JOB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS suggestion_job (
+    id TEXT PRIMARY KEY, status TEXT NOT NULL, suggestion TEXT, error TEXT
+);
+"""
+INSERT_JOB = "INSERT INTO suggestion_job (id, status) VALUES (?, 'pending')"
+UPDATE_JOB = "UPDATE suggestion_job SET status = ?, suggestion = ?, error = ? WHERE id = ?"
+SELECT_JOB = "SELECT status, suggestion, error FROM suggestion_job WHERE id = ?"
+# Drops the oldest finished jobs while more than ? jobs are kept
+EVICT_JOBS = (
+    "DELETE FROM suggestion_job WHERE rowid IN ("
+    "SELECT rowid FROM suggestion_job WHERE status IN ('done', 'error') ORDER BY rowid "
+    "LIMIT max(0, (SELECT COUNT(*) FROM suggestion_job) - ?))"
+)
+
+_LOCK = threading.Lock()
+
+
+PROMPT_TEMPLATES = {
+    "education": "Improve the following education experience description for resume: "
+                 "{description}",
+    "experience": "Improve the following professional experience description for resume: "
+                  "{description}",
+}
+BATCH_PROMPT_TEMPLATE = (
+    "Answer each of the following {count} numbered requests. Reply with only a JSON array "
+    "of {count} strings holding the answers in the same order.\n\n{requests}"
+)
+
+
+def build_prompt(description, description_type):
+    """Returns the prompt for one description, or raises ValueError for an unknown type"""
+    template = PROMPT_TEMPLATES.get(description_type)
+    if template is None:
+        raise ValueError(f"Unsupported type: {description_type}")
+    return template.format(description=description)
+
+
+def build_batch_prompt(prompts):
+    """Combines several prompts into one request asking for a JSON array of answers"""
+    requests = "\n".join(f"{index}. {json.dumps(prompt)}"
+                          for index, prompt in enumerate(prompts, start=1))
+    return BATCH_PROMPT_TEMPLATE.format(count=len(prompts), requests=requests)
+
+
+def parse_batch_response(text, count):
+    """
+    Splits a batch answer into one entry per prompt. Entries the model left
+    out or did not answer with a string are returned as ValueError instances.
+    """
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.strip("`").removeprefix("json").strip()
+    answers = json.loads(text)
+    if not isinstance(answers, list):
+        raise ValueError("Batch response is not a JSON array")
+    return [
+        answers[index] if index < len(answers) and isinstance(answers[index], str)
+        else ValueError("No suggestion returned for this item")
+        for index in range(count)
+    ]
+
+
+_GENAI = None
+
+
+def _genai():
+    """Imports and configures google.generativeai on first use"""
+    global _GENAI  # pylint: disable=global-statement
+    with _LOCK:
+        if _GENAI is None:
+            import google.generativeai as genai  # pylint: disable=import-outside-toplevel
+            genai.configure(api_key=settings.getenv("GOOGLE_API_KEY"))
+            _GENAI = genai
+        return _GENAI
+
+
+class GeminiBackend:
+    """
+    Generates suggestions with a Gemini model. The model client is built
+    once and reused, so every call shares its underlying connection.
+    """
+
+    def __init__(self, model_name=DEFAULT_MODEL):
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        """The shared GenerativeModel client"""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = _genai().GenerativeModel(self.model_name)
+        return self._model
+
+    def generate(self, prompt):
+        """Returns the generated text for a prompt"""
+        response = self.model.generate_content(prompt)
+        return response.text
+
+    def generate_batch(self, prompts):
+        """
+        Answers several prompts with a single generation call. When the reply
+        can't be split into answers, each prompt is asked on its own, so one
+        bad reply doesn't fail every item of the batch.
+        """
+        if len(prompts) == 1:
+            return [self.generate(prompts[0])]
+        try:
+            return parse_batch_response(self.generate(build_batch_prompt(prompts)), len(prompts))
+        except ValueError:
+            return [self._generate_or_error(prompt) for prompt in prompts]
+
+    def _generate_or_error(self, prompt):
+        """Returns the generated text for a prompt, or the exception raised"""
+        try:
+            return self.generate(prompt)
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            return error
+
+
+class StubBackend:
+    """
+    Deterministic local generator, used to test and benchmark offline
+    """
+
+    def __init__(self, delay=0.0, model_name="stub"):
+        self.model_name = model_name
+        self.delay = delay
+        self.calls = 0
+
+    def generate(self, prompt):
+        """Echoes the prompt back after the configured delay"""
+        return self.generate_batch([prompt])[0]
+
+    def generate_batch(self, prompts):
+        """Echoes every prompt back in one simulated round trip"""
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        return [f"Suggested: {prompt}" for prompt in prompts]
+
+
+class SuggestionCache:
+    """
+    Two-tier suggestion cache with TTL expiry.
+
+    Entries are addressed by a hash of the suggestion type, the model name
+    and the whitespace-normalised description. The in-memory tier is a
+    bounded LRU; the optional on-disk tier keeps one JSON file per entry in
+    `directory`, so cached suggestions survive restarts.
+    """
+
+    def __init__(self, max_entries=DEFAULT_CACHE_SIZE, ttl=DEFAULT_CACHE_TTL,
+                 directory=None, clock=time.time):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.directory = directory
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    @staticmethod
+    def key(description, description_type, model_name):
+        """Returns the content address of a suggestion request"""
+        normalized = " ".join(description.split())
+        material = "\0".join([description_type.strip().lower(), model_name, normalized])
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _expired(self, created):
+        return bool(self.ttl) and self._clock() - created > self.ttl
+
+    def get(self, key):
+        """Returns the cached suggestion for key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if not self._expired(entry[0]):
+                    self._entries.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    return entry[1]
+                del self._entries[key]
+
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            self._counters["disk_hits"] += 1
+            self._remember(key, entry)
+        return entry[1]
+
+    def set(self, key, value):
+        """Stores a suggestion in both tiers"""
+        entry = (self._clock(), value)
+        with self._lock:
+            self._remember(key, entry)
+        self._write_disk(key, entry)
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _read_disk(self, key):
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                stored = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if self._expired(stored["created"]):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return stored["created"], stored["value"]
+
+    def _write_disk(self, key, entry):
+        if not self.directory:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump({"created": entry[0], "value": entry[1]}, file)
+        os.replace(temp_path, path)
+
+    def stats(self):
+        """Returns the cache hit/miss counters and current size"""
+        with self._lock:
+            return {**self._counters, "size": len(self._entries), "max_size": self.max_entries}
+
+    def clear(self):
+        """Drops the in-memory tier and resets the counters"""
+        with self._lock:
+            self._entries.clear()
+            self._counters = dict.fromkeys(self._counters, 0)
+
+
+class JobQueueFull(Exception):
+    """
+    Raised when too many suggestion jobs are already waiting
+    """
+
+
+def percentile(values, fraction):
+    """Returns the value below which `fraction` of the samples fall, or 0.0"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class MemoryJobBoard:
+    """
+    Job states kept in this process's memory, in submission order
+    """
+
+    def __init__(self):
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, job_id):
+        """Records a new pending job"""
+        with self._lock:
+            self._jobs[job_id] = {"id": job_id, "status": "pending"}
+
+    def update(self, job_id, changes):
+        """Sets the status of a job, with its suggestion or error once it is finished"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(changes)
+
+    def get(self, job_id):
+        """Returns the state of a job, or None if it is unknown"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return None if job is None else dict(job)
+
+    def evict(self, max_jobs):
+        """Drops the oldest finished jobs while more than `max_jobs` are kept"""
+        with self._lock:
+            excess = len(self._jobs) - max_jobs
+            if excess <= 0:
+                return
+            finished = [job_id for job_id, job in self._jobs.items() if job["status"] in FINISHED]
+            for job_id in finished[:excess]:
+                del self._jobs[job_id]
+
+
+class SQLiteJobBoard:
+    """
+    Job states kept in a SQLite database, so that every server process
+    sharing the database can answer the poll of a job another one runs
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.executescript(JOB_SCHEMA)
+
+    def add(self, job_id):
+        """Records a new pending job"""
+        with self._lock:
+            self._connection.execute(INSERT_JOB, (job_id,))
+
+    def update(self, job_id, changes):
+        """Sets the status of a job, with its suggestion or error once it is finished"""
+        with self._lock:
+            self._connection.execute(UPDATE_JOB, (changes["status"], changes.get("suggestion"),
+                                                  changes.get("error"), job_id))
+
+    def get(self, job_id):
+        """Returns the state of a job, or None if it is unknown"""
+        with self._lock:
+            row = self._connection.execute(SELECT_JOB, (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = {"id": job_id, "status": row[0]}
+        if row[0] == "done":
+            job["suggestion"] = row[1]
+        elif row[0] == "error":
+            job["error"] = row[2]
+        return job
+
+    def evict(self, max_jobs):
+        """Drops the oldest finished jobs while more than `max_jobs` are kept"""
+        with self._lock:
+            self._connection.execute(EVICT_JOBS, (max_jobs,))
+
+
+def open_job_board():
+    """
+    Returns where suggestion job states are kept: the SQLite database at
+    SUGGESTION_JOBS_DB, by default the resume database when
+    RESUME_BACKEND=sqlite, so any server process can answer a poll;
+    otherwise this process's memory
+    """
+    path = settings.getenv("SUGGESTION_JOBS_DB")
+    if not path and settings.getenv("RESUME_BACKEND", "memory") == "sqlite":
+        path = settings.getenv("RESUME_DB_PATH", "data/resume.db")
+    return SQLiteJobBoard(path) if path else MemoryJobBoard()
+
+
+class SuggestionJobs:
+    """
+    Runs suggestion generations in the background.
+
+    At most `max_workers` generations run at once and at most `max_pending`
+    wait for a worker; further submissions raise JobQueueFull. Job states
+    live on `board`; finished jobs are kept for polling until `max_finished`
+    newer ones push them out.
+    """
+
+    def __init__(self, max_workers=DEFAULT_MAX_CONCURRENCY, max_pending=DEFAULT_MAX_PENDING,
+                 max_finished=1024, board=None):
+        self.limits = {"max_workers": max_workers, "max_pending": max_pending,
+                       "max_finished": max_finished}
+        self._board = board or MemoryJobBoard()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="suggestion")
+        # Submission times of the jobs this process runs, for the latency samples
+        self._submitted = {}
+        self._lock = threading.Lock()
+        self._counters = {"pending": 0, "running": 0, "completed": 0, "failed": 0, "rejected": 0}
+        self._samples = {"wait": deque(maxlen=1000), "latency": deque(maxlen=1000)}
+
+    def submit(self, func, *args):
+        """Queues func(*args) and returns the new job id"""
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            if self._counters["pending"] >= self.limits["max_pending"]:
+                self._counters["rejected"] += 1
+                raise JobQueueFull()
+            self._counters["pending"] += 1
+            self._submitted[job_id] = time.monotonic()
+        try:
+            self._board.add(job_id)
+        except Exception:
+            with self._lock:
+                self._counters["pending"] -= 1
+                del self._submitted[job_id]
+            raise
+        self._executor.submit(self._run, job_id, func, args)
+        return job_id
+
+    def _run(self, job_id, func, args):
+        with self._lock:
+            self._counters["pending"] -= 1
+            self._counters["running"] += 1
+            self._samples["wait"].append(time.monotonic() - self._submitted[job_id])
+        self._board.update(job_id, {"status": "running"})
+        try:
+            result = {"status": "done", "suggestion": func(*args)}
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            result = {"status": "error", "error": str(error)}
+
+        self._board.update(job_id, result)
+        with self._lock:
+            self._counters["running"] -= 1
+            self._counters["completed" if result["status"] == "done" else "failed"] += 1
+            self._samples["latency"].append(time.monotonic() - self._submitted.pop(job_id))
+        self._board.evict(self.limits["max_finished"])
+
+    def get(self, job_id):
+        """Returns a public view of a job, or None if it is unknown"""
+        return self._board.get(job_id)
+
+    def stats(self):
+        """Returns queue depth, job counters and latency percentiles in seconds"""
+        with self._lock:
+            return {
+                **self._counters,
+                "queue_depth": self._counters["pending"],
+                "max_workers": self.limits["max_workers"],
+                "max_pending": self.limits["max_pending"],
+                "wait_p50": percentile(self._samples["wait"], 0.5),
+                "latency_p50": percentile(self._samples["latency"], 0.5),
+                "latency_p99": percentile(self._samples["latency"], 0.99),
+            }
+
+    def shutdown(self):
+        """Waits for running jobs and stops the workers"""
+        self._executor.shutdown(wait=True)
+
+
+_BACKEND = None
+_CACHE = None
+_JOBS = None
+
+
+def get_suggestion_backend():
+    """Returns the configured backend: SUGGESTION_BACKEND=gemini (default) or stub"""
+    global _BACKEND  # pylint: disable=global-statement
+    with _LOCK:
+        if _BACKEND is None:
+            if settings.getenv("SUGGESTION_BACKEND", "gemini") == "stub":
+                _BACKEND = StubBackend(delay=float(settings.getenv("SUGGESTION_STUB_DELAY", "0")))
+            else:
+                _BACKEND = GeminiBackend(settings.getenv("SUGGESTION_MODEL", DEFAULT_MODEL))
+        return _BACKEND
+
+
+def set_suggestion_backend(backend):
+    """Replaces the process-wide backend, e.g. with a StubBackend"""
+    global _BACKEND  # pylint: disable=global-statement
+    with _LOCK:
+        _BACKEND = backend
+
+
+def get_suggestion_cache():
+    """Returns the process-wide suggestion cache, building it from the environment"""
+    global _CACHE  # pylint: disable=global-statement
+    with _LOCK:
+        if _CACHE is None:
+            _CACHE = SuggestionCache(
+                max_entries=int(settings.getenv("SUGGESTION_CACHE_SIZE", str(DEFAULT_CACHE_SIZE))),
+                ttl=float(settings.getenv("SUGGESTION_CACHE_TTL", str(DEFAULT_CACHE_TTL))),
+                directory=settings.getenv("SUGGESTION_CACHE_DIR") or None,
+            )
+        return _CACHE
+
+
+def set_suggestion_cache(cache):
+    """Replaces the process-wide suggestion cache"""
+    global _CACHE  # pylint: disable=global-statement
+    with _LOCK:
+        _CACHE = cache
+
+
+def get_suggestion_jobs():
+    """Returns the process-wide job runner, sized from the environment"""
+    global _JOBS  # pylint: disable=global-statement
+    with _LOCK:
+        if _JOBS is None:
+            _JOBS = SuggestionJobs(
+                max_workers=int(settings.getenv("SUGGESTION_MAX_CONCURRENCY",
+                                                str(DEFAULT_MAX_CONCURRENCY))),
+                max_pending=int(settings.getenv("SUGGESTION_MAX_PENDING",
+                                                str(DEFAULT_MAX_PENDING))),
+                board=open_job_board(),
+            )
+        return _JOBS
+
+
+def set_suggestion_jobs(jobs):
+    """Replaces the process-wide job runner"""
+    global _JOBS  # pylint: disable=global-statement
+    with _LOCK:
+        _JOBS = jobs
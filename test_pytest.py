@@ -1,15 +1,54 @@
 '''
 Tests in Pytest
 '''
+# pylint: disable=too-many-lines
 
+from dataclasses import fields
+import gzip
 import os
+import subprocess
+import sys
 from unittest.mock import patch
 import json
 import tempfile
+import threading
+import time
 import pytest
+import app as resume_app
 from app import app
+from metrics import Metrics, SharedMetrics, set_metrics, set_shared_metrics
+from models import Project
+from operations import SECTION_MODELS
+from request_profiler import ProfilingMiddleware, RequestProfiler, install, set_profiler
+from sqlite_store import SQLiteStore
+from store import MemoryStore, to_record
+from serve import check_shared_store
+from resumes import JournalResumes, ResumeRegistry, SQLiteResumes, set_resumes
+from response_cache import (FastJSONProvider, GzipCompressor, ResponseCache, set_compressor,
+                            set_response_cache)
 
-from utils import load_data
+from utils import get_suggestion, load_data
+from spelling import (SPELLCHECK_FIELDS, check_spelling, check_spelling_batch, get_spell_engine,
+                      pool_workers, shutdown_spell_pool, spellcheck_resume)
+from suggestions import (GeminiBackend, JobQueueFull, MemoryJobBoard, SQLiteJobBoard, StubBackend,
+                         SuggestionCache, SuggestionJobs, open_job_board, set_suggestion_backend,
+                         set_suggestion_cache, set_suggestion_jobs)
+
+
+
+@pytest.fixture(autouse=True, params=['memory', 'sqlite'])
+def resume_store(request, tmp_path, monkeypatch):
+    '''
+    Runs every test against a fresh store of each backend
+    '''
+    seed = load_data('data/resume.json')
+    if request.param == 'sqlite':
+        store = SQLiteStore.open(str(tmp_path / 'resume.db'), seed)
+    else:
+        store = MemoryStore(seed)
+    monkeypatch.setattr(resume_app, 'store', store)
+    yield store
+    store.close()
 
 
 def test_client():
@@ -399,3 +438,1256 @@ def test_get_description_suggestion_missing_fields():
     })
     assert response.status_code == 400
     assert response.json['error'] == 'Description and type are required'
+
+
+def test_spell_engine_is_shared_and_cached():
+    '''
+    The spellcheck engine is built once and repeated typos hit the cache
+    '''
+    engine = get_spell_engine()
+    assert get_spell_engine() is engine
+
+    engine.clear_cache()
+    app.test_client().post('/resume/spellcheck', json={'text': 'exmple'})
+    app.test_client().post('/resume/spellcheck', json={'text': 'exmple'})
+
+    response = app.test_client().get('/resume/spellcheck/stats')
+    assert response.status_code == 200
+    assert response.json['misses'] == 1
+    assert response.json['hits'] == 1
+    assert response.json['size'] == 1
+
+
+def test_spellcheck_correction_offsets():
+    '''
+    Each correction carries its token offsets in the before and after text
+    '''
+    text = 'Thiss is an exmple of spell chcking.'
+    response = app.test_client().post('/resume/spellcheck', json={'text': text})
+    assert response.status_code == 200
+    after = response.json['after']
+    assert after == 'This is an example of spell checking.'
+
+    corrections = response.json['corrections']
+    assert [item['word'] for item in corrections] == ['Thiss', 'exmple', 'chcking']
+    for item in corrections:
+        assert text[item['start']:item['end']] == item['word']
+        assert after[item['after_start']:item['after_end']] == item['correction']
+
+
+def test_spellcheck_only_rewrites_whole_tokens():
+    '''
+    A misspelled word is not replaced inside other words that contain it
+    '''
+    corrected, corrections = check_spelling('mor work, more teamwork')
+    assert corrected == 'for work, more teamwork'
+    assert len(corrections) == 1
+
+
+def test_spellcheck_batch():
+    '''
+    A list of texts is corrected in order; bad payloads are rejected
+    '''
+    texts = ['thiss is an exmple', '', 'plese let me knw']
+    response = app.test_client().post('/resume/spellcheck', json={'texts': texts})
+    assert response.status_code == 200
+    results = response.json['results']
+    assert [item['before'] for item in results] == texts
+    assert [item['after'] for item in results] == [
+        'this is an example', '', 'please let me know'
+    ]
+
+    response = app.test_client().post('/resume/spellcheck', json={'texts': 'thiss'})
+    assert response.status_code == 400
+    for body in (['thiss'], 'thiss'):
+        response = app.test_client().post('/resume/spellcheck', json=body)
+        assert response.status_code == 400
+        assert response.json == {'error': 'Body must be a JSON object'}
+
+
+def test_spellcheck_batch_process_pool():
+    '''
+    Large batches fan out over the process pool and keep their order
+    '''
+    texts = [f'exmple number {index}' for index in range(8)]
+    try:
+        results = check_spelling_batch(texts, min_batch=2, chunksize=3)
+    finally:
+        shutdown_spell_pool()
+    assert [corrected for corrected, _ in results] == [
+        f'example number {index}' for index in range(8)
+    ]
+
+
+def test_spell_pool_shares_cpus_between_servers(monkeypatch):
+    '''
+    Each server process gets its share of the CPUs for its pool
+    '''
+    monkeypatch.delenv('SPELLCHECK_WORKERS', raising=False)
+    monkeypatch.setattr(os, 'cpu_count', lambda: 8)
+    monkeypatch.delenv('WEB_CONCURRENCY', raising=False)
+    assert pool_workers() == 8
+    monkeypatch.setenv('WEB_CONCURRENCY', '4')
+    assert pool_workers() == 2
+    monkeypatch.setenv('WEB_CONCURRENCY', '16')
+    assert pool_workers() == 1
+    monkeypatch.setenv('SPELLCHECK_WORKERS', '3')
+    assert pool_workers() == 3
+
+
+def test_spellcheck_whole_resume():
+    '''
+    The resume-wide pass checks each distinct word once and returns patches
+    '''
+    resume = {
+        'experience': [
+            {'title': 'Sofware Developer', 'description': 'Writng Python code'},
+            {'title': 'Developer', 'description': 'Writng more Python code'},
+        ],
+        'education': [{'course': 'Computer Science'}],
+        'project': [{'title': 'My Title', 'description': 'A sample projct'}],
+    }
+    result = spellcheck_resume(resume)
+    assert result['fields_checked'] == 7
+    assert result['corrected_words'] == 3
+    assert [patch['path'] for patch in result['patches']] == [
+        '/experience/0/title', '/experience/0/description',
+        '/experience/1/description', '/project/0/description',
+    ]
+    assert result['patches'][-1]['corrections'] == [{
+        'word': 'projct', 'correction': 'project', 'start': 9, 'end': 15,
+        'after_start': 9, 'after_end': 16,
+    }]
+
+    response = app.test_client().get('/resume/spellcheck/all')
+    assert response.status_code == 200
+    assert 'patches' in response.json
+
+    # Every checked field is one the section's items have
+    for section, names in SPELLCHECK_FIELDS.items():
+        assert set(names) <= {field.name for field in fields(SECTION_MODELS[section])}
+
+
+def test_suggestion_cache():
+    '''
+    Identical suggestion requests are served from the cache
+    '''
+    backend = StubBackend()
+    set_suggestion_backend(backend)
+    set_suggestion_cache(SuggestionCache(max_entries=2))
+    try:
+        first = get_suggestion('Wrote  Python code', 'experience')
+        second = get_suggestion(' Wrote Python code ', 'experience')
+        assert first == second
+        assert backend.calls == 1
+
+        get_suggestion('Wrote Python code', 'education')
+        assert backend.calls == 2
+
+        response = app.test_client().get('/suggestion/stats')
+        assert response.json['cache']['memory_hits'] == 1
+        assert response.json['cache']['misses'] == 2
+    finally:
+        set_suggestion_backend(None)
+        set_suggestion_cache(None)
+
+
+def test_suggestion_cache_disk_tier_and_ttl():
+    '''
+    The disk tier survives a new cache instance and entries expire after the TTL
+    '''
+    now = [1000.0]
+    with tempfile.TemporaryDirectory() as directory:
+        key = SuggestionCache.key('Wrote Python code', 'experience', 'stub')
+        SuggestionCache(directory=directory, ttl=60, clock=lambda: now[0]).set(key, 'Better')
+
+        cache = SuggestionCache(directory=directory, ttl=60, clock=lambda: now[0])
+        assert cache.get(key) == 'Better'
+        assert cache.stats()['disk_hits'] == 1
+
+        now[0] += 61
+        assert cache.get(key) is None
+        assert SuggestionCache(directory=directory, ttl=60, clock=lambda: now[0]).get(key) is None
+
+
+def test_async_suggestion_job():
+    '''
+    An async suggestion returns a job id that can be polled for the result
+    '''
+    set_suggestion_backend(StubBackend(delay=0.05))
+    set_suggestion_cache(SuggestionCache())
+    jobs = SuggestionJobs(max_workers=1, max_pending=4)
+    set_suggestion_jobs(jobs)
+    try:
+        response = app.test_client().post('/suggestion', json={
+            'description': 'Wrote Python code', 'type': 'experience', 'async': True
+        })
+        assert response.status_code == 202
+        job_id = response.json['job_id']
+
+        jobs.shutdown()
+        response = app.test_client().get(f'/suggestion/{job_id}')
+        assert response.status_code == 200
+        assert response.json['status'] == 'done'
+        assert 'Wrote Python code' in response.json['suggestion']
+        assert jobs.stats()['completed'] == 1
+
+        assert app.test_client().get('/suggestion/unknown').status_code == 404
+    finally:
+        set_suggestion_backend(None)
+        set_suggestion_cache(None)
+        set_suggestion_jobs(None)
+
+
+def test_suggestion_jobs_are_shared_between_workers(tmp_path, monkeypatch):
+    '''
+    A job submitted to one worker can be polled from another through the database
+    '''
+    path = str(tmp_path / 'jobs.db')
+    accepting = SuggestionJobs(max_workers=1, board=SQLiteJobBoard(path))
+    polled = SuggestionJobs(max_workers=1, board=SQLiteJobBoard(path))
+    try:
+        job_id = accepting.submit(lambda: 'Better')
+        failed_id = accepting.submit(lambda: 1 / 0)
+        accepting.shutdown()
+        assert polled.get(job_id) == {'id': job_id, 'status': 'done', 'suggestion': 'Better'}
+        assert polled.get(failed_id) == {'id': failed_id, 'status': 'error',
+                                         'error': 'division by zero'}
+        assert polled.get('unknown') is None
+    finally:
+        accepting.shutdown()
+        polled.shutdown()
+
+    evicting = SuggestionJobs(max_workers=1, max_finished=1, board=SQLiteJobBoard(path))
+    newest = evicting.submit(lambda: 'Newest')
+    evicting.shutdown()
+    assert polled.get(job_id) is None
+    assert polled.get(newest)['suggestion'] == 'Newest'
+
+    monkeypatch.setenv('RESUME_BACKEND', 'memory')
+    monkeypatch.delenv('SUGGESTION_JOBS_DB', raising=False)
+    assert isinstance(open_job_board(), MemoryJobBoard)
+    monkeypatch.setenv('SUGGESTION_JOBS_DB', path)
+    assert open_job_board().path == path
+
+
+def test_suggestion_job_queue_is_bounded():
+    '''
+    Submissions beyond the pending limit are rejected
+    '''
+    release = threading.Event()
+    jobs = SuggestionJobs(max_workers=1, max_pending=1)
+    try:
+        jobs.submit(release.wait)
+        while jobs.stats()['running'] == 0:
+            time.sleep(0.001)
+        jobs.submit(release.wait)
+        with pytest.raises(JobQueueFull):
+            jobs.submit(release.wait)
+        assert jobs.stats()['queue_depth'] == 1
+        assert jobs.stats()['rejected'] == 1
+    finally:
+        release.set()
+        jobs.shutdown()
+
+
+def test_batch_suggestions():
+    '''
+    Several descriptions are improved with one backend call, with per-item errors
+    '''
+    backend = StubBackend()
+    set_suggestion_backend(backend)
+    set_suggestion_cache(SuggestionCache())
+    try:
+        get_suggestion('Taught calculus', 'education')
+        response = app.test_client().post('/suggestion/batch', json={'items': [
+            {'description': 'Wrote Python code', 'type': 'experience'},
+            {'description': 'Taught calculus', 'type': 'education'},
+            {'description': 'Wrote Go code', 'type': 'hobby'},
+            {'type': 'experience'},
+            {'description': 'Led a team', 'type': 'experience'},
+        ]})
+        assert response.status_code == 200
+        results = response.json['results']
+        assert 'Wrote Python code' in results[0]['suggestion']
+        assert 'Taught calculus' in results[1]['suggestion']
+        assert results[2] == {'error': 'Unsupported type: hobby'}
+        assert results[3] == {'error': 'Description and type are required'}
+        assert 'Led a team' in results[4]['suggestion']
+        assert backend.calls == 2
+
+        response = app.test_client().post('/suggestion/batch', json={'items': []})
+        assert response.status_code == 400
+    finally:
+        set_suggestion_backend(None)
+        set_suggestion_cache(None)
+
+
+def test_gemini_backend_reuses_model_and_batches():
+    '''
+    The Gemini client is built once and a batch is answered by one call
+    '''
+    with patch('google.generativeai.GenerativeModel') as model_class:
+        model = model_class.return_value
+        model.generate_content.return_value.text = '```json\n["First", 7]\n```'
+        backend = GeminiBackend()
+        answers = backend.generate_batch(['one', 'two', 'three'])
+        backend.generate('four')
+
+    model_class.assert_called_once_with('gemini-pro')
+    assert model.generate_content.call_count == 2
+    assert answers[0] == 'First'
+    assert isinstance(answers[1], ValueError)
+    assert isinstance(answers[2], ValueError)
+
+    # A reply that isn't a JSON array is retried one prompt at a time, and
+    # a failing prompt only fails its own item
+    with patch('google.generativeai.GenerativeModel') as model_class:
+        model = model_class.return_value
+        replies = iter(['Sorry, here you go: First, Second', 'First', RuntimeError('quota')])
+
+        def generate_content(_prompt):
+            reply = next(replies)
+            if isinstance(reply, Exception):
+                raise reply
+            return type('Response', (), {'text': reply})
+
+        model.generate_content.side_effect = generate_content
+        answers = GeminiBackend().generate_batch(['one', 'two'])
+    assert answers[0] == 'First'
+    assert isinstance(answers[1], RuntimeError)
+
+
+def test_app_import_is_lazy():
+    '''
+    Importing the app does not load the generation client or the spellcheck dictionary
+    '''
+    code = ("import sys, app; "
+            "print(any(name.startswith(('google.generativeai', 'spellchecker')) "
+            "for name in sys.modules))")
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                            check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert result.stdout.strip().splitlines()[-1] == 'False'
+
+
+def test_app_starts_without_seed_data(tmp_path):
+    '''
+    Without data/resume.json, as when run from another directory, the app
+    still starts, with an empty resume
+    '''
+    repository = os.path.dirname(os.path.abspath(__file__))
+    code = "import app; print(app.store.count('experience'))"
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                            check=True, cwd=tmp_path, env={**os.environ, 'PYTHONPATH': repository})
+    assert result.stdout.strip().splitlines()[-1] == '0'
+    store = MemoryStore.open(str(tmp_path / 'journal'), None)
+    assert store.count('skill') == 0
+    store.close()
+
+
+def test_store_journal_recovery():
+    '''
+    Mutations are journaled and replayed on top of the snapshot after a restart
+    '''
+    seed = {'user': [], 'project': [{'title': 'Seed'}]}
+    with tempfile.TemporaryDirectory() as directory:
+        store = MemoryStore.open(directory, seed)
+        store.append('project', Project('New', 'A project', ['Python'], 'link'))
+        store.update('project', 0, {'title': 'Renamed'})
+        store.append('user', {'name': 'Ada'})
+        store.close()
+        assert seed == {'user': [], 'project': [{'title': 'Seed'}]}
+
+        store = MemoryStore.open(directory, seed)
+        expected = [{'title': 'Renamed'},
+                    {'title': 'New', 'description': 'A project',
+                     'technologies': ['Python'], 'link': 'link'}]
+        assert store.list('project') == expected
+        assert store.list('user') == [{'name': 'Ada'}]
+
+        store.compact()
+        store.delete('project', 0)
+        store.close()
+        assert not os.path.exists(os.path.join(directory, 'journal-00000001.log'))
+
+        # A torn final record, as left by a crash mid-write, is ignored.
+        with open(os.path.join(directory, 'journal-00000003.log'), 'ab') as file:
+            file.write(b'{"seq": 99, "op": "del')
+
+        store = MemoryStore.open(directory, seed)
+        assert store.entries('project') == [(1, expected[1])]
+        assert store.append('project', {'title': 'Another'}) == 2
+        store.close()
+
+
+def test_user_email_index():
+    '''
+    Users are looked up by email and duplicate addresses are rejected
+    '''
+    user = {
+        'name': 'Ada Lovelace',
+        'phone_number': '+441234567890',
+        'email_address': 'ada@example.com'
+    }
+    response = app.test_client().post('/resume/user', json=user)
+    assert response.status_code == 201
+
+    response = app.test_client().post('/resume/user', json={**user, 'name': 'Ada King'})
+    assert response.status_code == 409
+    assert response.json['error'] == 'User already exists'
+
+    response = app.test_client().put('/resume/user', json={**user, 'name': 'Ada King'})
+    assert response.status_code == 200
+
+    response = app.test_client().get('/resume/user', query_string={'email': 'ada@example.com'})
+    assert response.status_code == 200
+    assert response.json['name'] == 'Ada King'
+
+    response = app.test_client().get('/resume/user', query_string={'email': 'nobody@example.com'})
+    assert response.status_code == 404
+
+    emails = [item['email_address'] for item in app.test_client().get('/resume/user').json]
+    assert emails.count('ada@example.com') == 1
+
+
+def test_project_ids_are_stable():
+    '''
+    Deleting a project does not renumber the others and ids are never reused
+    '''
+    new_project = {
+        'title': 'Sample Project',
+        'description': 'A sample project',
+        'technologies': ['Go'],
+        'link': 'https://github.com/username/sample-project'
+    }
+    first_id = app.test_client().post('/resume/project', json=new_project).json['id']
+    second_id = app.test_client().post('/resume/project', json=new_project).json['id']
+
+    response = app.test_client().delete('/resume/project', query_string={'id': first_id})
+    assert response.status_code == 204
+    response = app.test_client().get('/resume/project', query_string={'id': second_id})
+    assert response.status_code == 200
+
+    response = app.test_client().get('/resume/project', query_string={'id': first_id})
+    assert response.json == {'error': 'Project not found'}
+
+    third_id = app.test_client().post('/resume/project', json=new_project).json['id']
+    assert int(third_id) > int(second_id)
+
+    response = app.test_client().get('/resume/project', query_string={'technology': 'Go'})
+    assert [item['id'] for item in response.json] == [second_id, third_id]
+
+
+def test_technology_pages_follow_list_order():
+    '''
+    Projects filtered by technology come in list order, also after a move,
+    and page through every match
+    '''
+    client = app.test_client()
+    project = {'title': 'Go', 'description': 'Go', 'technologies': ['Go'], 'link': 'link'}
+    ids = [client.post('/resume/project', json={**project, 'title': f'Go {index}'}).json['id']
+           for index in range(4)]
+    response = client.post('/resume/batch', json={'operations': [
+        {'section': 'project', 'op': 'move', 'id': int(ids[-1]), 'index': 0}]})
+    assert response.status_code == 200
+    expected = [ids[-1], *ids[:-1]]
+
+    response = client.get('/resume/project', query_string={'technology': 'Go'})
+    assert [item['id'] for item in response.json] == expected
+    seen, cursor = [], None
+    while True:
+        query = {'technology': 'Go', 'limit': 1, **({'cursor': cursor} if cursor else {})}
+        response = client.get('/resume/project', query_string=query)
+        seen += [item['id'] for item in response.json]
+        cursor = response.headers.get('X-Next-Cursor')
+        if cursor is None:
+            break
+    assert seen == expected
+
+    response = client.get('/resume/project', query_string={'technology': 'Go', 'cursor': 999})
+    assert response.status_code == 400
+    assert response.json == {'error': 'Invalid cursor'}
+
+
+def test_technologies_must_be_a_list_of_strings():
+    '''
+    Projects whose technologies are not a list of strings are refused by
+    every write path, so both stores filter the same projects
+    '''
+    client = app.test_client()
+    project = {'title': 'Go', 'description': 'Go', 'technologies': 'Go', 'link': 'link'}
+    count = resume_app.store.count('project')
+    error = 'technologies must be a list of strings'
+
+    response = client.post('/resume/project', json=project)
+    assert response.status_code == 400
+    assert response.json == {'error': error}
+    response = client.put('/resume/project', query_string={'id': 0},
+                          json={'technologies': ['Go', 1]})
+    assert response.status_code == 400
+    response = client.post('/resume/batch', json={'operations': [
+        {'section': 'project', 'op': 'append', 'item': project}]})
+    assert response.status_code == 400
+    assert error in response.json['error']
+    response = client.post('/resume/batch', json={'operations': [
+        {'section': 'project', 'op': 'update', 'id': 0, 'fields': {'technologies': 'Go'}}]})
+    assert response.status_code == 400
+    response = client.post('/resume/import', data=json.dumps({'section': 'project',
+                                                                'item': project}) + '\n')
+    assert error in response.get_data(as_text=True)
+
+    assert resume_app.store.count('project') == count
+    assert client.get('/resume/project', query_string={'technology': 'o'}).json == []
+
+
+def test_experience_item_addressing():
+    '''
+    Experience entries can be read, replaced and deleted by id
+    '''
+    example = {
+        "title": "Software Developer",
+        "company": "A Cooler Company",
+        "start_date": "October 2022",
+        "end_date": "Present",
+        "description": "Writing JavaScript Code",
+        "logo": "example-logo.png"
+    }
+    item_id = app.test_client().post('/resume/experience', json={'data': [example]}).json['id']
+    assert app.test_client().get('/resume/experience').json['ids'][-1] == item_id
+
+    response = app.test_client().put('/resume/experience', query_string={'id': item_id},
+                                     json={**example, 'company': 'Another Company'})
+    assert response.status_code == 200
+    response = app.test_client().get('/resume/experience', query_string={'id': item_id})
+    assert response.json['company'] == 'Another Company'
+
+    response = app.test_client().put('/resume/experience', query_string={'id': item_id},
+                                     json={'title': 'Only a title'})
+    assert response.status_code == 400
+
+    # Neither a POST nor a HEAD addressed by id deletes the item
+    response = app.test_client().post('/resume/experience', query_string={'id': item_id},
+                                      json=example)
+    assert response.status_code == 405
+    assert response.headers['Allow'] == 'GET, HEAD, PUT, DELETE'
+    response = app.test_client().head('/resume/education', query_string={'id': 0})
+    assert response.status_code == 200
+    assert resume_app.store.get('education', 0) is not None
+    response = app.test_client().get('/resume/experience', query_string={'id': item_id})
+    assert response.json['company'] == 'Another Company'
+
+    response = app.test_client().delete('/resume/experience', query_string={'id': item_id})
+    assert response.status_code == 204
+    response = app.test_client().delete('/resume/experience', query_string={'id': item_id})
+    assert response.status_code == 404
+    assert response.json == {'error': 'Experience not found'}
+
+
+def test_collection_pagination_and_projection():
+    '''
+    Collections are served in pages linked by cursors and can be projected
+    to some of their fields
+    '''
+    example = {
+        "title": "Software Developer",
+        "company": "A Cooler Company",
+        "start_date": "October 2022",
+        "end_date": "Present",
+        "description": "Writing JavaScript Code",
+        "logo": "example-logo.png"
+    }
+    for index in range(4):
+        app.test_client().post('/resume/experience',
+                               json={'data': [{**example, 'company': f'Company {index}'}]})
+    every_id = app.test_client().get('/resume/experience').json['ids']
+
+    seen_ids, cursor = [], None
+    while True:
+        query = {'limit': 2, 'fields': 'company'}
+        if cursor is not None:
+            query['cursor'] = cursor
+        response = app.test_client().get('/resume/experience', query_string=query)
+        assert response.status_code == 200
+        assert len(response.json['ids']) <= 2
+        assert all(list(item) == ['company'] for item in response.json['experience'])
+        seen_ids += response.json['ids']
+        cursor = response.headers.get('X-Next-Cursor')
+        if cursor is None:
+            break
+    assert seen_ids == every_id
+
+    response = app.test_client().get('/resume/project', query_string={'limit': 1,
+                                                                      'fields': 'title'})
+    assert response.json == [{'title': 'My Title', 'id': '0'}]
+
+    response = app.test_client().get('/resume/skill', query_string={'limit': 0})
+    assert response.status_code == 400
+    response = app.test_client().get('/resume/skill', query_string={'fields': 'salary'})
+    assert response.json == {'error': 'Invalid fields: salary'}
+    response = app.test_client().get('/resume/user', query_string={'cursor': 'x'})
+    assert response.json == {'error': 'Invalid cursor'}
+
+
+def test_conditional_requests():
+    '''
+    Section GETs carry an ETag that changes with every write, and writes
+    with If-Match only apply to the version they name
+    '''
+    client = app.test_client()
+    response = client.get('/resume/skill')
+    etag = response.headers['ETag']
+
+    response = client.get('/resume/skill', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    response = client.get('/resume/skill', query_string={'id': 0},
+                          headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+    new_skill = {'name': 'Go', 'proficiency': '1 year', 'logo': 'go.png'}
+    client.post('/resume/skill', json={'data': [new_skill]})
+    response = client.get('/resume/skill', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    current = response.headers['ETag']
+
+    response = client.put('/resume/skill', query_string={'id': 0}, json=new_skill,
+                          headers={'If-Match': etag})
+    assert response.status_code == 412
+    assert resume_app.store.get('skill', 0)['name'] != 'Go'
+
+    response = client.put('/resume/skill', query_string={'id': 0}, json=new_skill,
+                          headers={'If-Match': current})
+    assert response.status_code == 200
+    assert response.headers['ETag'] not in (etag, current)
+    assert client.get('/resume/skill').headers['ETag'] == response.headers['ETag']
+    assert client.get('/resume/project').headers['ETag'] == (
+        f'"{resume_app.store.epoch}.0"')
+
+
+def test_response_cache():
+    '''
+    Repeated GETs are served from the encoded response cache until the
+    section changes
+    '''
+    cache = ResponseCache()
+    set_response_cache(cache)
+    client = app.test_client()
+    try:
+        first = client.get('/resume/project', query_string={'limit': 1})
+        second = client.get('/resume/project', query_string={'limit': 1})
+        assert second.data == first.data
+        assert second.headers['ETag'] == first.headers['ETag']
+        assert cache.stats()['hits'] == 1
+
+        client.get('/resume/project', query_string={'fields': 'title'})
+        assert cache.stats()['size'] == 2
+
+        client.put('/resume/project', query_string={'id': 0}, json={'title': 'New Title'})
+        assert cache.stats()['size'] == 0
+        third = client.get('/resume/project', query_string={'limit': 1})
+        assert third.json[0]['title'] == 'New Title'
+
+        # A write that bypasses the routes still makes the entry stale
+        resume_app.store.update('project', 0, {'title': 'Newer Title'})
+        fourth = client.get('/resume/project', query_string={'limit': 1})
+        assert fourth.json[0]['title'] == 'Newer Title'
+        assert cache.stats()['stale'] == 1
+    finally:
+        set_response_cache(None)
+
+
+@pytest.mark.parametrize('encoder', ['orjson', 'json'])
+def test_json_provider_encoders(encoder):
+    '''
+    Both encoders produce the same compact, key-sorted JSON
+    '''
+    provider = FastJSONProvider(app, encoder=encoder)
+    value = {'b': [1, 'two'], 'a': {'nested': None}, 'c': Project('t', 'd', ['x'], 'l')}
+    assert provider.encode(value) == json.dumps(
+        {**value, 'c': to_record(value['c'])}, separators=(',', ':'),
+        sort_keys=True).encode('utf-8')
+
+
+def test_gzip_responses():
+    '''
+    Large responses are gzipped for clients that accept it, and a cached
+    section view is only compressed once
+    '''
+    set_response_cache(ResponseCache())
+    compressor = GzipCompressor(min_bytes=200)
+    set_compressor(compressor)
+    client = app.test_client()
+    try:
+        for _ in range(5):
+            client.post('/resume/project', json={'title': 'Project', 'description': 'Desc',
+                                                 'technologies': ['Python'], 'link': 'link'})
+        plain = client.get('/resume/project')
+        assert 'Content-Encoding' not in plain.headers
+        assert plain.headers['Vary'] == 'Accept-Encoding'
+
+        for _ in range(2):
+            response = client.get('/resume/project', headers={'Accept-Encoding': 'gzip'})
+            assert response.headers['Content-Encoding'] == 'gzip'
+            assert gzip.decompress(response.data) == plain.data
+        stats = compressor.stats()
+        assert (stats['compressed'], stats['reused']) == (1, 1)
+        assert stats['bytes_saved'] == 2 * (len(plain.data) - len(response.data)) > 0
+
+        response = client.get('/resume/project', headers={'Accept-Encoding': 'gzip;q=0'})
+        assert 'Content-Encoding' not in response.headers
+        response = client.get('/resume/skill', headers={'Accept-Encoding': 'gzip'})
+        assert 'Content-Encoding' not in response.headers
+
+        client.delete('/resume/project', query_string={'id': 1})
+        response = client.get('/resume/project', headers={'Accept-Encoding': 'gzip'})
+        assert json.loads(gzip.decompress(response.data))[1]['id'] == '2'
+        assert compressor.stats()['compressed'] == 2
+
+        # The streamed export is gzipped as it goes
+        plain = client.get('/resume/export')
+        assert 'Content-Encoding' not in plain.headers
+        response = client.get('/resume/export', headers={'Accept-Encoding': 'gzip'})
+        assert response.is_streamed
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert response.headers['Vary'] == 'Accept-Encoding'
+        assert gzip.decompress(response.data) == plain.data
+        stats = compressor.stats()
+        assert stats['compressed'] == 3
+    finally:
+        set_response_cache(None)
+        set_compressor(None)
+
+
+def test_patch_operations():
+    '''
+    Entries can be moved, inserted, updated and removed one at a time, and
+    a patch with a bad operation changes nothing
+    '''
+    client = app.test_client()
+    new_skill = {'name': 'Go', 'proficiency': '1 year', 'logo': 'go.png'}
+    for name in ['Go', 'Rust', 'SQL']:
+        client.post('/resume/skill', json={'data': [{**new_skill, 'name': name}]})
+    ids = client.get('/resume/skill').json['ids']
+
+    response = client.patch('/resume/skill', json={'operations': [
+        {'op': 'move', 'id': ids[-1], 'index': 0},
+        {'op': 'insert', 'index': 1, 'item': {**new_skill, 'name': 'C'}},
+        {'op': 'update', 'id': ids[1], 'fields': {'proficiency': '5 years'}},
+        {'op': 'remove', 'id': ids[2]},
+    ]})
+    assert response.status_code == 200
+    inserted_id = response.json['results'][1]['id']
+    assert response.json['results'][0] == {'op': 'move', 'id': ids[-1]}
+
+    expected_ids = [ids[-1], inserted_id, ids[0], ids[1]]
+    response = client.get('/resume/skill')
+    assert response.json['ids'] == expected_ids
+    assert [skill['name'] for skill in response.json['skills']] == ['SQL', 'C', 'Python', 'Go']
+    assert response.json['skills'][3]['proficiency'] == '5 years'
+
+    # Pages follow the list order
+    response = client.get('/resume/skill', query_string={'limit': 2, 'cursor': inserted_id})
+    assert response.json['ids'] == expected_ids[2:4]
+
+    # Moving items into the same gap over and over runs SQLite's midpoint
+    # positions out of precision and makes it renumber the section
+    for _ in range(60):
+        client.patch('/resume/skill', json={'operations': [
+            {'op': 'move', 'id': ids[0], 'index': 1}, {'op': 'move', 'id': ids[1], 'index': 1}]})
+    assert client.get('/resume/skill').json['ids'] == [ids[-1], ids[1], ids[0], inserted_id]
+
+    before = client.get('/resume/skill').json
+    response = client.patch('/resume/skill', json={'operations': [
+        {'op': 'remove', 'id': ids[0]},
+        {'op': 'update', 'id': ids[0], 'fields': {'name': 'Gone'}},
+    ]})
+    assert response.status_code == 404
+    assert response.json == {'error': 'Operation 1: Skill 0 not found'}
+    response = client.patch('/resume/skill', json={'operations': [
+        {'op': 'remove', 'id': ids[0]},
+        {'op': 'insert', 'index': 0, 'item': {'name': 'C'}},
+    ]})
+    assert response.json == {'error': 'Operation 1: Missing fields: proficiency, logo'}
+    response = client.patch('/resume/skill', json={'operations': [{'op': 'swap'}]})
+    assert response.json == {'error': 'Operation 0: Unknown op: swap'}
+    # Bodies and items that aren't objects are bad requests
+    response = client.patch('/resume/skill', json=[1])
+    assert response.status_code == 400
+    assert response.json == {'error': 'Body must be a JSON object'}
+    response = client.patch('/resume/skill', json={'operations': [
+        {'op': 'insert', 'index': 0, 'item': 'name proficiency logo'}]})
+    assert response.status_code == 400
+    assert response.json == {'error': 'Operation 0: Item must be an object'}
+    assert client.get('/resume/skill').json == before
+
+
+def test_batch_operations():
+    '''
+    A batch applies operations across sections together, and a batch with
+    a bad operation changes nothing
+    '''
+    client = app.test_client()
+    store = resume_app.store
+    skill = {'name': 'Go', 'proficiency': '1 year', 'logo': 'go.png'}
+    user = {'name': 'Jane', 'phone_number': '+447777777777', 'email_address': 'jane@example.com'}
+    response = client.post('/resume/batch', json={'operations': [
+        {'section': 'user', 'op': 'add', 'item': user},
+        {'section': 'skill', 'op': 'append', 'item': skill},
+        {'section': 'skill', 'op': 'update', 'id': 0, 'fields': {'proficiency': '9 years'}},
+        {'section': 'project', 'op': 'remove', 'id': 0},
+        {'section': 'education', 'op': 'replace', 'items': []},
+    ]})
+    assert response.status_code == 200
+    assert response.json['results'] == [
+        {'section': 'user', 'op': 'add'},
+        {'section': 'skill', 'op': 'append', 'id': 1},
+        {'section': 'skill', 'op': 'update', 'id': 0},
+        {'section': 'project', 'op': 'remove', 'id': 0},
+        {'section': 'education', 'op': 'replace', 'ids': []},
+    ]
+    assert store.find_user('jane@example.com') == user
+    assert [item['proficiency'] for item in store.list('skill')] == ['9 years', '1 year']
+    assert store.count('project') == 0 and store.count('education') == 0
+
+    before = store.export()
+    versions = {section: store.version(section) for section in before}
+    response = client.post('/resume/batch', json={'operations': [
+        {'section': 'skill', 'op': 'remove', 'id': 1},
+        {'section': 'user', 'op': 'add', 'item': user},
+    ]})
+    assert response.status_code == 400
+    assert response.json == {'error': 'Operation 1: User already exists'}
+    response = client.post('/resume/batch', json={'operations': [
+        {'section': 'skill', 'op': 'remove', 'id': 1},
+        {'section': 'skill', 'op': 'move', 'id': 1, 'index': 0},
+    ]})
+    assert response.status_code == 404
+    response = client.post('/resume/batch', json={'operations': [{'section': 'hobby'}]})
+    assert response.json == {'error': 'Operation 0: Unknown section: hobby'}
+    response = client.post('/resume/batch', json=[1])
+    assert response.status_code == 400
+    assert response.json == {'error': 'Body must be a JSON object'}
+    response = client.post('/resume/batch', json={'operations': [
+        {'section': 'user', 'op': 'put', 'item': {**user, 'phone_number': 447777777777}}]})
+    assert response.status_code == 400
+    assert response.json == {
+        'error': 'Operation 0: name, phone_number, email_address must be strings'}
+
+    # A failure while applying rolls back what the batch already did
+    with patch.object(store, 'put_user', side_effect=RuntimeError):
+        response = client.post('/resume/batch', json={'operations': [
+            {'section': 'skill', 'op': 'remove', 'id': 1},
+            {'section': 'experience', 'op': 'insert', 'index': 0,
+             'item': resume_app.store.list('experience')[0]},
+            {'section': 'user', 'op': 'put', 'item': user},
+        ]})
+    assert response.status_code == 500
+    assert store.export() == before
+    assert {section: store.version(section) for section in before} == versions
+
+
+def test_batch_is_one_journal_record():
+    '''
+    The journal holds a batch as one record, so recovery replays all of it
+    '''
+    with tempfile.TemporaryDirectory() as directory:
+        store = MemoryStore.open(directory, {'skill': [{'name': 'Python'}]})
+        with store.transaction():
+            store.append('skill', {'name': 'Go'})
+            store.move('skill', 1, 0)
+        seq = store.journal.last_seq
+        store.close()
+        assert seq == 1
+
+        recovered = MemoryStore.open(directory, {'skill': [{'name': 'Python'}]})
+        assert recovered.list('skill') == [{'name': 'Go'}, {'name': 'Python'}]
+        recovered.close()
+
+
+def test_ndjson_export_and_import():
+    '''
+    The resume streams out as NDJSON and back in, reporting progress and
+    rejected records
+    '''
+    client = app.test_client()
+    # A replace without a single valid record leaves the resume alone
+    counts = {section: resume_app.store.count(section) for section in resume_app.SECTIONS}
+    response = client.post('/resume/import', query_string={'replace': 'true'},
+                           data=b'not json\n{"section": "skill", "item": 5}\n{"sec')
+    assert json.loads(response.data.splitlines()[-1]) == {
+        'done': {'records': 3, 'imported': 0, 'errors': 3}}
+    assert {section: resume_app.store.count(section)
+            for section in resume_app.SECTIONS} == counts
+
+    response = client.get('/resume/export')
+    assert response.mimetype == 'application/x-ndjson'
+    assert response.is_streamed
+    records = [json.loads(line) for line in response.data.splitlines()]
+    assert records[0] == {'section': 'user', 'id': 0, 'item': resume_app.store.get('user', 0)}
+    assert len(records) == sum(resume_app.store.count(section) for section in resume_app.SECTIONS)
+
+    skill = {'name': 'Go', 'proficiency': '1 year', 'logo': 'go.png'}
+    lines = [json.dumps({'section': 'skill', 'item': {**skill, 'name': f'Skill {index}'}})
+             for index in range(1200)]
+    lines[3] = '{"section": "skill", "item": {"name": "Broken"}}'
+    lines[7] = 'not json'
+    lines[9] = '{"section": "skill", "item": 5}'
+    lines[11] = json.dumps({'section': 'user', 'item': {
+        'name': 'Joe', 'phone_number': 447777777777, 'email_address': 'joe@example.com'}})
+    lines.append(json.dumps({'section': 'user', 'item': {
+        'name': 'Jane', 'phone_number': '+447777777777', 'email_address': 'jane@example.com'}}))
+    response = client.post('/resume/import', query_string={'replace': 'true'},
+                           data='\n'.join(lines).encode('utf-8'))
+    report = [json.loads(line) for line in response.data.splitlines()]
+    assert report[0] == {'line': 4, 'error': 'Missing fields: proficiency, logo'}
+    assert report[1]['line'] == 8 and report[1]['error'].startswith('Invalid JSON')
+    # Items of the wrong type are reported like any other invalid record
+    assert report[2] == {'line': 10, 'error': 'Item must be an object'}
+    assert report[3] == {'line': 12,
+                         'error': 'name, phone_number, email_address must be strings'}
+    assert [line['progress']['imported'] for line in report if 'progress' in line] == [500, 1000]
+    assert report[-1] == {'done': {'records': 1201, 'imported': 1197, 'errors': 4}}
+
+    assert resume_app.store.count('experience') == 0
+    assert resume_app.store.count('skill') == 1196
+    assert resume_app.store.list('skill')[3]['name'] == 'Skill 4'
+    assert resume_app.store.list('user') == [json.loads(lines[-1])['item']]
+
+    exported = client.get('/resume/export').data.splitlines()
+    assert [json.loads(line)['item'] for line in exported][:2] == [
+        json.loads(lines[-1])['item'], {**skill, 'name': 'Skill 0'}]
+
+    # The users being replaced don't count as existing ones
+    response = client.post('/resume/import', query_string={'replace': 'true'},
+                           data=lines[-1].encode('utf-8'))
+    assert json.loads(response.data) == {'done': {'records': 1, 'imported': 1, 'errors': 0}}
+    assert resume_app.store.list('user') == [json.loads(lines[-1])['item']]
+    assert resume_app.store.count('skill') == 0
+
+
+def test_hosted_resumes(tmp_path):
+    '''
+    Each hosted resume has its own data under /resumes/<resume_id>/resume,
+    is loaded on first use and evicted when the working set is over budget
+    '''
+    directory = str(tmp_path / 'resumes')
+    storage = (SQLiteResumes(directory) if isinstance(resume_app.store, SQLiteStore)
+               else JournalResumes(directory))
+    registry = ResumeRegistry(storage, max_bytes=0)
+    set_resumes(registry)
+    try:
+        client = app.test_client()
+        assert client.post('/resumes', json={'id': 'alice'}).status_code == 201
+        assert client.post('/resumes', json={'id': 'alice'}).status_code == 409
+        assert client.post('/resumes', json={'id': '../etc'}).status_code == 400
+        bob = client.post('/resumes').json['id']
+        assert client.get('/resumes').json == {'resumes': sorted(['alice', bob])}
+        assert client.get('/resumes/carol/resume/experience').status_code == 404
+
+        skill = {'name': 'Go', 'proficiency': '1 year', 'logo': 'go.png'}
+        assert client.get('/resumes/alice/resume/skill').json == {'skills': [], 'ids': []}
+        response = client.post('/resumes/alice/resume/skill', json={'data': [skill]})
+        assert response.status_code == 201
+        # The response cache and the default resume are kept apart
+        assert client.get('/resumes/alice/resume/skill').json['skills'] == [skill]
+        assert client.get(f'/resumes/{bob}/resume/skill').json['skills'] == []
+        assert skill not in client.get('/resume/skill').json['skills']
+
+        # Only empty resumes fit a zero budget, so alice was evicted after
+        # every request and its skill had to survive being loaded again
+        stats = client.get('/resumes/stats').json
+        assert stats['not_found'] == 1
+        assert stats['evictions'] == stats['loads'] - stats['resident'] >= 2
+        assert 0 < stats['load_p50'] <= stats['load_p99'] <= stats['load_max']
+        exported = client.get('/resumes/alice/resume/export').data.splitlines()
+        assert [json.loads(line) for line in exported] == [
+            {'section': 'skill', 'id': 0, 'item': skill}]
+
+        # Within budget, resumes stay resident and later requests are hits
+        registry.max_bytes = 1 << 20
+        client.get('/resumes/alice/resume/skill')
+        before = registry.stats()
+        client.get('/resumes/alice/resume/skill')
+        stats = registry.stats()
+        assert stats['hits'] == before['hits'] + 1 and stats['loads'] == before['loads']
+        assert stats['bytes'] > 0
+    finally:
+        set_resumes(None)
+        registry.close()
+
+
+def test_memory_footprint_follows_writes():
+    '''
+    The memory store keeps its footprint in step with every kind of write,
+    without encoding the whole resume again, and a rolled back transaction
+    leaves it as it was
+    '''
+    store = MemoryStore(load_data('data/resume.json'))
+
+    def measured():
+        return sum(len(json.dumps(item)) for section in ('user', *SECTION_MODELS)
+                   for _, item in store.entries(section))
+
+    skill = {'name': 'Go', 'proficiency': '1 year', 'logo': 'go.png'}
+    assert store.footprint() == measured()
+    item_id = store.append('skill', skill)
+    store.insert('skill', 0, {**skill, 'name': 'Rust'})
+    store.set_item('skill', item_id, {**skill, 'proficiency': '10 years'})
+    store.update('skill', item_id, {'logo': 'a-much-longer-logo-name.png'})
+    store.move('skill', item_id, 0)
+    assert store.footprint() == measured()
+    store.delete('skill', item_id)
+    store.put_user({**store.get('user', 0), 'name': 'Someone Else'})
+    assert store.footprint() == measured()
+    with pytest.raises(RuntimeError):
+        with store.transaction():
+            store.append('skill', skill)
+            raise RuntimeError()
+    store.replace('experience', [])
+    assert store.footprint() == measured()
+    store.close()
+
+
+def test_concurrent_reads_see_whole_transactions():
+    '''
+    Readers running alongside writers only ever see whole committed
+    transactions: never part of one, nor one that was rolled back
+    '''
+    store = resume_app.store
+    store.replace('skill', [])
+    stop = threading.Event()
+    failures = []
+
+    def write(writer):
+        alive = []
+        for number in range(1_000_000):
+            if stop.is_set():
+                return
+            # Every third transaction fails after writing and is rolled back
+            rolled_back = number % 3 == 0
+            name = f'{writer}-{number}' + ('-rolled-back' if rolled_back else '')
+            skill = {'name': name, 'proficiency': '1 year', 'logo': 'logo.png'}
+            try:
+                with store.transaction():
+                    added = [store.append('skill', skill), store.append('skill', skill)]
+                    for item_id in alive:
+                        store.delete('skill', item_id)
+                    if rolled_back:
+                        raise RuntimeError(name)
+                alive = added
+            except RuntimeError as error:
+                if str(error) != name:
+                    failures.append(f'writer: {error!r}')
+
+    def read():
+        version = 0
+        while not stop.is_set():
+            names = [skill['name'] for skill in store.list('skill')]
+            if any(names.count(name) != 2 or 'rolled-back' in name for name in names):
+                failures.append(f'torn read: {sorted(names)}')
+            if store.version('skill') < version:
+                failures.append('version went back')
+            version = store.version('skill')
+
+    threads = ([threading.Thread(target=write, args=(writer,)) for writer in range(2)]
+               + [threading.Thread(target=read) for _ in range(4)])
+    for thread in threads:
+        thread.start()
+    time.sleep(0.5)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    assert not failures, failures[:3]
+    assert len(store.list('skill')) == 4
+
+
+def test_store_shared_between_processes(tmp_path, monkeypatch):
+    '''
+    Connections to one database, like those of the production workers,
+    seed it once, never hand out the same id and agree on ETags
+    '''
+    path = str(tmp_path / 'shared.db')
+    seed = load_data('data/resume.json')
+    stores = [SQLiteStore.open(path, seed) for _ in range(3)]
+    skill = {'name': 'Go', 'proficiency': '1 year', 'logo': 'go.png'}
+    ids = []
+
+    def append(store):
+        for _ in range(20):
+            ids.append(store.append('skill', skill))
+
+    threads = [threading.Thread(target=append, args=(store,)) for store in stores]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    try:
+        assert len(set(ids)) == 60
+        assert stores[0].count('skill') == len(seed['skill']) + 60
+        assert len({store.etag('skill') for store in stores}) == 1
+    finally:
+        for store in stores:
+            store.close()
+
+    monkeypatch.setenv('RESUME_BACKEND', 'memory')
+    assert check_shared_store({'workers': 1}) is None
+    assert 'RESUME_BACKEND=sqlite' in check_shared_store({'workers': 4})
+    monkeypatch.setenv('RESUME_BACKEND', 'sqlite')
+    assert check_shared_store({'workers': 4}) is None
+
+
+def test_metrics_endpoint():
+    '''
+    /metrics reports latency, status, in-flight and size series per route,
+    streamed responses included, and the time spent in each stage
+    '''
+    set_metrics(Metrics())
+    set_suggestion_backend(StubBackend())
+    set_suggestion_cache(SuggestionCache())
+    client = app.test_client()
+    try:
+        client.get('/resume/experience', buffered=True)
+        client.get('/resume/project', query_string={'id': 99}, buffered=True)
+        client.post('/resume/spellcheck', json={'text': 'Wrote Pyhton'}, buffered=True)
+        client.post('/suggestion', json={'description': 'Wrote code', 'type': 'experience'},
+                    buffered=True)
+        exported = client.get('/resume/export', buffered=True).get_data()
+        client.get('/resumes/missing/resume/skill', buffered=True)
+        client.get('/nowhere', buffered=True)
+
+        response = client.get('/metrics')
+        assert response.status_code == 200
+        assert response.content_type.startswith('text/plain; version=0.0.4')
+        samples = {}
+        for line in response.get_data(as_text=True).splitlines():
+            if not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                samples[name] = float(value)
+    finally:
+        set_metrics(None)
+        set_suggestion_backend(None)
+        set_suggestion_cache(None)
+
+    experience = 'method="GET",route="/resume/experience"'
+    assert samples[f'resume_http_requests_total{{{experience},status="200"}}'] == 1
+    assert samples[f'resume_http_request_duration_seconds_count{{{experience}}}'] == 1
+    assert samples[f'resume_http_request_duration_seconds_bucket{{{experience},le="+Inf"}}'] == 1
+    assert samples[f'resume_http_requests_in_flight{{{experience}}}'] == 0
+    assert samples['resume_http_requests_total{method="GET",route="/resume/project",'
+                   'status="400"}'] == 1
+    assert samples['resume_http_requests_total{method="GET",'
+                   'route="/resumes/<resume_id>/resume/skill",status="404"}'] == 1
+    assert samples['resume_http_requests_total{method="GET",route="<unmatched>",'
+                   'status="404"}'] == 1
+    # The scrape itself is still in flight
+    assert samples['resume_http_requests_in_flight{method="GET",route="/metrics"}'] == 1
+    assert samples['resume_http_response_size_bytes_sum{method="GET",'
+                   'route="/resume/export"}'] == len(exported)
+    assert samples['resume_http_request_size_bytes_count{method="POST",'
+                   'route="/resume/spellcheck"}'] == 1
+    for stage in ('spellcheck', 'suggestion_backend', 'serialization'):
+        assert samples[f'resume_stage_duration_seconds_count{{stage="{stage}"}}'] >= 1
+
+
+def test_metrics_are_summed_across_workers(tmp_path):
+    '''
+    /metrics sums the snapshots every worker publishes, leaving out the
+    gauges of workers that have exited
+    '''
+    route = ('GET', '/resume/skill')
+    for pid in (os.getppid(), 4194305):
+        other = Metrics()
+        other.started(*route)
+        other.finished((*route, '200', False), 0.002, None, 100)
+        (tmp_path / f'{pid}.json').write_text(json.dumps(other.snapshot()), encoding='utf-8')
+
+    set_metrics(Metrics())
+    set_shared_metrics(SharedMetrics(str(tmp_path)))
+    try:
+        app.test_client().get('/resume/skill', buffered=True)
+        text = app.test_client().get('/metrics', buffered=True).get_data(as_text=True)
+    finally:
+        set_metrics(None)
+        set_shared_metrics(None)
+
+    samples = dict(line.rsplit(' ', 1) for line in text.splitlines() if not line.startswith('#'))
+    skill = 'method="GET",route="/resume/skill"'
+    assert float(samples[f'resume_http_requests_total{{{skill},status="200"}}']) == 3
+    assert float(samples[f'resume_http_request_duration_seconds_count{{{skill}}}']) == 3
+    assert float(samples[f'resume_http_response_size_bytes_sum{{{skill}}}']) > 200
+    # The live worker still counts its request in flight, the exited one doesn't
+    assert float(samples[f'resume_http_requests_in_flight{{{skill}}}']) == 1
+    assert (tmp_path / f'{os.getpid()}.json').exists()
+
+    # Publishing from several threads at once neither fails nor leaves a
+    # partly written snapshot behind
+    shared, metrics, errors = SharedMetrics(str(tmp_path / 'racing')), Metrics(), []
+
+    def publish():
+        for _ in range(200):
+            metrics.observe('spellcheck', 0.001)
+            try:
+                shared.publish(metrics)
+            except OSError as error:
+                errors.append(error)
+
+    threads = [threading.Thread(target=publish) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert [path.name for path in (tmp_path / 'racing').iterdir()] == [f'{os.getpid()}.json']
+    assert shared.collect(metrics).snapshot() == metrics.snapshot()
+
+
+def test_sampled_request_profiling(tmp_path):
+    '''
+    Profiled requests are dumped to a rotating directory, tagged with their
+    route, and /profiles/hot merges the newest dumps; without configuration
+    the middleware is not installed
+    '''
+    set_profiler(RequestProfiler(str(tmp_path)))
+    try:
+        assert install(app.wsgi_app) is app.wsgi_app
+        assert app.test_client().get('/profiles/hot').status_code == 404
+    finally:
+        set_profiler(None)
+
+    sampled = RequestProfiler(str(tmp_path / 'sampled'), sample_rate=1.0, max_files=2)
+    by_token = RequestProfiler(str(tmp_path / 'token'), token='secret')
+    wsgi_app = app.wsgi_app
+    client = app.test_client()
+    try:
+        app.wsgi_app = ProfilingMiddleware(wsgi_app, sampled)
+        set_profiler(sampled)
+        for _ in range(3):
+            client.get('/resume/experience', buffered=True)
+        dumps = sampled.dumps()
+        assert len(dumps) == 2
+        assert all(path.endswith('-GET-resume_experience.prof') for path in dumps)
+        # Responses are closed, like a server does, so their profiles end
+        hot = client.get('/profiles/hot', query_string={'limit': 5, 'sort': 'cumtime'},
+                         buffered=True).json
+        assert hot['samples'] == [os.path.basename(path) for path in dumps]
+        assert 0 < len(hot['functions']) <= 5
+        assert hot['functions'][0]['cumtime'] >= hot['functions'][-1]['cumtime']
+        assert client.get('/profiles/hot', query_string={'sort': 'calls'},
+                          buffered=True).status_code == 400
+
+        app.wsgi_app = ProfilingMiddleware(wsgi_app, by_token)
+        set_profiler(by_token)
+        client.get('/resume/skill', buffered=True)
+        assert not by_token.dumps()
+        client.get('/resume/skill', headers={'X-Profile-Token': 'wrong'}, buffered=True)
+        assert not by_token.dumps()
+        client.get('/resume/skill', headers={'X-Profile-Token': 'secret'}, buffered=True)
+        assert len(by_token.dumps()) == 1
+        assert client.get('/profiles/hot').status_code == 403
+        hot = client.get('/profiles/hot', headers={'X-Profile-Token': 'secret'},
+                         buffered=True).json
+        assert hot['profiled'] == 1 and hot['functions']
+    finally:
+        app.wsgi_app = wsgi_app
+        set_profiler(None)
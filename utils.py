@@ -1,34 +1,79 @@
 """
 Utility Methods File
 """
-import os
 import re
 import json
-from spellchecker import SpellChecker
-import google.generativeai as genai
-from dotenv import load_dotenv
-
-load_dotenv()
-
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-genai.configure(api_key=GOOGLE_API_KEY)
+from metrics import get_metrics
+from spelling import check_spelling, get_spell_engine
+from suggestions import GeminiBackend, build_prompt, get_suggestion_backend, get_suggestion_cache
 
 
 def get_suggestion(description, description_type):
     """
     give suggestions for description section using gemini (free alternative to openai's chatgpt api)
     """
-    prompt = ""
-    if description_type == "education":
-        prompt = f"Improve the following education \
-        experience description for resume: {description}"
-    elif description_type == "experience":
-        prompt = f"Improve the following professional \
-         experience description for resume: {description}"
+    prompt = build_prompt(description, description_type)
+    backend = get_suggestion_backend()
+    cache = get_suggestion_cache()
+    key = cache.key(description, description_type, backend.model_name)
+    suggestion = cache.get(key)
+    if suggestion is None:
+        with get_metrics().timed("suggestion_backend"):
+            suggestion = backend.generate(prompt)
+        cache.set(key, suggestion)
+    return suggestion
+
+
+def get_suggestions(items):
+    """
+    give suggestions for several descriptions at once. Cached items are answered
+    directly and the rest share one backend call. Each result is either
+    {"suggestion": ...} or {"error": ...}, so one bad item doesn't fail the others.
+    """
+    backend = get_suggestion_backend()
+    cache = get_suggestion_cache()
+    results = [None] * len(items)
+    pending = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not item.get("description") or not item.get("type"):
+            results[index] = {"error": "Description and type are required"}
+            continue
+        try:
+            prompt = build_prompt(item["description"], item["type"])
+        except ValueError as error:
+            results[index] = {"error": str(error)}
+            continue
+        key = cache.key(item["description"], item["type"], backend.model_name)
+        suggestion = cache.get(key)
+        if suggestion is None:
+            pending.append((index, key, prompt))
+        else:
+            results[index] = {"suggestion": suggestion}
+
+    if pending:
+        try:
+            with get_metrics().timed("suggestion_backend"):
+                answers = backend.generate_batch([prompt for _, _, prompt in pending])
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            answers = [error] * len(pending)
+        for (index, key, _), answer in zip(pending, answers):
+            if isinstance(answer, Exception):
+                results[index] = {"error": str(answer)}
+            else:
+                cache.set(key, answer)
+                results[index] = {"suggestion": answer}
+    return results
 
-    model = genai.GenerativeModel("gemini-pro")
-    response = model.generate_content(prompt)
-    return response.text
+
+def warm_up():
+    """
+    Loads the spellcheck dictionary and the suggestion backend up front, for
+    workers that should not pay for them on their first request
+    """
+    get_spell_engine()
+    backend = get_suggestion_backend()
+    if isinstance(backend, GeminiBackend):
+        _ = backend.model
 
 
 def check_phone_number(phone_number):
@@ -41,18 +86,7 @@ def check_phone_number(phone_number):
 
 def correct_spelling(text: str):
     """Corrects the spelling of a text"""
-
-    spell_checker = SpellChecker()
-    word_pattern = r"\w+|[^\w\s]"
-
-    misspelled = spell_checker.unknown(re.findall(word_pattern, text))
-    corrected_text = text
-
-    for word in misspelled:
-        correction = spell_checker.correction(word)
-        if correction:
-            corrected_text = corrected_text.replace(word, correction)
-
+    corrected_text, _ = check_spelling(text)
     return corrected_text
 
 def load_data(file_path):